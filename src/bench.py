@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+
+"""
+bench.py
+========
+
+Benchmark the stages of the analysis on a synthetic dataset (see
+:doc:`synth`), and record the results in a JSON history, so the
+performance of two versions of the scripts can be compared.
+
+The stages are run with the scripts themselves, one process per call:
+
+* `make_pairs`: :doc:`make_pairs` on each dataset;
+* `join_pairs`: :doc:`join_pairs` on each pair of datasets;
+* `scaled_L2norm`: :doc:`dist_all_pairs` on all the values files;
+* `bootstrap`: :doc:`bootstrap` with ``--replicates`` replicates.
+
+For each stage, the wall-clock time, the peak resident memory (the
+largest among the processes of the stage) and the throughput are
+recorded: rows/s for the rows written (pairs, values) or read (values),
+maps/s for the Hi-C maps and replicates/s for the bootstrap.
+
+The history is a JSON file holding the list of the runs. Each run has an
+`id` (its rank in the history), a `date`, a `label`, the `params` of the
+synthetic dataset and the results by `stages`. With ``--compare``, no
+benchmark is run: two runs of the history are compared (by default, the
+last two), and the relative change of the time and memory of each stage
+is printed.
+
+
+:created: October 2026
+:last modified: October 2026
+
+.. codeauthor::
+   Sylvain PULICANI <pulicani@lirmm.fr>
+"""
+
+import argparse
+import datetime
+import platform
+import tempfile
+import subprocess
+import json
+import time
+import gzip
+import shutil
+import sys
+import os
+
+from itertools import combinations
+from os.path import dirname, abspath, isfile
+
+import synth
+
+
+SCRIPTS = dirname(abspath(__file__))
+"""The directory of the scripts."""
+
+STAGES = ['make_pairs', 'join_pairs', 'scaled_L2norm', 'bootstrap']
+"""The benchmarked stages, in the order they are run."""
+
+
+def run_script(script, *args):
+    """
+    Run the *script* (a file name in :data:`SCRIPTS`) with the *args*, and
+    wait for it. Return a tuple (wall-clock time in seconds, peak resident
+    memory in bytes).
+    """
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, f'{SCRIPTS}/{script}'] +
+                            [str(a) for a in args])
+    _, status, usage = os.wait4(proc.pid, 0)
+    elapsed = time.perf_counter() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, script)
+    peak = usage.ru_maxrss
+    if sys.platform != 'darwin':  # Linux reports kilobytes
+        peak *= 1024
+    return elapsed, peak
+
+
+def count_rows(name):
+    """
+    Return the number of rows of the (gzipped) TSV file *name*.
+    """
+    opener = gzip.open if name.endswith('.gz') else open
+    with opener(name, 'rb') as f:
+        return sum(1 for _ in f)
+
+
+def count_maps(hicdir):
+    """
+    Return the number of maps of the Hi-C directory *hicdir*.
+    """
+    with open(f'{hicdir}/metadata.json', 'r') as f:
+        return len(json.load(f)['MapFiles'])
+
+
+class Stage:
+    """
+    Stage accumulates the measures of the calls making a stage: their
+    time is summed, their peak memory is the largest one, and the *units*
+    (*e.g.* rows or maps) are summed.
+    """
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.peak = 0
+        self.units = {}
+
+
+    def add(self, measure, **units):
+        """
+        Add the *measure* of a call (as returned by :func:`run_script`),
+        which processed the *units*.
+        """
+        self.seconds += measure[0]
+        self.peak = max(self.peak, measure[1])
+        for k, v in units.items():
+            self.units[k] = self.units.get(k, 0) + v
+
+
+    def result(self):
+        """
+        Return the measures of the stage as a dict, with the throughput of
+        each unit.
+        """
+        res = {'seconds': round(self.seconds, 4),
+               'peak_rss_mb': round(self.peak / 1024**2, 1)}
+        for k, v in self.units.items():
+            res[k] = v
+            res[f'{k}_per_s'] = round(v / max(self.seconds, 1e-9), 1)
+        return res
+
+
+def run_stages(config, workdir, replicates=100, stages=STAGES):
+    """
+    Run the benchmarked *stages* on the dataset described by *config* (as
+    returned by :func:`synth.generate`), writing the intermediate files in
+    *workdir*. Return a dict of the stages to their measures.
+    """
+    res = config['resolutions'][0]
+    datasets = config['datasets']
+    orthofile = config['orthologs']
+    pairs = {d: f'{workdir}/{d}_pairs.tsv.gz' for d in datasets}
+    values = [f'{workdir}/{d1}_{d2}_values.tsv.gz'
+              for d1, d2 in combinations(datasets, 2)]
+    results = {}
+
+    if 'make_pairs' in stages:
+        stage = Stage()
+        for d, dataset in datasets.items():
+            hicdir = dataset['hic'][res]
+            stage.add(run_script('make_pairs.py', '-N', dataset['genes'],
+                                 hicdir, pairs[d]),
+                      rows=count_rows(pairs[d]), maps=count_maps(hicdir))
+        results['make_pairs'] = stage.result()
+
+    if 'join_pairs' in stages:
+        stage = Stage()
+        for (d1, d2), outfile in zip(combinations(datasets, 2), values):
+            stage.add(run_script('join_pairs.py', orthofile, pairs[d1],
+                                 pairs[d2], outfile),
+                      rows=count_rows(outfile))
+        results['join_pairs'] = stage.result()
+
+    if 'scaled_L2norm' in stages:
+        stage = Stage()
+        stage.add(run_script('dist_all_pairs.py', '-m', config['method'],
+                             orthofile, f'{workdir}/distances.phylip',
+                             *values),
+                  rows=sum(count_rows(v) for v in values))
+        results['scaled_L2norm'] = stage.result()
+
+    if 'bootstrap' in stages:
+        stage = Stage()
+        # bootstrap.py refuses to write in an existing directory
+        shutil.rmtree(f'{workdir}/bootstrap', ignore_errors=True)
+        stage.add(run_script('bootstrap.py', '-s', '-m', config['method'],
+                             orthofile, f'{workdir}/bootstrap', replicates,
+                             *values),
+                  replicates=replicates)
+        results['bootstrap'] = stage.result()
+
+    return results
+
+
+def read_history(name):
+    """
+    Read the benchmark history *name*. Return a list of runs, empty if
+    the file does not exist.
+    """
+    if not isfile(name):
+        return []
+    with open(name, 'r') as f:
+        return json.load(f)
+
+
+def write_history(name, history):
+    """
+    Write the benchmark *history* (a list of runs) in *name*, atomically.
+    """
+    with open(f'{name}.tmp', 'w') as f:
+        json.dump(history, f, indent=2)
+        f.write('\n')
+    os.replace(f'{name}.tmp', name)
+
+
+def find_run(history, ref):
+    """
+    Find the run *ref* in the *history*: either its id or its label. A
+    negative id counts from the end of the history.
+    """
+    try:
+        return history[int(ref)]
+    except ValueError:
+        pass
+    for run in reversed(history):
+        if run['label'] == ref:
+            return run
+    raise KeyError(f'no run {ref} in the history')
+
+
+def compare(old, new):
+    """
+    Compare the runs *old* and *new*. Return the lines of the report: for
+    each stage, the time and peak memory of both runs and their relative
+    change (negative is better).
+    """
+    lines = [f'{"stage":<14} {"time (s)":>21} {"change":>8} '
+             f'{"peak (MB)":>19} {"change":>8}']
+    for name in STAGES:
+        if name not in old['stages'] or name not in new['stages']:
+            continue
+        a, b = old['stages'][name], new['stages'][name]
+        dt = (b['seconds'] - a['seconds']) / max(a['seconds'], 1e-9)
+        dm = ((b['peak_rss_mb'] - a['peak_rss_mb'])
+              / max(a['peak_rss_mb'], 1e-9))
+        lines.append(f'{name:<14} {a["seconds"]:>10.3f} {b["seconds"]:>10.3f}'
+                     f' {dt:>+8.1%} {a["peak_rss_mb"]:>9.1f} '
+                     f'{b["peak_rss_mb"]:>9.1f} {dm:>+8.1%}')
+    if old['params'] != new['params']:
+        lines.append('warning: the runs were made on different datasets')
+    return lines
+
+
+def cli_parser():
+    desc = ('Benchmark the stages of the analysis on a synthetic dataset, '
+            'and compare the runs.')
+    parser = argparse.ArgumentParser(description=desc)
+    parser.add_argument('history', help='the JSON history of the runs')
+    parser.add_argument('-l', '--label', default='',
+                        help='the label of the run, e.g. a commit')
+    parser.add_argument('-c', '--compare', nargs='*', metavar='RUN',
+                        help=('compare two runs, given by their id or label '
+                              '(default: the last two), instead of running '
+                              'the benchmark'))
+    parser.add_argument('-d', '--data',
+                        help=('an already generated synthetic dataset (see '
+                              'synth.py); if not set, one is generated in a '
+                              'temporary directory'))
+    parser.add_argument('-w', '--workdir',
+                        help=('the directory of the intermediate files; by '
+                              'default, a temporary directory'))
+    parser.add_argument('-s', '--stages', nargs='+', choices=STAGES,
+                        default=STAGES, help='the stages to run (default: all)')
+    parser.add_argument('-r', '--replicates', type=int, default=100,
+                        help='the number of bootstrap replicates (default: 100)')
+    parser.add_argument('-n', '--species', type=int, default=4,
+                        help='the number of species (default: 4)')
+    parser.add_argument('-C', '--chromosomes', type=int, default=4,
+                        help='the number of chromosomes (default: 4)')
+    parser.add_argument('-L', '--bins', type=int, default=2000,
+                        help='the number of bins by chromosome (default: 2000)')
+    parser.add_argument('-g', '--genes', type=int, default=500,
+                        help='the number of genes by chromosome (default: 500)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='the seed of the dataset (default: 0)')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='be verbose')
+    return parser
+
+
+def main():
+    parser = cli_parser()
+    args = parser.parse_args()
+
+    history = read_history(args.history)
+
+    if args.compare is not None:
+        refs = args.compare or ['-2', '-1']
+        if len(refs) != 2:
+            parser.error('--compare takes two runs')
+        try:
+            old, new = (find_run(history, r) for r in refs)
+        except (KeyError, IndexError) as e:
+            print(f'error: {e}')
+            sys.exit(1)
+        print('\n'.join(compare(old, new)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if args.data is not None:
+            with open(f'{args.data}/config.yaml', 'r') as f:
+                config = json.load(f)
+            params = {'data': abspath(args.data)}
+        else:
+            params = {'species': args.species,
+                      'chromosomes': args.chromosomes, 'bins': args.bins,
+                      'genes': args.genes, 'seed': args.seed}
+            if args.verbose:
+                print('Generating the dataset...')
+            config = synth.generate(f'{tmpdir}/data', **params)
+        workdir = args.workdir or f'{tmpdir}/work'
+        os.makedirs(workdir, exist_ok=True)
+        params['replicates'] = args.replicates
+
+        if args.verbose:
+            print('Running the stages...')
+        stages = run_stages(config, workdir, args.replicates, args.stages)
+
+    run = {'id': len(history),
+           'date': datetime.datetime.now().isoformat(timespec='seconds'),
+           'label': args.label, 'python': platform.python_version(),
+           'params': params, 'stages': stages}
+    history.append(run)
+    write_history(args.history, history)
+
+    for name, measures in stages.items():
+        print(f'{name}: ' + ', '.join(f'{k}={v}' for k, v in measures.items()))
+    if args.verbose:
+        print(f'Written run {run["id"]} in {args.history}')
+
+
+if __name__ == '__main__':
+    main()
+    sys.exit(0)
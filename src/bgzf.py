@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+bgzf
+====
+
+This module contains a writer for block-gzipped (BGZF) files, as used by
+`samtools`_ and `tabix`_. A BGZF file is a series of gzip members, each one
+holding at most 64 KiB of data, followed by an empty member marking the end
+of the file. Thus, it is a valid gzip file that can be read by `gzip` or
+the :mod:`gzip` module.
+
+Since the blocks are independent, they can be compressed in parallel:
+the compression is done in a pool of threads (:mod:`zlib` releases the
+GIL while compressing).
+
+For the same reason, a BGZF file can also be read from the
+middle, given a *virtual offset*: the offset of a block in the compressed
+file shifted 16 bits to the left, plus the offset of the data in the
+uncompressed block. This module also contains functions to write and read
+an index of the rows of a TSV file, so a slice of the file can be read
+directly, or the file can be split in balanced chunks for parallel readers.
+The index is described :doc:`in the documentation </formats/index>`.
+
+
+:created: October 2026
+:last modified: October 2026
+
+.. codeauthor::
+   Sylvain PULICANI <pulicani@lirmm.fr>
+
+.. _samtools: https://samtools.github.io/hts-specs/SAMv1.pdf
+.. _tabix: https://www.htslib.org/doc/tabix.html
+"""
+
+import io
+import os
+import csv
+import gzip
+import zlib
+import struct
+import concurrent.futures
+
+from collections import deque
+
+
+BLOCK_SIZE = 65280
+"""The maximum size of the uncompressed data of a block."""
+
+EOF_BLOCK = bytes.fromhex('1f8b08040000000000ff0600424302001b0003000000000000000000')
+"""The empty block marking the end of a BGZF file."""
+
+
+def compress_block(data, compresslevel=6):
+    """
+    Compress the bytes *data* (at most :data:`BLOCK_SIZE` bytes long) as a
+    BGZF block, at *compresslevel*. Return the block as bytes.
+    """
+    c = zlib.compressobj(compresslevel, zlib.DEFLATED, -15)
+    payload = c.compress(data) + c.flush()
+    # The header is 18 bytes long, and the footer 8 bytes long.
+    # The BSIZE field holds the size of the block minus one.
+    header = struct.pack('<BBBBIBBHBBHH', 31, 139, 8, 4, 0, 0, 255, 6,
+                         66, 67, 2, len(payload) + 25)
+    footer = struct.pack('<II', zlib.crc32(data), len(data))
+    return header + payload + footer
+
+
+class BgzfWriter(io.RawIOBase):
+    """
+    BgzfWriter is a binary file object writing a BGZF file named *name*.
+    The blocks are compressed at *compresslevel*, using *threads* threads.
+
+    Use :func:`iolib.open_output` to get a text file object.
+    """
+
+    def __init__(self, name, compresslevel=6, threads=1):
+        super().__init__()
+        self.name = name
+        self.compresslevel = compresslevel
+        self._file = open(name, 'wb')
+        self._buf = bytearray()
+        self._pending = deque()
+        self._nblocks = 0
+        self._offsets = []
+        self._threads = threads
+        self._executor = None
+        if threads > 1:
+            self._executor = concurrent.futures.ThreadPoolExecutor(threads)
+
+
+    def writable(self):
+        return True
+
+
+    def write(self, data):
+        self._buf.extend(data)
+        while len(self._buf) >= BLOCK_SIZE:
+            self._push(bytes(self._buf[:BLOCK_SIZE]))
+            del self._buf[:BLOCK_SIZE]
+        return len(data)
+
+
+    def mark(self):
+        """
+        Return a mark of the current position in the uncompressed data.
+        It can be converted to a virtual offset by :meth:`virtual_offset`
+        once the block holding this position has been written (*e.g.* once
+        the file is closed).
+
+        .. warning:: If this file is wrapped in a text file object, the
+                     latter must be flushed first.
+        """
+        return (self._nblocks, len(self._buf))
+
+
+    def virtual_offset(self, mark):
+        """
+        Convert the *mark* returned by :meth:`mark` to a virtual offset.
+        """
+        block, within = mark
+        return (self._offsets[block] << 16) | within
+
+
+    def _push(self, block):
+        """
+        Compress the *block*, either now or in the pool of threads.
+        """
+        self._nblocks += 1
+        if self._executor is None:
+            self._write_block(compress_block(block, self.compresslevel))
+            return
+
+        self._pending.append(
+            self._executor.submit(compress_block, block, self.compresslevel))
+        # Keep a bounded number of blocks in memory
+        while len(self._pending) > 2 * self._threads:
+            self._write_block(self._pending.popleft().result())
+
+
+    def _write_block(self, block):
+        """
+        Write the compressed *block*, and record its offset.
+        """
+        self._offsets.append(self._file.tell())
+        self._file.write(block)
+
+
+    def _drain(self):
+        """
+        Write all the blocks being compressed.
+        """
+        while self._pending:
+            self._write_block(self._pending.popleft().result())
+
+
+    def close(self):
+        if self.closed:
+            return
+        if self._buf:
+            self._push(bytes(self._buf))
+            self._buf = bytearray()
+        self._drain()
+        if self._executor is not None:
+            self._executor.shutdown()
+        # A mark taken at the very end points to the EOF block
+        self._offsets.append(self._file.tell())
+        self._file.write(EOF_BLOCK)
+        self._file.close()
+        super().close()
+
+
+def write_index(name, chunks):
+    """
+    Write the index *chunks* to the file *name*. Each chunk is a tuple
+    (key, first row, number of rows, virtual offset).
+    """
+    with open(name, 'w') as f:
+        writer = csv.writer(f, delimiter='\t', lineterminator='\n')
+        writer.writerows(chunks)
+
+
+def has_index(name):
+    """
+    Tell whether the file *name* has an index, written after it (*i.e.*
+    not left over from a previous version of the file).
+    """
+    try:
+        return os.stat(f'{name}.idx').st_mtime_ns >= os.stat(name).st_mtime_ns
+    except FileNotFoundError:
+        return False
+
+
+def read_index(name):
+    """
+    Read the index of the BGZF file *name* (*i.e.* the file *name*.idx).
+    Return a list of tuple (key, first row, number of rows, virtual offset).
+    """
+    with open(f'{name}.idx', 'r') as f:
+        return [(key, int(first), int(nrows), int(voffset))
+                for key, first, nrows, voffset in csv.reader(f, delimiter='\t')]
+
+
+def read_rows(name, voffset, nrows):
+    """
+    Read *nrows* rows of the BGZF TSV file *name*, starting at the virtual
+    offset *voffset*. This is a generator of lists of fields, as returned by
+    `csv.reader`.
+    """
+    with open(name, 'rb') as raw:
+        raw.seek(voffset >> 16)
+        with gzip.GzipFile(fileobj=raw) as gz:
+            gz.read(voffset & 0xffff)
+            reader = csv.reader(io.TextIOWrapper(gz, encoding='utf-8'),
+                                delimiter='\t')
+            for _, row in zip(range(nrows), reader):
+                yield row
+
+
+def iter_chunks(name, chunks):
+    """
+    Read the rows of the BGZF TSV file *name* corresponding to the index
+    *chunks* (as returned by :func:`read_index`). This is a generator of
+    lists of fields.
+    """
+    for _, _, nrows, voffset in chunks:
+        yield from read_rows(name, voffset, nrows)
+
+
+def iter_slice(name, key):
+    """
+    Read the rows of the BGZF TSV file *name* indexed with *key* (*e.g.* a
+    pair of chromosomes). This is a generator of lists of fields.
+    """
+    return iter_chunks(name, [c for c in read_index(name) if c[0] == key])
+
+
+def split_index(chunks, n):
+    """
+    Split the index *chunks* in at most *n* lists of consecutive chunks
+    having roughly the same number of rows. Each list can be read with
+    :func:`iter_chunks`, *e.g.* by a different worker.
+    """
+    total = sum(c[2] for c in chunks)
+    res = [[] for _ in range(n)]
+    for c in chunks:
+        # The part in which the middle of the chunk falls
+        i = min(n - 1, int((c[1] + c[2] / 2) * n / total)) if total else 0
+        res[i].append(c)
+    return [r for r in res if r]
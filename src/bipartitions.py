@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+bipartitions
+============
+
+This module contains functions to reroot trees and to compute the support
+of the branches of a species tree from replicate trees (*e.g.* bootstrap
+replicates), without external tools.
+
+Each branch of a tree splits the species in two sets: a bipartition. A
+set of species is encoded as an integer, the bit *i* being set if the
+species *i* (in the order given by :func:`species_index`) is in the set.
+An unrooted bipartition is stored as the side which does not hold the
+outgroup, so a tree rooted on the outgroup has exactly these sets as
+clades: rerooting is a complement of the sets holding the outgroup.
+
+The trees are read from and written to the Newick format.
+
+
+:created: October 2026
+:last modified: October 2026
+
+.. codeauthor::
+   Sylvain PULICANI <pulicani@lirmm.fr>
+"""
+
+import re
+
+from collections import Counter
+
+
+TOKENS = re.compile(r'[(),;]|:[^(),;]*|[^(),:;\s]+')
+"""The tokens of a Newick tree: punctuation, branch lengths and labels."""
+
+TOPOLOGY = re.compile(r'[()]|(?<=[(,])[^(),:;\s]+')
+"""The tokens of the topology of a Newick tree: parentheses and leaves."""
+
+
+def species_index(names):
+    """
+    Map the species *names* to their bit in the sets of species: the
+    species are sorted by name. Return a dict.
+    """
+    return {name: i for i, name in enumerate(sorted(names))}
+
+
+def leaf_names(newick):
+    """
+    Return the list of the names of the leaves of the Newick tree.
+    """
+    res = []
+    prev = None
+    for tok in TOKENS.findall(newick):
+        if prev in (None, '(', ',') and tok not in '(),;' and tok[0] != ':':
+            res.append(tok)
+        prev = tok
+    return res
+
+
+def clades(newick, index):
+    """
+    Read the clades of the Newick tree, as sets of species (see
+    :func:`species_index` for the *index*). Return a dict of the clades
+    (leaves included, root excluded) to their branch lengths (None if the
+    tree has no lengths).
+    """
+    res = {}
+    stack = [0]
+    last = None
+    prev = None
+    for tok in TOKENS.findall(newick):
+        if tok == '(':
+            stack.append(0)
+        elif tok == ')':
+            last = stack.pop()
+            stack[-1] |= last
+            res[last] = None
+        elif tok[0] == ':':
+            res[last] = float(tok[1:])
+        elif tok not in ',;' and prev != ')':
+            last = 1 << index[tok]
+            stack[-1] |= last
+            res[last] = None
+        prev = tok
+    res.pop(stack[0], None)
+    return res
+
+
+def outgroup_bit(index, outgroup=None):
+    """
+    Return the bit of the *outgroup* species in the sets of species; by
+    default, the first species of the *index*.
+    """
+    if outgroup is None:
+        return 1
+    return 1 << index[outgroup]
+
+
+def splits(newick, index, outgroup=None):
+    """
+    Read the bipartitions of the Newick tree, as the sets of species on
+    the side not holding the *outgroup* (see :func:`outgroup_bit`).
+    Return a dict of the bipartitions (trivial ones included) to their
+    branch lengths. The two branches at a root of degree 2 make a single
+    bipartition, whose length is the sum of their lengths.
+    """
+    full = (1 << len(index)) - 1
+    og = outgroup_bit(index, outgroup)
+    res = {}
+    for clade, length in clades(newick, index).items():
+        if clade & og:
+            clade ^= full
+        if clade == 0:
+            continue
+        if clade in res and res[clade] is not None and length is not None:
+            res[clade] += length
+        else:
+            res[clade] = length
+    return res
+
+
+def is_trivial(split, nspecies):
+    """
+    Tell whether the bipartition *split* is trivial, *i.e.* separates a
+    single species from the others.
+    """
+    size = bin(split).count('1')
+    return size <= 1 or size >= nspecies - 1
+
+
+def count_splits(trees, index, outgroup=None):
+    """
+    Count the non-trivial bipartitions of the Newick *trees*, in one pass.
+    Return a tuple (Counter of the bipartitions, number of trees).
+    """
+    full = (1 << len(index)) - 1
+    og = outgroup_bit(index, outgroup)
+    bits = [1 << i for i in range(len(index))]
+    trivial = set(bits) | {full ^ b for b in bits} | {0, full}
+
+    counts = Counter()
+    ntrees = 0
+    for newick in trees:
+        # Only the topology is read, and the internal clades are built
+        # with a stack of sets
+        tree_splits = set()
+        stack = [0]
+        for tok in TOPOLOGY.findall(newick):
+            if tok == '(':
+                stack.append(0)
+            elif tok == ')':
+                clade = stack.pop()
+                stack[-1] |= clade
+                if clade & og:
+                    clade ^= full
+                if clade not in trivial:
+                    tree_splits.add(clade)
+            else:
+                stack[-1] |= 1 << index[tok]
+        counts.update(tree_splits)
+        ntrees += 1
+    return counts, ntrees
+
+
+def _format_length(length):
+    if length is None:
+        return ''
+    return f':{length:.8f}'
+
+
+def reroot(newick, index, outgroup):
+    """
+    Reroot the Newick tree on the branch leading to the *outgroup*, which
+    is split in two halves. Return the rerooted tree, in Newick.
+    """
+    names = sorted(index, key=index.get)
+    full = (1 << len(index)) - 1
+    og = outgroup_bit(index, outgroup)
+    lengths = splits(newick, index, outgroup)
+    # The branch of the outgroup is the only one stored as its complement
+    top = full ^ og
+    half = lengths.pop(top, None)
+    if half is not None:
+        half /= 2
+
+    # The parent of a clade is the smallest clade strictly containing it
+    children = {c: [] for c in lengths}
+    children[top] = []
+    for clade in lengths:
+        parent = min((c for c in children if c != clade and c & clade == clade),
+                     key=lambda c: bin(c).count('1'))
+        children[parent].append(clade)
+
+    def write(clade):
+        if clade & (clade - 1) == 0:
+            return names[clade.bit_length() - 1]
+        subs = sorted(children[clade], key=lambda c: c & -c)
+        return '(' + ','.join(write(c) + _format_length(lengths[c])
+                              for c in subs) + ')'
+
+    return (f'({outgroup}{_format_length(half)},'
+            f'{write(top)}{_format_length(half)});')
+
+
+def annotate_support(newick, counts, ntrees, index, outgroup=None):
+    """
+    Annotate the internal branches of the Newick tree (*e.g.* the species
+    tree) with their support, in percent: the frequency of their
+    bipartition in *counts* (as returned by :func:`count_splits`, with
+    the same *index* and *outgroup*) among the *ntrees* trees. The
+    existing labels of the internal nodes are replaced.
+    Return the annotated tree, in Newick.
+    """
+    full = (1 << len(index)) - 1
+    og = outgroup_bit(index, outgroup)
+    res = []
+    stack = [0]
+    prev = None
+    for tok in TOKENS.findall(newick):
+        if tok == '(':
+            stack.append(0)
+        elif tok == ')':
+            clade = stack.pop()
+            stack[-1] |= clade
+            split = clade ^ full if clade & og else clade
+            res.append(tok)
+            if clade != full and not is_trivial(split, len(index)):
+                res.append(str(round(100 * counts[split] / max(ntrees, 1))))
+            prev = tok
+            continue
+        elif tok[0] != ':' and tok not in ',;':
+            if prev == ')':
+                # An old label of an internal node
+                continue
+            stack[-1] |= 1 << index[tok]
+        res.append(tok)
+        prev = tok
+    return ''.join(res)
@@ -17,13 +17,23 @@ the distance:
 * `atLeastTwo`: keep the values present in at least two species.
 * `union`: keep all values.
 
+With the ``--trees`` option, the trees of the replicates are built
+directly from the distance matrices (see :mod:`trees`), in parallel, and
+written in the Newick format instead of the matrices. With the
+``--stack`` option, the matrices are written in a single binary file,
+`all_replicates.dstack` (see :mod:`dstack`), much faster to write and to
+read than PHYLIP files.
+
+With ``--jobs`` greater than 1, each indexed values file (see
+:doc:`/formats/index`) is split in balanced parts, read in parallel.
+
 .. note::
    It is intended to be used *instead of* :doc:`/scripts/dist_all_pairs`
    and :doc:`/scripts/dist_pairs_indep`.
 
 
 :created: May 2018
-:last modified: August 2019
+:last modified: October 2026
 
 .. codeauthor::
    Sylvain PULICANI <pulicani@lirmm.fr>
@@ -35,11 +45,17 @@ import sys
 import os
 import re
 
+from concurrent.futures import ProcessPoolExecutor
+
 from toolz import merge_with
 from toolz.curried import merge
 
-from distlib import scaled_L2norm, filter_values
-from iolib import read_orthos, read_values, phylip
+import metrics
+from metrics import stage, count
+from distlib import scaled_L2norm, filter_values, distance_matrix
+from iolib import read_orthos, read_values, phylip, init_values_worker
+from trees import build_trees
+from dstack import StackWriter
 
 
 def cli_parser():
@@ -52,8 +68,22 @@ def cli_parser():
     parser.add_argument('values', nargs='+',
                         help='the values files, in (Gzipped) TSV')
     parser.add_argument('-o', '--one-file', action='store_true',
-                        help='put all matrices in one file called\
-                        all_replicates.phylip')
+                        help='put all matrices (or trees) in one file called\
+                        all_replicates.phylip (or .nwk); implied by --stack')
+    output = parser.add_mutually_exclusive_group()
+    output.add_argument('-t', '--trees', action='store_true',
+                        help=('write the trees of the replicates (in Newick) '
+                              'instead of the matrices'))
+    output.add_argument('-s', '--stack', action='store_true',
+                        help=('write all matrices in one binary file called '
+                              'all_replicates.dstack'))
+    parser.add_argument('-N', '--no-nni', action='store_true',
+                        help=('build the trees by neighbor joining only, '
+                              'without the balanced minimum evolution '
+                              'refinement'))
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help=('the number of processes reading the values '
+                              'files and building the trees'))
     parser.add_argument('-m', '--mode', default='intersection',
                         choices=['intersection', 'atLeastTwo', 'union'],
                         help=('the mode, that is, the kind of values we want'
@@ -62,12 +92,14 @@ def cli_parser():
                         help='print a progress bar; need tqdm to be installed')
     parser.add_argument('-v', '--verbose', action='store_true',
                         help='be verbose')
+    metrics.add_arguments(parser)
     return parser
 
 
 def main():
     parser = cli_parser()
     args = parser.parse_args()
+    metrics.start(args)
 
     if args.progress:
         try:
@@ -85,7 +117,8 @@ def main():
         print('error: {} already exists.'.format(args.outdir))
         sys.exit(1)
 
-    orthos, groups = read_orthos(args.orthos)
+    with stage('read_orthologs'):
+        orthos, groups = read_orthos(args.orthos)
     if args.verbose:
         print('Read orthologs.')
     species = set()
@@ -95,6 +128,10 @@ def main():
     if args.progress:
         print('Reading values files...')
         pbar = tqdm(total=len(args.values))
+    executor = None
+    if args.jobs > 1:
+        executor = ProcessPoolExecutor(args.jobs, initializer=init_values_worker,
+                                       initargs=(orthos, groups))
     for filename in args.values:
         m = name_pattern.match(filename)
         if m is None:
@@ -103,31 +140,58 @@ def main():
         sp_left, sp_right = m.group(1), m.group(2)
         species.add(sp_left)
         species.add(sp_right)
-        this_values = read_values(orthos, groups, sp_left, sp_right, filename)
-        values = merge_with(merge, values, this_values)
+        with stage('read_values'):
+            this_values = read_values(orthos, groups, sp_left, sp_right,
+                                      filename, executor, args.jobs)
+            values = merge_with(merge, values, this_values)
+        count('values_files')
+        count('values_read', len(this_values))
         if args.verbose:
             print(f'Read {filename}')
         elif args.progress:
             pbar.update(1)
+    if executor is not None:
+        executor.shutdown()
 
     # At this point, we don't need the group number anymore
-    values = filter_values(args.mode, species, values.values())
+    values = list(filter_values(args.mode, species, values.values()))
+    count('values_kept', len(values))
+    species = sorted(species)
 
     if args.progress:
         print('Computing replicates...')
         pbar = tqdm(total=args.n)
 
-    if args.one_file:
-        f = open(args.outdir + '/all_replicates.phylip', 'w')
+    ext = 'nwk' if args.trees else 'phylip'
+    # The stack is already a single file
+    one_file = args.one_file and not args.stack
+    if one_file:
+        f = open(f'{args.outdir}/all_replicates.{ext}', 'w')
 
+    if args.stack:
+        stack = StackWriter(f'{args.outdir}/all_replicates.dstack', species)
+
+    matrices = []
     for i in range(args.n):
         if args.verbose:
             print(f'Replicate {i}')
-        current_choices = random.choices(values, k=len(values))
-        distances = scaled_L2norm(species, current_choices)
+        with stage('resample'):
+            current_choices = random.choices(values, k=len(values))
+        with stage('scaled_L2norm'):
+            distances = scaled_L2norm(species, current_choices)
+        count('replicates')
+        if args.trees or args.stack:
+            matrix = distance_matrix(species, distances)
+            if args.trees:
+                matrices.append(matrix)
+            else:
+                stack.append(matrix)
+            if args.progress:
+                pbar.update(1)
+            continue
         matrix = phylip(species, distances)
 
-        if args.one_file:
+        if one_file:
             f.write(matrix)
             f.write('\n')
         else:
@@ -141,12 +205,36 @@ def main():
         if args.progress:
             pbar.update(1)
 
-    if args.one_file:
+    if args.trees:
+        if args.verbose:
+            print('Building the trees...')
+        with stage('build_trees'):
+            newicks = build_trees(matrices, species, not args.no_nni,
+                                  args.jobs)
+        for i, newick in enumerate(newicks):
+            if one_file:
+                f.write(newick)
+                f.write('\n')
+                continue
+            filename = f'{args.outdir}/replicate_{i}.nwk'
+            with open(filename, 'w') as out:
+                out.write(newick)
+                out.write('\n')
+            if args.verbose:
+                print(f'  Written {filename}')
+
+    if args.stack:
+        stack.close()
+        if args.verbose:
+            print(f'  Written {stack.name}')
+    if one_file:
         f.close()
     if args.progress:
         pbar.close()
         print()  # To have a pretty line in the console
 
+    metrics.finish(args)
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+"""
+build_trees.py
+==============
+
+Build the trees from PHYLIP distance matrices, by neighbor joining refined
+by balanced minimum evolution nearest neighbor interchanges (see
+:mod:`trees`). This replaces the call to `fastme` made by
+`scripts/posttreatment.sh`, without spawning a process by matrix.
+
+For each PHYLIP file, the trees are written in a Newick file with the same
+name and the extension `.nwk`, one tree per line, in the order of the
+matrices. The trees of all the matrices are built in parallel. The
+distance stack files (with the extension `.dstack`, see :mod:`dstack`)
+are read as well.
+
+.. note::
+   :doc:`/scripts/bootstrap` can build the trees directly, without writing
+   the distance matrices (see its ``--trees`` option).
+
+
+:created: October 2026
+:last modified: October 2026
+
+.. codeauthor::
+   Sylvain PULICANI <pulicani@lirmm.fr>
+"""
+
+import argparse
+import sys
+import os
+
+from os.path import splitext, basename
+
+import numpy as np
+
+from iolib import read_phylip
+from dstack import read_stack
+from trees import build_trees
+
+
+def cli_parser():
+    desc = 'Build the trees from PHYLIP distance matrices.'
+    parser = argparse.ArgumentParser(description=desc)
+    parser.add_argument('phylip', nargs='+',
+                        help=('the PHYLIP files, holding one or more '
+                              'matrices, or distance stack files'))
+    parser.add_argument('-o', '--outdir',
+                        help=('the directory in which put the trees; by '
+                              'default, next to the PHYLIP files'))
+    parser.add_argument('-N', '--no-nni', action='store_true',
+                        help=('only use neighbor joining, without the '
+                              'balanced minimum evolution refinement'))
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='the number of processes building the trees')
+    parser.add_argument('-f', '--force', action='store_true',
+                        help='overwrite the already existing Newick files')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='be verbose')
+    return parser
+
+
+def main():
+    parser = cli_parser()
+    args = parser.parse_args()
+
+    if args.outdir is not None:
+        os.makedirs(args.outdir, exist_ok=True)
+
+    for filename in args.phylip:
+        outname = f'{splitext(filename)[0]}.nwk'
+        if args.outdir is not None:
+            outname = f'{args.outdir}/{basename(outname)}'
+        if os.path.isfile(outname) and not args.force:
+            print(f'Skipping {filename} because {outname} already exists.')
+            continue
+
+        if filename.endswith('.dstack'):
+            species, dists = read_stack(filename, mmap=False)
+        else:
+            matrices = list(read_phylip(filename))
+            # All the matrices of a file are on the same species, but not
+            # always in the same order
+            species = matrices[0][0]
+            dists = []
+            for names, dist in matrices:
+                pos = [names.index(sp) for sp in species]
+                dists.append(dist[np.ix_(pos, pos)])
+        newicks = build_trees(dists, species, not args.no_nni, args.jobs)
+
+        with open(outname, 'w') as f:
+            for newick in newicks:
+                f.write(newick)
+                f.write('\n')
+        if args.verbose:
+            print(f'Written {len(newicks)} trees in {outname}')
+
+
+if __name__ == '__main__':
+    main()
+    sys.exit(0)
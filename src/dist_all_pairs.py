@@ -14,13 +14,48 @@ the distance:
 * `atLeastTwo`: keep the values present in at least two species.
 * `union`: keep all values.
 
+Several modes can be given at once (``-m intersection,union``, or ``-m
+all``): the values files are read and merged once, in a matrix of the
+values of the traits by species, and the distance matrix of each mode is
+computed from its selection of rows. One PHYLIP file is written per mode:
+`{mode}` in the output name is replaced by the mode; otherwise, the mode
+is added to the stem of the output name (*e.g.* `distances_union.phylip`).
+
+For quick approximate results, the ``--sample-fraction`` and
+``--sample-size`` options only use a sample of the pairs of genes (see
+:mod:`sampling`). With ``--sample-size``, the pairs with the smallest
+hashes are used. Using the same seed (``--sample-seed``), the pairs are
+sampled as in :doc:`/scripts/make_pairs`, stratified in the same way with
+the same ``--strata-genes`` (see :mod:`sampling`).
+
+With ``--jobs`` greater than 1, each indexed values file (see
+:doc:`/formats/index`) is split in balanced parts, read in parallel.
+
+In `union` mode, the distance between two species only depends on the
+sum of the squared terms of the L2-norm over their shared values, and on
+their number. With the ``--stats`` option, these sufficient statistics are
+read from the sidecar of each values file written by ``join_pairs --stats``
+(see :doc:`/formats/stats_sidecar`), so the matrix is computed in
+milliseconds. Thus, adding a species only costs joining the values files
+of its pairs.
+
+.. warning::
+   With the sidecars, the distance between two species is computed on
+   the values of *their* values file only. This is the same as without
+   them only when the values files were all joined with the same options,
+   the `all` adjacencies status and without ``--exclude`` (see
+   :doc:`/scripts/join_pairs`): otherwise, the values of a pair of genes
+   can be kept in some values files but not in others. Thus, when the
+   sidecars do not record these options, or when one of them is missing
+   or out of date, the values files are read instead.
+
 .. note::
    It is intended to be used *instead of* :doc:`/scripts/dist_pairs_indep`
    and :doc:`/scripts/bootstrap`.
 
 
 :created: August 2019
-:last modified: August 2019
+:last modified: October 2026
 
 .. codeauthor::
    Sylvain PULICANI <pulicani@lirmm.fr>
@@ -30,11 +65,85 @@ import argparse
 import sys
 import re
 
+from os.path import splitext
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
 from toolz import merge_with
 from toolz.curried import merge
 
-from distlib import scaled_L2norm, filter_values
-from iolib import read_orthos, read_values, phylip
+import metrics
+from metrics import stage, count
+from distlib import (MODES, trait_matrix, mode_mask, scaled_L2norm_matrix,
+                     scaled_L2norm_statistics)
+from iolib import read_orthos, read_values, phylip, init_values_worker, read_stats
+import sampling
+from sampling import sample_keys
+
+
+def sidecar_statistics(orthofile, files, verbose=False):
+    """
+    Read the sufficient statistics of the values *files* (a list of tuples
+    (file name, left species, right species)), joined with the orthologs
+    file *orthofile*, from their sidecars.
+    Return a dict of the sorted pairs of species to their (sum, count),
+    as expected by :func:`distlib.scaled_L2norm_statistics`, or None if
+    the distances cannot be computed from the sidecars: a sidecar is
+    missing or out of date, or the files were not all joined with the same
+    options, with all the adjacencies and without excluding values.
+    """
+    statistics = {}
+    join = None
+    for filename, sp_left, sp_right in files:
+        stats = read_stats(filename, orthofile)
+        if stats is None:
+            if verbose:
+                print(f'No up-to-date sidecar for {filename}')
+            return None
+        if join is None:
+            join = stats['Join']
+        if stats['Join'] != join or join['Adjacencies'] != 'all' or\
+           join['Exclude']:
+            if verbose:
+                print(f'{filename} was not joined with the same options, '
+                      'with all the adjacencies and without exclusion')
+            return None
+        count('sidecars_read')
+        key = tuple(sorted((sp_left, sp_right)))
+        total, size = statistics.get(key, (0.0, 0))
+        statistics[key] = (total + stats['Sum'], size + stats['Count'])
+    return statistics
+
+
+def parse_modes(modes):
+    """
+    Parse the comma-separated list of *modes*, or `all` for all of them.
+    Return a list of modes.
+    """
+    if modes == 'all':
+        return list(MODES)
+    res = []
+    for mode in modes.split(','):
+        if mode not in MODES:
+            raise argparse.ArgumentTypeError(f'invalid mode: {mode}')
+        if mode not in res:
+            res.append(mode)
+    return res
+
+
+def mode_outfile(outfile, mode, several):
+    """
+    Return the name of the matrix of the *mode*: *outfile*, with `{mode}`
+    replaced by the mode. Without `{mode}` in *outfile*, the mode is added
+    to its stem if the matrices of *several* modes are written.
+    """
+    if '{mode}' in outfile:
+        return outfile.replace('{mode}', mode)
+    if several:
+        stem, ext = splitext(outfile)
+        return f'{stem}_{mode}{ext}'
+    return outfile
 
 
 def cli_parser():
@@ -42,23 +151,49 @@ def cli_parser():
     parser = argparse.ArgumentParser(description=desc)
     parser.add_argument('orthos', help='all the orthos, in TSV')
     parser.add_argument('outfile',
-                        help='the matrix filename')
+                        help=('the matrix filename; with several modes, '
+                              '{mode} is replaced by the mode, or the mode is '
+                              'added to its stem'))
     parser.add_argument('values', nargs='+',
                         help='the values files, in (Gzipped) TSV')
-    parser.add_argument('-m', '--mode', default='intersection',
-                        choices=['intersection', 'atLeastTwo', 'union'],
+    parser.add_argument('-m', '--mode', default=['intersection'],
+                        type=parse_modes,
                         help=('the mode, that is, the kind of values we want'
-                              ' to keep while computing the distance'))
+                              ' to keep while computing the distance: '
+                              'intersection, atLeastTwo or union; several '
+                              'modes can be given, separated by commas, or '
+                              'all'))
+    sample = parser.add_mutually_exclusive_group()
+    sample.add_argument('--sample-fraction', type=float,
+                        help='only use this fraction of the pairs of genes')
+    sample.add_argument('--sample-size', type=int,
+                        help='only use this number of pairs of genes')
+    parser.add_argument('--sample-seed', type=int, default=0,
+                        help='the seed used to sample the pairs (default: 0)')
+    sampling.add_arguments(parser)
+    parser.add_argument('-s', '--stats', action='store_true',
+                        help=('in union mode, compute the distances from the '
+                              'sufficient statistics sidecars of the values '
+                              'files written by join_pairs --stats; if they '
+                              'cannot be used, the values files are read'))
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help=('the number of processes reading each values '
+                              'file (default: 1)'))
     parser.add_argument('-p', '--progress', action='store_true',
                         help='print a progress bar; need tqdm to be installed')
     parser.add_argument('-v', '--verbose', action='store_true',
                         help='be verbose')
+    metrics.add_arguments(parser)
     return parser
 
 
 def main():
     parser = cli_parser()
     args = parser.parse_args()
+    sampled = sampling.check_arguments(parser, args)
+    if args.stats and (args.mode != ['union'] or sampled):
+        parser.error('--stats only works in union mode, without sampling')
+    metrics.start(args)
 
     if args.progress:
         try:
@@ -68,16 +203,46 @@ def main():
             print('error: -p/--progress needs tqdm to be installed.')
             sys.exit(1)
 
-    orthos, groups = read_orthos(args.orthos)
+    name_pattern = re.compile(r'(?:\S+/)*(\w+)_(\w+)_values.tsv.gz', re.IGNORECASE)
+    if args.stats:
+        files = []
+        for filename in args.values:
+            m = name_pattern.match(filename)
+            if m is None:
+                print('Ignored {}'.format(filename))
+                continue
+            files.append((filename, m.group(1), m.group(2)))
+        species = {sp for _, sp_left, sp_right in files
+                   for sp in (sp_left, sp_right)}
+        statistics = sidecar_statistics(args.orthos, files, args.verbose)
+        if statistics is not None:
+            with stage('scaled_L2norm'):
+                distances = scaled_L2norm_statistics(species, statistics)
+            with open(args.outfile, 'w') as f:
+                f.write(phylip(species, distances))
+                f.write('\n')
+            metrics.finish(args)
+            return
+        print('Cannot use the sidecars: reading the values files.')
+        count('sidecars_rejected')
+
+    with stage('read_orthologs'):
+        orthos, groups = read_orthos(args.orthos)
     if args.verbose:
         print('Read orthologs.')
+    if sampled:
+        strata, fraction = sampling.from_arguments(parser, args, groups)
+        size = args.sample_size if strata is None else None
     species = set()
     values = dict()
 
-    name_pattern = re.compile(r'(?:\S+/)*(\w+)_(\w+)_values.tsv.gz', re.IGNORECASE)
     if args.progress:
         print('Reading values files...')
         pbar = tqdm(total=len(args.values))
+    executor = None
+    if args.jobs > 1:
+        executor = ProcessPoolExecutor(args.jobs, initializer=init_values_worker,
+                                       initargs=(orthos, groups))
     for filename in args.values:
         m = name_pattern.match(filename)
         if m is None:
@@ -86,15 +251,24 @@ def main():
         sp_left, sp_right = m.group(1), m.group(2)
         species.add(sp_left)
         species.add(sp_right)
-        this_values = read_values(orthos, groups, sp_left, sp_right, filename)
-        values = merge_with(merge, values, this_values)
+        with stage('read_values'):
+            this_values = read_values(orthos, groups, sp_left, sp_right,
+                                      filename, executor, args.jobs)
+            values = merge_with(merge, values, this_values)
+        count('values_files')
+        count('values_read', len(this_values))
         if args.verbose:
             print(f'Read {filename}')
         elif args.progress:
             pbar.update(1)
+    if executor is not None:
+        executor.shutdown()
 
-    # At this point, we don't need the group number anymore
-    values = filter_values(args.mode, species, values.values())
+    # The values are merged once, for all the modes
+    keys = list(values)
+    columns = list(species)
+    with stage('trait_matrix'):
+        traits = trait_matrix(columns, [values[k] for k in keys])
 
     if args.progress:
         pbar.close()
@@ -102,11 +276,26 @@ def main():
     elif args.verbose:
         print('Computing the distances...')
 
-    distances = scaled_L2norm(species, values)
-    matrix = phylip(species, distances)
-    with open(args.outfile, 'w') as f:
-        f.write(matrix)
-        f.write('\n')
+    for mode in args.mode:
+        mask = mode_mask(mode, traits)
+        if sampled:
+            kept = set(sample_keys([k for k, m in zip(keys, mask) if m],
+                                   fraction, size, args.sample_seed, strata))
+            mask = np.array([k in kept for k in keys], dtype=bool)
+            if args.verbose:
+                print(f'Sampled {len(kept)} pairs in {mode} mode.')
+        count(f'values_kept_{mode}', int(np.count_nonzero(mask)))
+
+        with stage('scaled_L2norm'):
+            distances = scaled_L2norm_matrix(columns, traits, mask)
+        outfile = mode_outfile(args.outfile, mode, len(args.mode) > 1)
+        with open(outfile, 'w') as f:
+            f.write(phylip(species, distances))
+            f.write('\n')
+        if args.verbose:
+            print(f'Written {outfile}')
+
+    metrics.finish(args)
 
 
 if __name__ == '__main__':
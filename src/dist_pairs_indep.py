@@ -9,13 +9,27 @@ Due to the fact that we want one matrix per pair of genes, this
 script runs in intersection mode (*i.e.* only the pairs present
 in all species are used).
 
+With the ``--stack`` option, all the matrices are written in a single
+binary file (see :mod:`dstack`) instead of PHYLIP files; *outdir* is then
+this file name.
+
+For quick approximate results, the ``--sample-fraction`` and
+``--sample-size`` options only use a sample of the pairs of genes (see
+:mod:`sampling`). With ``--sample-size``, the pairs with the smallest
+hashes are used. Using the same seed (``--sample-seed``), the pairs are
+sampled as in :doc:`/scripts/make_pairs`, stratified in the same way with
+the same ``--strata-genes`` (see :mod:`sampling`).
+
+With ``--jobs`` greater than 1, each indexed values file (see
+:doc:`/formats/index`) is split in balanced parts, read in parallel.
+
 .. note::
    It is intended to be run *instead of* :doc:`/scripts/dist_all_pairs`
    and :doc:`/scripts/bootstrap`.
 
 
 :created: June 2018
-:last modified: August 2019
+:last modified: October 2026
 
 .. codeauthor::
    Sylvain PULICANI <pulicani@lirmm.fr>
@@ -27,11 +41,18 @@ import sys
 import os
 import re
 
+from concurrent.futures import ProcessPoolExecutor
+
 from toolz import merge_with
 from toolz.curried import merge
 
-from distlib import scaled_L2norm, filter_values
-from iolib import read_orthos, read_values, phylip
+import metrics
+from metrics import stage, count
+from distlib import scaled_L2norm, filter_values, keep_value, distance_matrix
+from iolib import read_orthos, read_values, phylip, init_values_worker
+from dstack import StackWriter
+import sampling
+from sampling import sample_keys
 
 
 def cli_parser():
@@ -45,16 +66,33 @@ def cli_parser():
     parser.add_argument('-o', '--one-file', action='store_true',
                         help='put all matrices in one file; outdir is this\
                         file name')
+    parser.add_argument('-s', '--stack', action='store_true',
+                        help=('put all matrices in one binary file; outdir '
+                              'is this file name'))
+    sample = parser.add_mutually_exclusive_group()
+    sample.add_argument('--sample-fraction', type=float,
+                        help='only use this fraction of the pairs of genes')
+    sample.add_argument('--sample-size', type=int,
+                        help='only use this number of pairs of genes')
+    parser.add_argument('--sample-seed', type=int, default=0,
+                        help='the seed used to sample the pairs (default: 0)')
+    sampling.add_arguments(parser)
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help=('the number of processes reading each values '
+                              'file (default: 1)'))
     parser.add_argument('-p', '--progress', action='store_true',
                         help='print a progress bar; need tqdm to be installed')
     parser.add_argument('-v', '--verbose', action='store_true',
                         help='be verbose')
+    metrics.add_arguments(parser)
     return parser
 
 
 def main():
     parser = cli_parser()
     args = parser.parse_args()
+    sampled = sampling.check_arguments(parser, args)
+    metrics.start(args)
 
     if args.progress:
         try:
@@ -64,7 +102,7 @@ def main():
             print('error: -p/--progress needs tqdm to be installed.')
             sys.exit(1)
 
-    if not args.one_file:
+    if not args.one_file and not args.stack:
         try:
             os.mkdir(args.outdir)
             if args.verbose:
@@ -73,9 +111,13 @@ def main():
             print('error: {} already exists.'.format(args.outdir))
             sys.exit(1)
 
-    orthos, groups = read_orthos(args.orthos)
+    with stage('read_orthologs'):
+        orthos, groups = read_orthos(args.orthos)
     if args.verbose:
         print('Read orthologs.')
+    if sampled:
+        strata, fraction = sampling.from_arguments(parser, args, groups)
+        size = args.sample_size if strata is None else None
     species = set()
     values = dict()
 
@@ -83,6 +125,10 @@ def main():
     if args.progress:
         print('Reading values files...')
         pbar = tqdm(total=len(args.values))
+    executor = None
+    if args.jobs > 1:
+        executor = ProcessPoolExecutor(args.jobs, initializer=init_values_worker,
+                                       initargs=(orthos, groups))
     for filename in args.values:
         m = name_pattern.match(filename)
         if m is None:
@@ -91,15 +137,31 @@ def main():
         sp_left, sp_right = m.group(1), m.group(2)
         species.add(sp_left)
         species.add(sp_right)
-        this_values = read_values(orthos, groups, sp_left, sp_right, filename)
-        values = merge_with(merge, values, this_values)
+        with stage('read_values'):
+            this_values = read_values(orthos, groups, sp_left, sp_right,
+                                      filename, executor, args.jobs)
+            values = merge_with(merge, values, this_values)
+        count('values_files')
+        count('values_read', len(this_values))
         if args.verbose:
             print(f'Read {filename}')
         elif args.progress:
             pbar.update(1)
+    if executor is not None:
+        executor.shutdown()
+
+    if sampled:
+        keys = [k for k, v in values.items()
+                if keep_value('intersection', species, v)]
+        keys = sample_keys(keys, fraction, size, args.sample_seed, strata)
+        values = {k: values[k] for k in keys}
+        if args.verbose:
+            print(f'Sampled {len(values)} pairs.')
 
     # At this point, we don't need the group number anymore
-    filter_values('intersection', species, values.values())
+    values = list(filter_values('intersection', species, values.values()))
+    count('values_kept', len(values))
+    species = sorted(species)
 
     if args.progress:
         pbar.close()
@@ -108,11 +170,20 @@ def main():
     elif args.verbose:
         print('Computing the distances...')
 
-    if args.one_file:
+    if args.stack:
+        stack = StackWriter(args.outdir, species)
+    elif args.one_file:
         f = open(args.outdir, 'w')
 
     for i, v in enumerate(values):
-        distances = scaled_L2norm(species, [v])
+        with stage('scaled_L2norm'):
+            distances = scaled_L2norm(species, [v])
+        count('matrices')
+        if args.stack:
+            stack.append(distance_matrix(species, distances))
+            if args.progress:
+                pbar.update(1)
+            continue
         matrix = phylip(species, distances)
 
         if args.one_file:
@@ -129,12 +200,16 @@ def main():
         if args.progress:
             pbar.update(1)
 
-    if args.one_file:
+    if args.stack:
+        stack.close()
+    elif args.one_file:
         f.close()
     if args.progress:
         pbar.close()
         print()  # To have a pretty line in the console
 
+    metrics.finish(args)
+
 
 if __name__ == '__main__':
     main()
@@ -8,7 +8,7 @@ distlib
 This module contains functions that compute distances and helpers.
 
 :created: August 2019
-:last modified: August 2019
+:last modified: October 2026
 
 .. codeauthor::
    Sylvain PULICANI <pulicani@lirmm.fr>
@@ -18,6 +18,12 @@ from collections import defaultdict
 from itertools import combinations
 from math import isnan, sqrt
 
+import numpy as np
+
+
+MODES = ['intersection', 'atLeastTwo', 'union']
+"""The constraints on the values kept (see :func:`filter_values`)."""
+
 
 def scaled_L2norm(species, values):
     """
@@ -53,6 +59,188 @@ def scaled_L2norm(species, values):
     return distances
 
 
+def trait_matrix(species, values):
+    """
+    Build the matrix of the *values* (dicts of species to Hi-C value): one
+    row per value, and one column per species, in the order of the
+    sequence *species*. The missing values are Not-a-Number.
+    Return an array of shape (values, species).
+
+    .. warning::
+       As Not-a-Number stands for a missing value, a value which is
+       Not-a-Number raises a ValueError exception, as in
+       :func:`scaled_L2norm`.
+    """
+    index = {sp: i for i, sp in enumerate(species)}
+    traits = np.full((len(values), len(species)), float('nan'))
+    for row, v in zip(traits, values):
+        for sp, x in v.items():
+            if isnan(x):
+                raise ValueError(f"There shouldn't be any NaN - sp: {sp}")
+            row[index[sp]] = x
+    return traits
+
+
+def mode_mask(constraint, traits):
+    """
+    Select the rows of the *traits* matrix (see :func:`trait_matrix`) kept
+    with the wanted *constraint*, as :func:`filter_values` does. Return an
+    array of booleans.
+
+    .. warning::
+       If *constraint* is not one of :data:`MODES`, then a ValueError
+       exception is raised.
+    """
+    present = np.count_nonzero(~np.isnan(traits), axis=1)
+    if constraint == 'intersection':
+        return present == traits.shape[1]
+    elif constraint == 'atLeastTwo':
+        return present != 1
+    elif constraint == 'union':
+        return np.ones(len(traits), dtype=bool)
+    raise ValueError("constraint must be one of 'intersection', 'atLeastTwo' or 'union'.")
+
+
+def scaled_L2norm_matrix(species, traits, mask=None):
+    """
+    Compute the distances as :func:`scaled_L2norm` does, from the *traits*
+    matrix on the *species* (see :func:`trait_matrix`), whose rows are
+    selected by the boolean array *mask* (all the rows if None). Each pair
+    of species is computed on the whole columns at once.
+    """
+    if mask is not None:
+        traits = traits[mask]
+    distances = defaultdict(dict)
+    for (i, sp1), (j, sp2) in combinations(enumerate(species), 2):
+        both = ~(np.isnan(traits[:, i]) | np.isnan(traits[:, j]))
+        a, b = traits[both, i], traits[both, j]
+        ma = np.maximum(a, b)
+        nonzero = ma != 0.0
+        terms = (1.0 - np.minimum(a, b)[nonzero] / ma[nonzero])**2
+        if len(a) == 0:
+            distances[sp1][sp2] = 1.0
+        else:
+            distances[sp1][sp2] = sqrt(terms.sum()) / sqrt(len(a))
+    return distances
+
+
+def partial_statistics(traits, labels, nlabels, mask=None):
+    """
+    Compute the sufficient statistics of the distances (see
+    :func:`pair_statistics`) of all the pairs of species, separately for
+    each label of the rows of the *traits* matrix (see
+    :func:`trait_matrix`). *labels* is an array of integers in
+    [0, *nlabels*), one per row; the rows are selected by the boolean
+    array *mask* (all the rows if None).
+    Return a tuple of arrays (sums, counts), both of shape (*nlabels*,
+    species, species), symmetric for each label.
+    """
+    if mask is not None:
+        traits, labels = traits[mask], labels[mask]
+    n = traits.shape[1]
+    sums = np.zeros((nlabels, n, n))
+    counts = np.zeros((nlabels, n, n))
+    for i, j in combinations(range(n), 2):
+        both = ~(np.isnan(traits[:, i]) | np.isnan(traits[:, j]))
+        a, b = traits[both, i], traits[both, j]
+        ma = np.maximum(a, b)
+        nonzero = ma != 0.0
+        terms = np.zeros(len(a))
+        terms[nonzero] = (1.0 - np.minimum(a, b)[nonzero] / ma[nonzero])**2
+        sums[:, i, j] = sums[:, j, i] = np.bincount(labels[both], terms,
+                                                    nlabels)
+        counts[:, i, j] = counts[:, j, i] = np.bincount(labels[both],
+                                                        minlength=nlabels)
+    return sums, counts
+
+
+def statistics_matrix(sums, counts):
+    """
+    Compute the distance matrices from the sufficient statistics *sums*
+    and *counts* (arrays of shape (..., species, species), see
+    :func:`partial_statistics`), as :func:`scaled_L2norm` does: the pairs
+    without values are at the distance 1.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # A sum made by subtractions can be slightly negative
+        res = np.where(counts > 0,
+                       np.sqrt(np.maximum(sums, 0.0)) / np.sqrt(counts), 1.0)
+    n = res.shape[-1]
+    res[..., np.arange(n), np.arange(n)] = 0.0
+    return res
+
+
+def pair_statistics(sp1, sp2, values):
+    """
+    Compute the sufficient statistics of the distance between the species
+    *sp1* and *sp2* in `union` mode, from the *values* (dicts of species
+    to Hi-C value) holding both species: the sum of the squared terms of
+    the L2-norm and their number. Return a tuple (sum, count).
+    """
+    total, size = 0.0, 0
+    for v in values:
+        if sp1 not in v or sp2 not in v:
+            continue
+        if isnan(v[sp1]) or isnan(v[sp2]):
+            raise ValueError(f"There shouldn't be any NaN - sp1: {sp1}, sp2: {sp2}")
+        ma = max(v[sp1], v[sp2])
+        mi = min(v[sp1], v[sp2])
+        if ma != 0.0:
+            total += (1.0 - (mi/ma))**2
+        size += 1
+    return total, size
+
+
+def scaled_L2norm_statistics(species, statistics):
+    """
+    Compute the distances as :func:`scaled_L2norm` does in `union` mode,
+    from the sufficient *statistics* of the pairs of species: a dict of
+    the sorted pairs of species to their (sum, count), as returned by
+    :func:`pair_statistics`. The pairs without statistics are at the
+    distance 1.
+    """
+    distances = defaultdict(dict)
+    for sp1, sp2 in combinations(species, 2):
+        total, size = statistics.get(tuple(sorted((sp1, sp2))), (0.0, 0))
+        if size == 0:
+            distances[sp1][sp2] = 1.0
+        else:
+            distances[sp1][sp2] = sqrt(total) / sqrt(size)
+    return distances
+
+
+def distance_matrix(species, distances):
+    """
+    Convert the *distances* (as returned by :func:`scaled_L2norm`) to a
+    square array, in the order of the sequence *species*.
+
+    .. Warning:: If not all species are present in distances,
+                 a KeyError exception is raised.
+    """
+    n = len(species)
+    res = np.zeros((n, n))
+    for i, sp1 in enumerate(species):
+        for j, sp2 in enumerate(species[i+1:], i + 1):
+            if sp1 in distances and sp2 in distances[sp1]:
+                res[i, j] = res[j, i] = distances[sp1][sp2]
+            else:
+                res[i, j] = res[j, i] = distances[sp2][sp1]
+    return res
+
+
+def keep_value(constraint, species, value):
+    """
+    Tell whether the *value* (a dict of species to Hi-C value) is kept
+    with the wanted *constraint* (see :func:`filter_values`).
+    """
+    if constraint == 'intersection':
+        return len(value) == len(species)
+    elif constraint == 'atLeastTwo':
+        return len(value) != 1
+    else:  # in 'union' we keep all values
+        return True
+
+
 def filter_values(constraint, species, values):
     """
     Filter the *values* based upon the *species* and the wanted *constraint*:
@@ -72,12 +260,5 @@ def filter_values(constraint, species, values):
         raise ValueError("constraint must be one of 'intersection', 'atLeastTwo' or 'union'.")
 
     for value in values:
-        if constraint == 'intersection':
-            if len(value) == len(species):
-                yield value
-        elif constraint == 'atLeastTwo':
-            if len(value) != 1:
-                yield value
-        else:  # in 'union' we keep all values
+        if keep_value(constraint, species, value):
             yield value
-
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+dstack
+======
+
+This module contains the reader and writer of the distance stack files: a
+binary container for a stack of distance matrices on the same species
+(*e.g.* the replicates of a bootstrap). It is much faster to write and to
+read than PHYLIP files, and it can be memory-mapped.
+
+A distance stack file is made of:
+
+* the magic string `DSTACK` followed by the bytes 0 and 1 (the version),
+* the length of the header, as an unsigned 32 bits little-endian integer,
+* the header, a JSON object with the fields `species` (the list of the
+  species, in the order of the rows and columns of the matrices) and
+  `count` (the number of matrices), padded with spaces so the data start
+  at a multiple of 64 bytes,
+* the data: the matrices as a (count x species x species) array of
+  little-endian 64 bits floats, in C order.
+
+The stacks can be exported in the PHYLIP format for the tools that still
+need text; see :func:`write_phylip`.
+
+
+:created: October 2026
+:last modified: October 2026
+
+.. codeauthor::
+   Sylvain PULICANI <pulicani@lirmm.fr>
+"""
+
+import json
+import struct
+
+import numpy as np
+
+
+MAGIC = b'DSTACK\x00\x01'
+"""The magic string starting a distance stack file."""
+
+DTYPE = np.dtype('<f8')
+"""The type of the distances."""
+
+
+def _header(species, count):
+    """
+    Make the header of a stack of *count* matrices on the *species*, with
+    room for any count. Return the bytes to write before the data.
+    """
+    header = json.dumps({'species': list(species),
+                         'count': str(count).rjust(20)}).encode()
+    size = len(MAGIC) + 4 + len(header) + 1
+    header += b' ' * (-size % 64) + b'\n'
+    return MAGIC + struct.pack('<I', len(header)) + header
+
+
+def read_header(f):
+    """
+    Read the header of the distance stack file object *f* (opened in
+    binary mode). Return a tuple (list of species, count, offset of the
+    data).
+    """
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError(f'{f.name} is not a distance stack file')
+    size, = struct.unpack('<I', f.read(4))
+    header = json.loads(f.read(size).decode())
+    return header['species'], int(header['count']), len(MAGIC) + 4 + size
+
+
+def read_stack(name, mmap=True):
+    """
+    Read the distance stack file *name*. If *mmap* is True, the data are
+    memory-mapped (read-only) instead of being read.
+    Return a tuple (list of species, array of shape (count, n, n)).
+    """
+    with open(name, 'rb') as f:
+        species, count, offset = read_header(f)
+        shape = (count, len(species), len(species))
+        if not mmap:
+            data = np.fromfile(f, dtype=DTYPE, count=int(np.prod(shape)))
+            return species, data.reshape(shape)
+    if count == 0:
+        return species, np.zeros(shape, dtype=DTYPE)
+    return species, np.memmap(name, dtype=DTYPE, mode='r', offset=offset,
+                              shape=shape)
+
+
+class StackWriter:
+    """
+    StackWriter writes a distance stack file named *name*, holding matrices
+    on the *species*. The matrices are appended one by one (or by blocks),
+    and the number of matrices is written in the header when the file is
+    closed. It can be used as a context manager.
+    """
+
+    def __init__(self, name, species):
+        self.name = name
+        self.species = list(species)
+        self.count = 0
+        """The number of matrices written so far."""
+
+        self._file = open(name, 'wb')
+        self._file.write(_header(self.species, 0))
+
+
+    def append(self, matrix):
+        """
+        Append the square *matrix* (in the order of the species).
+        """
+        self.extend(np.asarray(matrix)[None])
+
+
+    def extend(self, matrices):
+        """
+        Append the *matrices*, an array of shape (k, n, n) or a sequence
+        of square matrices.
+        """
+        data = np.ascontiguousarray(matrices, dtype=DTYPE)
+        n = len(self.species)
+        if data.shape[1:] != (n, n):
+            raise ValueError(f'the matrices must be {n} x {n}')
+        self._file.write(data.tobytes())
+        self.count += len(data)
+
+
+    def close(self):
+        if self._file.closed:
+            return
+        # The header keeps the same size, whatever the count
+        self._file.seek(0)
+        self._file.write(_header(self.species, self.count))
+        self._file.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def write_stack(name, species, matrices):
+    """
+    Write the *matrices* (an array of shape (k, n, n), or a sequence of
+    square matrices) on the *species* in the distance stack file *name*.
+    """
+    with StackWriter(name, species) as writer:
+        writer.extend(matrices)
+
+
+def format_phylip(species, matrices):
+    """
+    Format the *matrices* on the *species* in the PHYLIP format, one after
+    the other. The cells are formatted in bulk, and each matrix is the
+    same as the one made by :func:`iolib.phylip`.
+    Return a list of strings, one per matrix.
+    """
+    matrices = np.asarray(matrices, dtype=float)
+    n = len(species)
+    cells = np.char.mod('%.8f', matrices)
+    cells[:, np.arange(n), np.arange(n)] = '0'
+    res = []
+    for m in cells.tolist():
+        lines = [str(n)]
+        lines.extend('\t'.join([sp] + row) for sp, row in zip(species, m))
+        res.append('\n'.join(lines))
+    return res
+
+
+def write_phylip(f, species, matrices, chunk_size=1000):
+    """
+    Write the *matrices* on the *species* in the text file object *f*, in
+    the PHYLIP format, each followed by a new line (as done by
+    :doc:`/scripts/bootstrap`). The matrices are formatted by chunks of
+    *chunk_size* matrices, so a memory-mapped stack is not read at once.
+    """
+    for i in range(0, len(matrices), chunk_size):
+        for matrix in format_phylip(species, matrices[i:i+chunk_size]):
+            f.write(matrix)
+            f.write('\n')
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+
+"""
+export_phylip.py
+================
+
+Export the matrices of a distance stack file (see :mod:`dstack`), as
+written by :doc:`bootstrap` or :doc:`dist_pairs_indep` with the
+``--stack`` option, in the PHYLIP format, for the tools that need text.
+The matrices are written one after the other in a single file, as with
+the ``--one-file`` option of these scripts.
+
+
+:created: October 2026
+:last modified: October 2026
+
+.. codeauthor::
+   Sylvain PULICANI <pulicani@lirmm.fr>
+"""
+
+import argparse
+import sys
+
+from dstack import read_stack, write_phylip
+
+
+def cli_parser():
+    desc = 'Export a distance stack file in the PHYLIP format.'
+    parser = argparse.ArgumentParser(description=desc)
+    parser.add_argument('stack', help='the distance stack file')
+    parser.add_argument('outfile', help='the PHYLIP file')
+    return parser
+
+
+def main():
+    parser = cli_parser()
+    args = parser.parse_args()
+
+    species, matrices = read_stack(args.stack)
+    with open(args.outfile, 'w') as f:
+        write_phylip(f, species, matrices)
+
+
+if __name__ == '__main__':
+    main()
+    sys.exit(0)
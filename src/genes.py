@@ -19,42 +19,129 @@ A ``gene`` is a ``dict`` with the following keys:
 
 In this file, the ``genes`` argument refers to a list of such dicts.
 
+The genes can also be stored as columns in a :class:`GeneTable`, which is
+faster and more compact for large numbers of genes.
+
 
 :created: May 2018
-:last modified: September 2018
+:last modified: October 2026
 
 .. codeauthor::
    Sylvain PULICANI <pulicani@lirmm.fr>
 """
 
+import numpy as np
 
-def read_bed(name):
+
+class GeneTable:
     """
-    Read the BED file *name*, and return a list of dict. Each dict has the
-    following keys: chrom, start, end, name, strand. The list is sorted.
+    GeneTable holds genes as columns, sorted by chromosome then by start
+    position. The genes are referred to by their row number in the table,
+    so two genes *i* and *j* are adjacent iff they are on the same
+    chromosome and ``abs(i - j) == 1``.
+
+    The columns are NumPy arrays, except for the names.
+    """
+
+    def __init__(self, chroms, chrom, start, end, strand, names):
+        self.chroms = chroms
+        """The sorted list of the chromosome names."""
+
+        self.chrom = chrom
+        """The chromosome of each gene, as an index in :attr:`chroms`."""
+
+        self.start = start
+        """The start position of each gene."""
+
+        self.end = end
+        """The end position of each gene."""
+
+        self.strand = strand
+        """The strand of each gene, either + or -."""
+
+        self.names = names
+        """The list of the gene names."""
+
+        self.index = {n: i for i, n in enumerate(names)}
+        """The mapping of the gene names to their row number."""
+
+
+    def __len__(self):
+        return len(self.names)
+
+
+    def chrom_range(self, code):
+        """
+        Return the rows (first and last + 1) of the genes on the chromosome
+        of index *code* in :attr:`chroms`.
+        """
+        lo, hi = np.searchsorted(self.chrom, [code, code + 1])
+        return int(lo), int(hi)
+
+
+    def adjacent(self, i, j):
+        """
+        Tell whether the genes of rows *i* and *j* (integers or arrays of
+        integers) are adjacent. The strand is not taken into account.
+        """
+        i = np.asarray(i)
+        j = np.asarray(j)
+        return (self.chrom[i] == self.chrom[j]) & (np.abs(i - j) == 1)
+
+
+    def to_dicts(self):
+        """
+        Convert the table to a list of dict, as described at the top of
+        this module.
+        """
+        return [{'name': n, 'chrom': self.chroms[c], 'start': s, 'end': e,
+                 'strand': st}
+                for n, c, s, e, st in zip(self.names, self.chrom.tolist(),
+                                          self.start.tolist(),
+                                          self.end.tolist(),
+                                          self.strand.tolist())]
+
+
+def read_bed_table(name):
+    """
+    Read the BED file *name*, and return a :class:`GeneTable`. The genes
+    are sorted once, by chromosome then by start position.
 
     .. Note:: The BED file is loaded into memory for faster processing.
     """
     with open(name, 'r') as f:
         lines = [l for l in f.read().split('\n') if l]
 
-    res = []
+    fields = []
     for line in lines:
         try:
-            chrom, start, end, name, _, strand = line.split('\t')
+            chrom, start, end, gname, _, strand = line.split('\t')
         except ValueError:
             continue
-        res.append({
-            'name': name,
-            'chrom': chrom,
-            'start': int(start),
-            'end': int(end),
-            'strand': strand
-        })
-
-    res.sort(key=lambda g: g['start'])
-    res.sort(key=lambda g: g['chrom'])
-    return res
+        fields.append((chrom, int(start), int(end), gname, strand))
+
+    if fields:
+        chrom, start, end, names, strand = zip(*fields)
+    else:
+        chrom, start, end, names, strand = [], [], [], [], []
+    chroms, codes = np.unique(np.array(chrom, dtype=str), return_inverse=True)
+    start = np.array(start, dtype=np.int64)
+    end = np.array(end, dtype=np.int64)
+
+    order = np.lexsort((start, codes))
+    return GeneTable(chroms.tolist(), codes[order], start[order], end[order],
+                     np.array(strand, dtype=str)[order],
+                     [names[i] for i in order.tolist()])
+
+
+def read_bed(name):
+    """
+    Read the BED file *name*, and return a list of dict. Each dict has the
+    following keys: chrom, start, end, name, strand. The list is sorted.
+
+    .. Note:: The BED file is loaded into memory for faster processing.
+    """
+    return read_bed_table(name).to_dicts()
 
 
 def make_bed(genes):
@@ -9,19 +9,92 @@ This module contains classes used to work with Hi-C data.
 .. codeauthor:: Sylvain PULICANI <pulicani@lirmm.fr>
 """
 
-import random
 import gzip
+import zlib
+import os
 import json
-import csv
 
-from itertools import product, combinations_with_replacement
+from itertools import islice
 
 import numpy as np
 
+from iolib import open_output
+from metrics import stage, count
+
 class NoSuchHeatmap(Exception):
     pass
 
 
+class AsymmetricHeatmap(Exception):
+    pass
+
+
+def update_metadata(dirname, fields):
+    """
+    Update the `metadata.json` file of the Hi-C directory *dirname* with
+    the dict *fields*. The other fields of the file are left untouched.
+    The file is replaced atomically.
+    """
+    filename = f'{dirname}/metadata.json'
+    with open(filename, 'r') as f:
+        metadata = json.load(f)
+    metadata.update(fields)
+    with open(f'{filename}.tmp', 'w') as f:
+        json.dump(metadata, f, indent=2)
+        f.write('\n')
+    os.replace(f'{filename}.tmp', filename)
+
+
+WRITE_CHUNK_SIZE = 100000
+"""The number of boxes formatted at once by :func:`write_boxes`."""
+
+READ_CHUNK_SIZE = 100000
+"""The number of rows of a TSV heatmap parsed at once by :class:`HiC`."""
+
+
+def write_map(filename, data, binsize, compresslevel=9, threads=1):
+    """
+    Write the matrix *data* to *filename* as a sparse heatmap: only the
+    non-zero boxes are written. The row and column positions are the bin
+    indices multiplied by *binsize*. See :func:`write_boxes` for the
+    formats.
+    """
+    ri, ci = np.nonzero(data)
+    values = data[ri, ci]
+    ri *= binsize
+    ci *= binsize
+    write_boxes(filename, ri, ci, values, compresslevel, threads)
+
+
+def write_boxes(filename, rows, cols, values, compresslevel=9, threads=1):
+    """
+    Write the boxes of a sparse heatmap to *filename*, given as the arrays
+    of their *rows* and *cols* positions and of their *values*.
+
+    The format depends on the extension of *filename*:
+
+    * `.npz`: the binary map format, *i.e.* a NumPy archive holding the
+      `rows`, `cols` and `values` arrays;
+    * `.gz`: a block-gzipped TSV file (see :mod:`bgzf`), compressed at
+      *compresslevel* using *threads* threads;
+    * anything else: a plain TSV file.
+
+    The boxes are formatted in bulk, then written by chunks of
+    :data:`WRITE_CHUNK_SIZE` rows.
+    """
+    if filename.endswith('.npz'):
+        with open(filename, 'wb') as f:
+            np.savez(f, rows=rows, cols=cols, values=values)
+        return
+
+    with open_output(filename, compresslevel, threads) as f:
+        for i in range(0, len(values), WRITE_CHUNK_SIZE):
+            chunk = zip(rows[i:i+WRITE_CHUNK_SIZE].tolist(),
+                        cols[i:i+WRITE_CHUNK_SIZE].tolist(),
+                        values[i:i+WRITE_CHUNK_SIZE].tolist())
+            f.write(''.join(f'{r}\t{c}\t{v!r}\n' for r, c, v in chunk))
+
+
 class HiC:
     """
     HiC represents an Hi-C experiment, handling the matrices reading,
@@ -30,6 +103,8 @@ class HiC:
     The experiment is encapsulated into a directory, with one file per matrix.
     The matrices are written as **gzipped TSV** files with 3 columns: `row`
     position, `column` position and `value`. The matrices are **sparse**.
+    They can also be written in a binary format (files ending with `.npz`);
+    see :func:`write_map`.
 
     There is also a JSON file called `metadata.json` of the following form:
     ::
@@ -49,14 +124,25 @@ class HiC:
          "2R|2R": "2R_2R.tsv.gz",
          "4|X": "4_X.tsv.gz",
          ...
-       }
+       },
+       "Offset": 0.0
      }
 
     Please note that the format of the file names is free, but the one of
     the keys is not. This is of the form `chromosome|chromosome`.
 
+    The `Offset` field is optional. If present, its value is added to each
+    box of a matrix when it is loaded (this is used by :doc:`/scripts/norm_center`).
+
+    An intra-chromosomal matrix can be loaded in a *banded* layout, where
+    only the boxes at most *band* bins away from the diagonal are kept:
+    the current matrix is then an array of dimensions (*band* + 1) x *n*,
+    whose box (*d*, *i*) holds the box (*i*, *i* + *d*) of the full
+    matrix. Thus, the memory needed is linear in the length of the
+    chromosome. See :meth:`load_map`.
+
     :created: May 2018
-    :last modified: August 2018
+    :last modified: October 2026
 
     .. codeauthor::
        Sylvain PULICANI <pulicani@lirmm.fr>
@@ -74,6 +160,9 @@ class HiC:
         self.binsize = metadata['Binsize']
         """The binsize of the dataset."""
 
+        self.offset = metadata.get('Offset', 0.0)
+        """The value added to each box of the matrices when loading them."""
+
         self._dims = metadata['Dims']
         self._mapfiles = metadata['MapFiles']
 
@@ -90,18 +179,25 @@ class HiC:
         self.chromosomes = list(temp)
         """The list of chromosomes for which data are available."""
 
-        self.current = {'data': None, 'dims': (0, 0), 'chroms': ('', '')}
+        self.current = {'data': None, 'dims': (0, 0), 'chroms': ('', ''),
+                        'band': None}
         """The currently loaded Hi-C map."""
 
 
-    def load_map(self, rowChrom, colChrom, scramble=False):
+    def load_map(self, rowChrom, colChrom, scramble=False, seed=None,
+                 band=None):
         """
-        Load the wanted matrix.
+        Load the wanted matrix, adding the dataset offset to each box.
         If needed, the row and column chromosomes will be swapped.
         If there is no matrix with this pair of chromosomes, a
         `NoSuchHeatmap` error is raised.
         if *scramble* is `True`, then the matrix is scramble in-place
-        after being loaded.
+        after being loaded. The scrambling is reproducible if *seed* (an
+        integer) is given.
+        If *band* (an integer) is given and the matrix is intra-chromosomal,
+        only the boxes at most *band* bins away from the diagonal are loaded,
+        in the banded layout (see above). A banded matrix cannot be
+        scrambled: the scrambling needs the whole matrix.
         """
         k = f'{rowChrom}|{colChrom}'
         self.current['chroms'] = (rowChrom, colChrom)
@@ -111,41 +207,171 @@ class HiC:
         if k not in self._mapfiles:
             raise NoSuchHeatmap(f'{rowChrom} x {colChrom}')
 
-        with gzip.open(f'{self.datadir}/{self._mapfiles[k]}', 'rt') as f:
-            data = [row for row in csv.reader(f, delimiter='\t') if row]
-
-        # max_row_pos = max(set(int(d[0]) for d in data))
-        # max_col_pos = max(set(int(d[1]) for d in data))
-
-	    # # Here, the +1 is because we can have something like the last
-        # # position read is 11 and the binsize is 5, then we want to
-        # # have the following bins:
-        # # bin 0 [0, 5), bin 1 [5, 10), bin 2 [10, 15)
-	    # # There are 11 / 5 + 1 = 3 bins.
-        # nrow = (max_row_pos // self.binsize) + 1
-        # ncol = (max_col_pos // self.binsize) + 1
         nrow, ncol = self._dims[k]
         self.current['dims'] = (nrow, ncol)
 
-        m = np.zeros((nrow, ncol), dtype=float)
-        for rpos, cpos, value in data:
-            ri = int(rpos) // self.binsize
-            ci = int(cpos) // self.binsize
-            m[ri, ci] = float(value)
+        if band is not None and rowChrom != colChrom:
+            band = None
+        if band is not None and scramble:
+            raise ValueError('a banded matrix cannot be scrambled')
+        self.current['band'] = band
+
+        filename = f'{self.datadir}/{self._mapfiles[k]}'
+        with stage('load_map'):
+            if filename.endswith('.npz'):
+                self.current['data'] = self._read_npz(filename, nrow, ncol,
+                                                      band)
+            else:
+                self.current['data'] = self._read_tsv(filename, nrow, ncol,
+                                                      band)
+        count('maps_loaded')
+        if self.offset:
+            self.current['data'] += self.offset
 
-        self.current['data'] = m
         if scramble:
-            if rowChrom == colChrom:
-                self._scrambleIntraFY()
-            else:
-                self._scrambleInterFY()
+            self.scramble(seed)
+
+
+    def scramble(self, seed=None):
+        """
+        Scramble in-place the currently loaded matrix. The scrambling is
+        reproducible if *seed* (an integer) is given: a matrix is always
+        scrambled the same way with the same seed.
+        """
+        if self.current['band'] is not None:
+            raise ValueError('a banded matrix cannot be scrambled')
+        c1, c2 = self.current['chroms']
+        rng = self._map_rng(f'{c1}|{c2}', seed)
+        if c1 == c2:
+            self._scrambleIntraFY(rng)
+        else:
+            self._scrambleInterFY(rng)
+
+
+    def _map_rng(self, key, seed=None):
+        """
+        Return a random generator for the matrix *key*. If *seed* is not
+        None, the generator depends only on *seed* and *key*, thus a given
+        matrix is always scrambled the same way, whatever the order in
+        which the matrices are loaded.
+        """
+        if seed is None:
+            return np.random.default_rng()
+        return np.random.default_rng([seed, zlib.crc32(key.encode())])
+
+
+    def _read_tsv(self, filename, nrow, ncol, band=None):
+        """
+        Read the sparse (gzipped) TSV heatmap *filename* and return it as
+        a dense matrix of dimensions *nrow* x *ncol*, or in the banded
+        layout if *band* is given.
+
+        The rows are parsed into arrays by chunks of
+        :data:`READ_CHUNK_SIZE`, and put in the matrix at once: besides
+        the matrix, the memory needed does not depend on the size of the
+        file.
+        """
+        if filename.endswith('.gz'):
+            f = gzip.open(filename, 'rt')
+        else:
+            f = open(filename, 'r')
+
+        if band is not None:
+            m = np.zeros((band + 1, nrow), dtype=float)
+        else:
+            m = np.zeros((nrow, ncol), dtype=float)
+        with f:
+            while True:
+                lines = list(islice(f, READ_CHUNK_SIZE))
+                if not lines:
+                    break
+                boxes = np.loadtxt(lines, delimiter='\t', ndmin=2)
+                if len(boxes) == 0:
+                    continue
+                rows = boxes[:, 0].astype(np.int64)
+                cols = boxes[:, 1].astype(np.int64)
+                if band is not None:
+                    self._fill_banded(m, rows, cols, boxes[:, 2], band)
+                else:
+                    m[rows // self.binsize, cols // self.binsize] = boxes[:, 2]
+        return m
+
+
+    def _read_npz(self, filename, nrow, ncol, band=None):
+        """
+        Read the heatmap *filename* written in the binary map format (see
+        :func:`write_map`) and return it as a dense matrix of dimensions
+        *nrow* x *ncol*, or in the banded layout if *band* is given.
+        """
+        with np.load(filename) as archive:
+            if band is not None:
+                return self._banded(archive['rows'], archive['cols'],
+                                    archive['values'], nrow, band)
+            m = np.zeros((nrow, ncol), dtype=float)
+            m[archive['rows'] // self.binsize,
+              archive['cols'] // self.binsize] = archive['values']
+        return m
+
+
+    def _banded(self, rows, cols, values, n, band):
+        """
+        Build the banded layout of an intra-chromosomal matrix with *n*
+        bins, keeping the boxes at most *band* bins away from the diagonal.
+        The boxes are given by the arrays of positions *rows* and *cols*,
+        and of *values*.
+        """
+        m = np.zeros((band + 1, n), dtype=float)
+        self._fill_banded(m, rows, cols, values, band)
+        return m
+
+
+    def _fill_banded(self, m, rows, cols, values, band):
+        """
+        Put the boxes given by the arrays *rows*, *cols* and *values* (see
+        :meth:`_banded`) in the banded matrix *m*, in-place.
+        """
+        ri = rows // self.binsize
+        ci = cols // self.binsize
+        d = np.abs(ci - ri)
+        keep = d <= band
+        m[d[keep], np.minimum(ri, ci)[keep]] = values[keep]
+
+
+    def write_map(self, outdir, data=None, compresslevel=9, threads=1):
+        """
+        Write the currently loaded matrix in *outdir*, using the same file
+        name as in this dataset. If *data* is given, it is written instead
+        of the current matrix (it must have the same dimensions).
+        See :func:`write_map` for the formats.
+        Return the name of the written file.
+        """
+        if data is None:
+            data = self.current['data']
+        c1, c2 = self.current['chroms']
+        filename = self._mapfiles[f'{c1}|{c2}']
+        write_map(f'{outdir}/{filename}', data, self.binsize, compresslevel,
+                  threads)
+        return filename
+
+
+    def iter_maps(self):
+        """
+        Load each matrix in turn. This is a generator that yields the pair
+        of chromosomes of the matrix currently loaded. Only one matrix is
+        in memory at a time.
+        """
+        for k in self._mapfiles.keys():
+            c1, c2 = k.split('|')
+            self.load_map(c1, c2)
+            yield self.current['chroms']
 
 
     def load_all_maps(self):
         """
         Load all the matrices. The result is an array with all the values.
 
-        .. warning:: This function can need a lot of memory.
+        .. warning:: This function can need a lot of memory. Use
+                     :meth:`iter_maps` when possible.
 
         .. warning:: This function's result may change in the future.
         """
@@ -189,33 +415,96 @@ class HiC:
             # return -1.0
             return float('nan')
 
+        if self.current['band'] is not None:
+            if abs(p2 - p1) > self.current['band']:
+                return float('nan')
+            return self.current['data'][abs(p2 - p1), min(p1, p2)]
+
         return self.current['data'][p1, p2]
 
 
-    def _scrambleInterFY(self):
+    def get_contacts(self, chroms1, starts1, chroms2, starts2, scramble=False,
+                     seed=None, band=None):
+        """
+        Fetch the contacts between many pairs of positions at once. The
+        first positions of the pairs are given by the arrays (or sequences)
+        of chromosome names *chroms1* and of positions *starts1* (*e.g.* the
+        TSS of genes), and the second positions by *chroms2* and *starts2*.
+        Return an array of floats, with Not-a-Number (NaN) for the
+        positions out of bounds and for the pairs of chromosomes without
+        heatmap, or outside of the band of a banded heatmap.
+
+        The queries are grouped by heatmap, and each needed heatmap is
+        loaded once (unless it is the current one), using *scramble*,
+        *seed* and *band* (see :meth:`load_map`). Thus, the last loaded
+        heatmap stays the current one.
         """
-        Randomize the matrix by the 'Fisher-Yates shuffle '<https://en.wikipedia.org/wiki/Fisher%E2%80%93Yates_shuffle#The_modern_algorithm>.
+        chroms1 = np.asarray(chroms1)
+        chroms2 = np.asarray(chroms2)
+        bins1 = np.asarray(starts1, dtype=np.int64) // self.binsize
+        bins2 = np.asarray(starts2, dtype=np.int64) // self.binsize
+        n = len(chroms1)
+        res = np.full(n, float('nan'))
+        if n == 0:
+            return res
+
+        names, codes = np.unique(np.concatenate([chroms1, chroms2]),
+                                 return_inverse=True)
+        groups = codes[:n] * len(names) + codes[n:]
+        order = np.argsort(groups, kind='stable')
+        keys, first = np.unique(groups[order], return_index=True)
+        for key, idx in zip(keys, np.split(order, first[1:])):
+            c1, c2 = str(names[key // len(names)]), str(names[key % len(names)])
+            rows, cols = bins1[idx], bins2[idx]
+            if f'{c1}|{c2}' not in self._mapfiles:
+                c1, c2 = c2, c1
+                rows, cols = cols, rows
+                if f'{c1}|{c2}' not in self._mapfiles:
+                    continue
+
+            current_band = band if c1 == c2 else None
+            if (self.current['data'] is None or
+                    self.current['chroms'] != (c1, c2) or
+                    self.current['band'] != current_band):
+                self.load_map(c1, c2, scramble, seed, band)
+
+            nrow, ncol = self.current['dims']
+            inbound = (rows < nrow) & (cols < ncol)
+            if self.current['band'] is None:
+                res[idx[inbound]] = self.current['data'][rows[inbound],
+                                                         cols[inbound]]
+                continue
+
+            dist = np.abs(cols - rows)
+            inbound &= dist <= self.current['band']
+            res[idx[inbound]] = self.current['data'][
+                dist[inbound], np.minimum(rows, cols)[inbound]]
+
+        return res
+
+
+    def _scrambleInterFY(self, rng):
+        """
+        Randomize the matrix by shuffling all its boxes, using the random
+        generator *rng* (a `numpy.random.Generator`). The Not-a-Number
+        boxes are left in place.
 
         .. codeauthor::
            Krister SWENSON <swenson@lirmm.fr>
         """
-        mat = self.current['data']
-        rows = mat.shape[0]
-        cols = mat.shape[1]
-        for x,y in product(range(rows), range(cols)):
-            if mat[x][y] is not None:
-                i = random.randrange(rows)
-                j = random.randrange(cols)
-                while mat[i][j] is None:
-                    i = random.randrange(rows)
-                    j = random.randrange(cols)
+        flat = self.current['data'].ravel()
+        known = ~np.isnan(flat)
+        flat[known] = rng.permutation(flat[known])
 
-                mat[x][y], mat[i][j] = mat[i][j], mat[x][y]
 
-
-    def _scrambleIntraFY(self):
+    def _scrambleIntraFY(self, rng):
         """
-        Randomize the matrix by the `Fisher-Yates shuffle `<https://en.wikipedia.org/wiki/Fisher%E2%80%93Yates_shuffle#The_modern_algorithm>.
+        Randomize the symmetric matrix by shuffling the boxes of its upper
+        triangle (including the diagonal), then mirroring them in the lower
+        triangle, using the random generator *rng* (a
+        `numpy.random.Generator`). The Not-a-Number boxes are left in place.
+        If the matrix is not symmetric, an `AsymmetricHeatmap` error is
+        raised.
 
         .. codeauthor::
            Krister SWENSON <swenson@lirmm.fr>
@@ -225,20 +514,12 @@ class HiC:
         cols = mat.shape[1]
         assert(rows == cols)
 
-        for x,y in combinations_with_replacement(range(rows), 2):
-            if mat[x][y] is not None:
-                #Test for symmetry.
-                if mat[x][y] != mat[y][x] and abs(mat[x][y]-mat[y][x]) > .001:
-                    raise intraSymmetry(x,y)
-
-                #Find value to swap with.
-                i = random.randrange(rows)
-                j = random.randrange(rows)
-                while(mat[i][j] is None):
-                    i = random.randrange(rows)
-                    j = random.randrange(cols)
-
-                #Do the swap.
-                vals = mat[x][y], mat[i][j]
-                mat[i][j], mat[x][y] = vals
-                mat[j][i], mat[y][x] = vals
+        if not np.allclose(mat, mat.T, rtol=0.0, atol=.001, equal_nan=True):
+            raise AsymmetricHeatmap(' x '.join(self.current['chroms']))
+
+        upper = np.triu(np.ones((rows, cols), dtype=bool))
+        values = mat[upper]
+        known = ~np.isnan(values)
+        values[known] = rng.permutation(values[known])
+        mat[upper] = values
+        mat.T[upper] = values
@@ -12,15 +12,245 @@ PHYLIP matrices.
 
 
 :created: June 2018
-:last modified: August 2019
+:last modified: October 2026
 
 .. codeauthor::
    Sylvain PULICANI <pulicani@lirmm.fr>
 """
 
+import io
+import os
+import csv
 import gzip
+import json
+import hashlib
 
 from math import isnan
+from os.path import splitext
+from itertools import repeat
+
+import numpy as np
+
+from bgzf import (BgzfWriter, write_index, has_index, read_index,
+                  iter_chunks, split_index)
+
+
+def open_output(name, compresslevel=6, threads=1):
+    """
+    Open the file *name* for writing text. If the file name has the
+    extension `.gz`, it is block-gzipped (see :mod:`bgzf`) at
+    *compresslevel*, using *threads* threads. The file is readable by
+    `gzip` as any gzipped file.
+    Return a text file object.
+    """
+    if splitext(name)[1] == '.gz':
+        return io.TextIOWrapper(BgzfWriter(name, compresslevel, threads),
+                                encoding='utf-8')
+    return open(name, 'w')
+
+
+CHUNK_ROWS = 10000
+"""The maximum number of rows of a chunk of the index of a TSV file."""
+
+
+class TableWriter:
+    """
+    TableWriter writes rows in the TSV file *name*. If the file name has
+    the extension `.gz`, it is block-gzipped (see :func:`open_output`), and
+    an index of the rows is written alongside it, in the file *name*.idx.
+
+    The rows are written with :meth:`writerows`, each time with a key
+    (*e.g.* a pair of chromosomes) labelling them in the index. The index
+    is made of chunks of at most *chunk_rows* consecutive rows having the
+    same key, so a file written with a single key can still be split. See
+    :mod:`bgzf` for reading the index.
+    """
+
+    def __init__(self, name, compresslevel=6, threads=1,
+                 chunk_rows=CHUNK_ROWS):
+        self.name = name
+        self.chunk_rows = chunk_rows
+        self.rows = 0
+        """The number of rows written so far."""
+
+        self._chunks = []
+        self._bgzf = None
+        if splitext(name)[1] == '.gz':
+            self._bgzf = BgzfWriter(name, compresslevel, threads)
+            self._file = io.TextIOWrapper(self._bgzf, encoding='utf-8')
+        else:
+            self._file = open(name, 'w')
+        self._writer = csv.writer(self._file, delimiter='\t',
+                                  lineterminator='\n')
+
+
+    def writerows(self, rows, key='*'):
+        """
+        Write the *rows* (a list of lists of fields), indexed with *key*.
+        The rows extend the last chunk of the index if it has the same key
+        and is not full, and fill new chunks otherwise.
+        """
+        if self._bgzf is None:
+            self._writer.writerows(rows)
+            self.rows += len(rows)
+            return
+        start = 0
+        while start < len(rows):
+            last = self._chunks[-1] if self._chunks else None
+            if last is not None and last[0] == key and\
+               last[2] < self.chunk_rows:
+                n = min(self.chunk_rows - last[2], len(rows) - start)
+                last[2] += n
+            else:
+                self._file.flush()
+                n = min(self.chunk_rows, len(rows) - start)
+                self._chunks.append([key, self.rows, n, self._bgzf.mark()])
+            self._writer.writerows(rows[start:start+n])
+            self.rows += n
+            start += n
+
+
+    def close(self):
+        """
+        Close the file, and write the index if the file is block-gzipped.
+        """
+        self._file.close()
+        if self._bgzf is not None:
+            write_index(f'{self.name}.idx',
+                        [(key, first, nrows, self._bgzf.virtual_offset(mark))
+                         for key, first, nrows, mark in self._chunks])
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+MANIFEST = 'manifest.json'
+"""The name of the manifest file of a sharded output."""
+
+
+def read_manifest(name):
+    """
+    Read the manifest of a sharded output. *name* is either the manifest
+    file or the directory holding it. Return the dict stored in the
+    manifest, with an empty list of shards if the manifest does not exist.
+
+    The manifest is described :doc:`in the documentation </formats/manifest>`.
+    """
+    if os.path.isdir(name):
+        name = f'{name}/{MANIFEST}'
+    try:
+        with open(name, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'Shards': []}
+
+
+def write_manifest(dirname, manifest):
+    """
+    Write the dict *manifest* in the directory *dirname*. The file is
+    replaced atomically, so a manifest is always complete.
+    """
+    name = f'{dirname}/{MANIFEST}'
+    with open(f'{name}.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2)
+        f.write('\n')
+    os.replace(f'{name}.tmp', name)
+
+
+def is_manifest(name):
+    """
+    Tell whether *name* is a manifest file, or a directory holding one.
+    """
+    return (os.path.basename(name) == MANIFEST or
+            os.path.isfile(f'{name}/{MANIFEST}'))
+
+
+def manifest_shards(name):
+    """
+    Return the paths of the shards listed in the manifest *name* (either
+    the manifest file or the directory holding it).
+    """
+    dirname = name if os.path.isdir(name) else os.path.dirname(name)
+    return [os.path.join(dirname, shard['File'])
+            for shard in read_manifest(name)['Shards']]
+
+
+def stats_name(name):
+    """
+    Return the name of the sufficient statistics sidecar of the values
+    file *name*: its name with the `.tsv.gz` extension replaced by
+    `.stats.json`.
+    """
+    if name.endswith('.tsv.gz'):
+        name = name[:-len('.tsv.gz')]
+    return f'{name}.stats.json'
+
+
+def file_stamp(name):
+    """
+    Return the stamp of the file *name*, used to tell whether a file
+    changed: a dict with its absolute path, size and modification time.
+    """
+    st = os.stat(name)
+    return {'Path': os.path.abspath(name), 'Size': st.st_size,
+            'MTime': st.st_mtime_ns}
+
+
+def read_stats(name, orthos):
+    """
+    Read the sufficient statistics sidecar of the values file *name*,
+    joined with the orthologs file *orthos*. Return the dict stored in
+    the sidecar, or None if it does not exist or is out of date (*i.e.*
+    the values file or the orthologs file changed since).
+
+    The sidecar is described :doc:`in the documentation </formats/stats_sidecar>`.
+    """
+    try:
+        with open(stats_name(name), 'r') as f:
+            stats = json.load(f)
+    except FileNotFoundError:
+        return None
+    if stats['Values'] != file_stamp(name) or\
+       stats['Orthologs'] != file_stamp(orthos):
+        return None
+    return stats
+
+
+def write_stats(name, orthos, species, total, size, join):
+    """
+    Write the sufficient statistics sidecar of the values file *name*,
+    joined with the orthologs file *orthos* and the options *join* (a
+    dict, see :doc:`/scripts/join_pairs`): the sum *total* of the squared
+    terms of the distance between the pair of *species*, and their number
+    *size* (see :func:`distlib.pair_statistics`). The file is replaced
+    atomically.
+    """
+    stats = {'Species': list(species), 'Sum': total, 'Count': size,
+             'Join': join, 'Values': file_stamp(name),
+             'Orthologs': file_stamp(orthos)}
+    sidecar = stats_name(name)
+    with open(f'{sidecar}.tmp', 'w') as f:
+        json.dump(stats, f, indent=2)
+        f.write('\n')
+    os.replace(f'{sidecar}.tmp', sidecar)
+    return stats
+
+
+def checksum(name):
+    """
+    Compute the SHA-256 checksum of the file *name*. Return it as an
+    hexadecimal string.
+    """
+    h = hashlib.sha256()
+    with open(name, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
 
 
 def read_orthos(name):
@@ -44,23 +274,91 @@ def read_orthos(name):
     return orthos, groups
 
 
-def read_values(orthos, groups, sp_left, sp_right, name):
+def read_orthos_species(name, species):
+    """
+    Read the genes of the *species* from the orthologs file *name*.
+    Return a dict of the orthology groups (numbered as by
+    :func:`read_orthos`) to the gene of the species; the groups without a
+    gene in the species are left out.
+    """
+    with open(name, 'r') as f:
+        lines = [l for l in f.read().split('\n') if l]
+    header = lines[0].split('\t')
+    if species not in header:
+        raise KeyError(f'{species} is not in {name}')
+    col = header.index(species)
+    res = {}
+    for i, line in enumerate(lines[1:]):
+        fields = line.split('\t')
+        if col < len(fields) and fields[col]:
+            res[i] = fields[col]
+    return res
+
+
+def read_values(orthos, groups, sp_left, sp_right, name, executor=None,
+                parts=1):
     """
     Read the value file at *name* and return a dict of dict of group ids
     to species name to Hi-C value.
 
+    If the file is indexed (see :doc:`/formats/index` and
+    :func:`bgzf.has_index`), it is read by chunks of rows (see :func:`bgzf.iter_chunks`). With an *executor*,
+    whose workers are initialized by :func:`init_values_worker`, the index
+    is split in *parts* (see :func:`bgzf.split_index`), read in parallel.
+
     The values file is described :doc:`in the documentation </formats/values>`.
 
     .. note::
       Extract only the values where all four genes are present in *orthos*.
     """
-    lines = []
-    with gzip.open(name, 'rt') as f:
-        lines = [l for l in f.read().split('\n') if l]
+    if not has_index(name):
+        lines = []
+        with gzip.open(name, 'rt') as f:
+            lines = [l for l in f.read().split('\n') if l]
+        return parse_values(orthos, groups, sp_left, sp_right,
+                            (line.split('\t') for line in lines))
 
+    chunks = read_index(name)
+    if executor is None or parts <= 1:
+        return parse_values(orthos, groups, sp_left, sp_right,
+                            iter_chunks(name, chunks))
     values = {}
-    for line in lines[1:]:
-        g1l, g1r, g2l, g2r, v1, v2 = line.split('\t')
+    # The parts are merged in order, as if the file was read at once
+    for part in executor.map(_read_values_chunks, repeat(sp_left),
+                             repeat(sp_right), repeat(name),
+                             split_index(chunks, parts)):
+        values.update(part)
+    return values
+
+
+_values_orthos = None
+"""The orthologs of a worker reading values (see :func:`init_values_worker`)."""
+
+
+def init_values_worker(orthos, groups):
+    """
+    Initialize a worker process reading the values files in parallel (see
+    :func:`read_values`): the orthologs *orthos* and *groups* are given
+    once to each worker, not with each part of a file.
+    """
+    global _values_orthos
+    _values_orthos = (orthos, groups)
+
+
+def _read_values_chunks(sp_left, sp_right, name, chunks):
+    orthos, groups = _values_orthos
+    return parse_values(orthos, groups, sp_left, sp_right,
+                        iter_chunks(name, chunks))
+
+
+def parse_values(orthos, groups, sp_left, sp_right, rows):
+    """
+    Parse the *rows* of a values file (sequences of fields, *e.g.* as made
+    by :doc:`/scripts/join_pairs`) and return a dict of dict of group ids
+    to species name to Hi-C value, as :func:`read_values`.
+    """
+    values = {}
+    for g1l, g1r, g2l, g2r, v1, v2 in rows:
         if g1l not in orthos or\
            g1r not in orthos or\
            g2l not in orthos or\
@@ -105,3 +403,22 @@ def phylip(species, distances):
                 temp_line.append(f'{distances[sp1][sp2]:.8f}')
         lines.append('\t'.join(temp_line))
     return '\n'.join(lines)
+
+
+def read_phylip(name):
+    """
+    Read the distance matrices of the PHYLIP file *name*, which can hold
+    several matrices one after the other (as written by
+    :doc:`/scripts/bootstrap` with the ``--one-file`` option).
+    This is a generator of tuples (list of species, square array).
+    """
+    with open(name, 'r') as f:
+        lines = [l.split() for l in f if l.strip()]
+
+    i = 0
+    while i < len(lines):
+        n = int(lines[i][0])
+        rows = lines[i+1:i+1+n]
+        yield ([r[0] for r in rows],
+               np.array([r[1:] for r in rows], dtype=float).reshape(n, n))
+        i += n + 1
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+
+
+"""
+jackknife.py
+============
+
+Compute jackknife replicates of the distance matrix, to estimate its
+stability. Two kinds of jackknife are available:
+
+* leave-one-chromosome-out (``--reference`` and ``--genes``): each
+  replicate leaves out the pairs of orthology groups (the traits) having
+  a gene on one chromosome of the reference species;
+* delete-*d* (``--blocks``): the traits are split in blocks, based on a
+  hash of their pair of orthology groups (see :mod:`sampling`), and each
+  replicate leaves out ``--delete`` blocks. By default, all the
+  combinations of blocks are left out; with ``--replicates``, only that
+  number of random combinations.
+
+The mode argument define what kind of value we want to keep while
+computing the distance, as in :doc:`/scripts/bootstrap`.
+
+The values files are read once. The sufficient statistics of the
+distances (the sums of the squared terms and their numbers, for each pair
+of species) are computed once for each group of traits that can be left
+out together: each pair of chromosomes of the reference, or each block.
+A replicate is then the full statistics minus the ones of the groups it
+leaves out, so it costs nothing more than the subtraction.
+
+The replicates are written in *outdir*, as by :doc:`/scripts/bootstrap`:
+one PHYLIP file per replicate, all in one file (``--one-file``), in a
+distance stack (``--stack``, see :mod:`dstack`), or as trees
+(``--trees``). The matrix of the full data is written in
+`full_data.phylip`, and the groups left out by each replicate are listed
+in `replicates.tsv`.
+
+.. note::
+   With leave-one-chromosome-out, the traits whose genes are not in the
+   reference species (or not in its genes file) are never left out, and
+   the chromosomes without traits have no replicate.
+
+
+:created: October 2026
+:last modified: October 2026
+
+.. codeauthor::
+   Sylvain PULICANI <pulicani@lirmm.fr>
+"""
+
+import argparse
+import random
+import sys
+import os
+import re
+
+from itertools import combinations
+from math import comb
+
+import numpy as np
+
+from toolz import merge_with
+from toolz.curried import merge
+
+import metrics
+from metrics import stage, count
+from distlib import (MODES, trait_matrix, mode_mask, partial_statistics,
+                     statistics_matrix)
+from dstack import write_stack, write_phylip, format_phylip
+from genes import read_bed_table
+from iolib import read_orthos, read_orthos_species, read_values
+from sampling import split_keys, pair_uniform
+from trees import build_trees
+
+
+def chromosome_labels(keys, reference, genes):
+    """
+    Label the traits *keys* (pairs of orthology groups, see
+    :func:`sampling.split_keys`) by the pair of chromosomes of their genes
+    in the reference species. *reference* maps the orthology groups to
+    their gene in the reference species (see
+    :func:`iolib.read_orthos_species`), and *genes* is the
+    :class:`genes.GeneTable` of the reference species.
+    The pair of chromosomes (*a*, *b*), with *a* <= *b* as indices in
+    ``genes.chroms``, has the label *a* x nchroms + *b*; the traits with
+    a gene out of the reference have the label nchroms².
+    Return an array of labels.
+    """
+    nc = len(genes.chroms)
+    chrom = {g: int(genes.chrom[genes.index[name]])
+             for g, name in reference.items() if name in genes.index}
+    g1, g2 = split_keys(keys)
+    c1 = np.array([chrom.get(g, -1) for g in g1.tolist()], dtype=np.int64)
+    c2 = np.array([chrom.get(g, -1) for g in g2.tolist()], dtype=np.int64)
+    a, b = np.minimum(c1, c2), np.maximum(c1, c2)
+    return np.where(a >= 0, a * nc + b, nc * nc)
+
+
+def chromosome_removals(nchroms):
+    """
+    Make the removals of the leave-one-chromosome-out jackknife, for the
+    labels of :func:`chromosome_labels`: the replicate *c* leaves out the
+    pairs of chromosomes holding the chromosome *c*.
+    Return an array of shape (nchroms, nchroms² + 1), of 1 for the labels
+    left out.
+    """
+    removals = np.zeros((nchroms, nchroms, nchroms))
+    for c in range(nchroms):
+        removals[c, c, :] = 1.0
+        removals[c, :, c] = 1.0
+    removals = removals.reshape(nchroms, nchroms * nchroms)
+    return np.hstack([removals, np.zeros((nchroms, 1))])
+
+
+def block_labels(keys, nblocks, seed=0):
+    """
+    Split the traits *keys* in *nblocks* blocks, based on the hash of
+    their pair of orthology groups with the *seed* (see
+    :func:`sampling.pair_uniform`). Return an array of labels.
+    """
+    u = pair_uniform(*split_keys(keys), seed)
+    return np.minimum((u * nblocks).astype(np.int64), nblocks - 1)
+
+
+def block_removals(nblocks, delete=1, replicates=None, seed=0):
+    """
+    Make the removals of the delete-*d* jackknife: each replicate leaves
+    out *delete* of the *nblocks* blocks. All the combinations of blocks
+    are made, or *replicates* random ones, drawn with the *seed*.
+    Return a tuple (array of shape (replicates, nblocks), of 1 for the
+    blocks left out, list of the tuples of blocks left out).
+    """
+    if replicates is None:
+        left_out = list(combinations(range(nblocks), delete))
+    else:
+        rng = random.Random(seed)
+        left_out = [tuple(sorted(rng.sample(range(nblocks), delete)))
+                    for _ in range(replicates)]
+    removals = np.zeros((len(left_out), nblocks))
+    for r, blocks in enumerate(left_out):
+        removals[r, list(blocks)] = 1.0
+    return removals, left_out
+
+
+def jackknife(sums, counts, removals):
+    """
+    Compute the jackknife replicates of the distance matrix from the
+    sufficient statistics of each group of traits (*sums* and *counts*,
+    as returned by :func:`distlib.partial_statistics`): each replicate is
+    made by subtracting the statistics of the groups it leaves out (the
+    rows of *removals*) from the full ones.
+    Return a tuple (matrix of the full data, array of shape (replicates,
+    species, species)).
+    """
+    total_sums, total_counts = sums.sum(axis=0), counts.sum(axis=0)
+    rep_sums = total_sums - np.tensordot(removals, sums, axes=1)
+    rep_counts = total_counts - np.tensordot(removals, counts, axes=1)
+    return (statistics_matrix(total_sums, total_counts),
+            statistics_matrix(rep_sums, rep_counts))
+
+
+def cli_parser():
+    desc = ('Compute leave-one-chromosome-out or delete-d jackknife '
+            'replicates of the distance matrix.')
+    parser = argparse.ArgumentParser(description=desc)
+    parser.add_argument('orthos', help='all the orthos, in TSV')
+    parser.add_argument('outdir', help='the dir for the resulting replicates')
+    parser.add_argument('values', nargs='+',
+                        help='the values files, in (Gzipped) TSV')
+    parser.add_argument('-r', '--reference',
+                        help=('leave one chromosome of this species out in '
+                              'each replicate; needs --genes'))
+    parser.add_argument('-g', '--genes',
+                        help='the genes of the reference species, in BED')
+    parser.add_argument('-b', '--blocks', type=int,
+                        help=('split the traits in this number of blocks, '
+                              'and leave --delete blocks out in each '
+                              'replicate'))
+    parser.add_argument('-d', '--delete', type=int, default=1,
+                        help='the number of blocks left out (default: 1)')
+    parser.add_argument('-n', '--replicates', type=int,
+                        help=('the number of random combinations of blocks '
+                              'left out; by default, all of them'))
+    parser.add_argument('--seed', type=int, default=0,
+                        help=('the seed of the blocks and of their '
+                              'combinations (default: 0)'))
+    parser.add_argument('-o', '--one-file', action='store_true',
+                        help=('write the replicates in a single file instead '
+                              'of one per replicate'))
+    output = parser.add_mutually_exclusive_group()
+    output.add_argument('-t', '--trees', action='store_true',
+                        help=('build the trees of the replicates and write '
+                              'them instead of the distance matrices'))
+    output.add_argument('-s', '--stack', action='store_true',
+                        help=('write the replicates in a binary distance '
+                              'stack, all_replicates.dstack'))
+    parser.add_argument('-N', '--no-nni', action='store_true',
+                        help=('with --trees, only use neighbor joining, '
+                              'without the balanced minimum evolution '
+                              'refinement'))
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='the number of processes building the trees')
+    parser.add_argument('-m', '--mode', default='intersection', choices=MODES,
+                        help=('the mode, that is, the kind of values we want'
+                              ' to keep while computing the distance'))
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='be verbose')
+    metrics.add_arguments(parser)
+    return parser
+
+
+def main():
+    parser = cli_parser()
+    args = parser.parse_args()
+    if (args.reference is None) == (args.blocks is None):
+        parser.error('either --reference or --blocks is needed')
+    if args.reference is not None and args.genes is None:
+        parser.error('--reference needs --genes')
+    if args.blocks is not None and not 1 <= args.delete < args.blocks:
+        parser.error('--delete must be at least 1 and less than --blocks')
+    if args.blocks is not None and args.replicates is None and\
+       comb(args.blocks, args.delete) > 100000:
+        parser.error('too many combinations of blocks; use --replicates')
+    metrics.start(args)
+
+    try:
+        os.mkdir(args.outdir)
+        if args.verbose:
+            print(f'directory {args.outdir} created.')
+    except FileExistsError:
+        print('error: {} already exists.'.format(args.outdir))
+        sys.exit(1)
+
+    with stage('read_orthologs'):
+        orthos, groups = read_orthos(args.orthos)
+    if args.verbose:
+        print('Read orthologs.')
+    species = set()
+    values = dict()
+
+    name_pattern = re.compile(r'(?:\S+/)*(\w+)_(\w+)_values.tsv.gz', re.IGNORECASE)
+    for filename in args.values:
+        m = name_pattern.match(filename)
+        if m is None:
+            print('Ignored {}'.format(filename))
+            continue
+        sp_left, sp_right = m.group(1), m.group(2)
+        species.add(sp_left)
+        species.add(sp_right)
+        with stage('read_values'):
+            this_values = read_values(orthos, groups, sp_left, sp_right,
+                                      filename)
+            values = merge_with(merge, values, this_values)
+        count('values_files')
+        count('values_read', len(this_values))
+        if args.verbose:
+            print(f'Read {filename}')
+
+    species = sorted(species)
+    keys = list(values)
+    with stage('trait_matrix'):
+        traits = trait_matrix(species, [values[k] for k in keys])
+    mask = mode_mask(args.mode, traits)
+    count('values_kept', int(np.count_nonzero(mask)))
+
+    if args.reference is not None:
+        try:
+            reference = read_orthos_species(args.orthos, args.reference)
+        except KeyError as e:
+            print(f'error: {e}')
+            sys.exit(1)
+        genes = read_bed_table(args.genes)
+        nc = len(genes.chroms)
+        labels = chromosome_labels(keys, reference, genes)
+        nlabels = nc * nc + 1
+        removals = chromosome_removals(nc)
+        names = list(genes.chroms)
+    else:
+        labels = block_labels(keys, args.blocks, args.seed)
+        nlabels = args.blocks
+        removals, left_out = block_removals(args.blocks, args.delete,
+                                            args.replicates, args.seed)
+        names = [','.join(str(b) for b in blocks) for blocks in left_out]
+
+    # The statistics of each group of traits are computed once
+    with stage('partial_statistics'):
+        sums, counts = partial_statistics(traits, labels, nlabels, mask)
+    removed = removals @ np.bincount(labels[mask], minlength=nlabels)
+    if args.reference is not None:
+        # The chromosomes without traits would only repeat the full data
+        keep = removed > 0
+        removals, removed = removals[keep], removed[keep]
+        names = [n for n, k in zip(names, keep.tolist()) if k]
+
+    with stage('jackknife'):
+        full, matrices = jackknife(sums, counts, removals)
+    count('replicates', len(matrices))
+    if args.verbose:
+        print(f'Computed {len(matrices)} replicates.')
+
+    with open(f'{args.outdir}/full_data.phylip', 'w') as f:
+        write_phylip(f, species, full[None])
+    with open(f'{args.outdir}/replicates.tsv', 'w') as f:
+        f.write('replicate\tleft_out\ttraits_left_out\n')
+        for i, (name, n) in enumerate(zip(names, removed.tolist())):
+            f.write(f'{i}\t{name}\t{int(n)}\n')
+
+    if args.stack:
+        write_stack(f'{args.outdir}/all_replicates.dstack', species, matrices)
+        if args.verbose:
+            print(f'  Written {args.outdir}/all_replicates.dstack')
+    elif args.trees:
+        with stage('build_trees'):
+            newicks = build_trees(matrices, species, not args.no_nni,
+                                  args.jobs)
+        if args.one_file:
+            with open(f'{args.outdir}/all_replicates.nwk', 'w') as f:
+                for newick in newicks:
+                    f.write(newick)
+                    f.write('\n')
+        else:
+            for i, newick in enumerate(newicks):
+                with open(f'{args.outdir}/replicate_{i}.nwk', 'w') as f:
+                    f.write(newick)
+                    f.write('\n')
+    elif args.one_file:
+        with open(f'{args.outdir}/all_replicates.phylip', 'w') as f:
+            write_phylip(f, species, matrices)
+    else:
+        for i, matrix in enumerate(format_phylip(species, matrices)):
+            with open(f'{args.outdir}/replicate_{i}.phylip', 'w') as f:
+                f.write(matrix)
+                f.write('\n')
+
+    metrics.finish(args)
+
+
+if __name__ == '__main__':
+    main()
+    sys.exit(0)
@@ -16,11 +16,29 @@ The result is a data set with 5 columns:
 * (float) Hi-C value for gene 1 and 2 in species left
 * (float) Hi-C value for gene 1 and 2 in species right
 
-This table is written as TSV with no header row, in a Gzipped file.
+This table is written as TSV with no header row, in a block-Gzipped file.
+The rows of that file are indexed (see :doc:`/formats/index`), so it can
+be split in chunks for parallel readers.
+
+The left and right pairs files can also be the manifests (or the
+directories holding them) of pairs made with ``make_pairs --shards``
+(see :doc:`/formats/manifest`). In that case, with ``--jobs`` greater than
+1, the join is done in parallel, as a partitioned hash join: first, the
+shards are read and their records split in partitions by their pair of
+orthology groups, in parallel, in a temporary directory next to the
+output; then, the partitions are joined in parallel. Only the partitions
+being joined are held in memory. The rows are then written in the order
+of the partitions, not in the order of the pairs files.
+
+With the ``--stats`` option, the sufficient statistics of the `union` mode
+distance between the two species are computed from the rows written, and
+stored with the options of the join in a sidecar of the output (see
+:doc:`/formats/stats_sidecar`), used by ``dist_all_pairs --stats``. The
+output must then be named `{left}_{right}_values.tsv.gz`.
 
 
 :created: May 2018
-:last modified: July 2018
+:last modified: October 2026
 
 .. codeauthor::
    Sylvain PULICANI <pulicani@lirmm.fr>
@@ -28,15 +46,23 @@ This table is written as TSV with no header row, in a Gzipped file.
 
 import argparse
 import logging
+import tempfile
+import pickle
 import gzip
 import csv
+import re
 
 from math import isnan
-from os.path import splitext
-from collections import defaultdict
+from os.path import splitext, dirname, abspath
+from collections import defaultdict, deque
 from distutils.util import strtobool
+from concurrent.futures import ProcessPoolExecutor
 
-from iolib import read_orthos
+import metrics
+from metrics import stage, count
+from distlib import pair_statistics
+from iolib import (read_orthos, TableWriter, is_manifest, manifest_shards,
+                   write_stats)
 
 
 def select_lines(orthos, f):
@@ -56,6 +82,103 @@ def select_lines(orthos, f):
             yield record
 
 
+def read_shard(orthos, filename):
+    """
+    Read the shard *filename* of a sharded pairs file, and select its
+    records based on the presence of their genes in the set *orthos*.
+    Return a list of records.
+    """
+    with gzip.open(filename, 'rt') as f:
+        return list(select_lines(orthos, f))
+
+
+def open_pairs(orthos, name):
+    """
+    Open the pairs file *name* and select its records with
+    :func:`select_lines`. If *name* is a manifest, its shards are read one
+    after the other. Return a tuple (file object, generator of records);
+    the file object is None for a manifest.
+    """
+    if is_manifest(name):
+        return None, (record for shard in manifest_shards(name)
+                      for record in read_shard(orthos, shard))
+
+    if splitext(name)[1] == '.gz':
+        f = gzip.open(name, 'rt')
+    else:
+        f = open(name, 'r')
+    return f, select_lines(orthos, f)
+
+
+def group_key(groups, record):
+    """
+    Return the key of the pair of orthology groups of the genes of the
+    *record*, given the mapping *groups* of the genes to their group: the
+    sorted groups joined by a `_`.
+    """
+    gr = sorted((groups[record[0]], groups[record[1]]))
+    return f'{gr[0]}_{gr[1]}'
+
+
+_orthos = None
+"""The set of orthologs of a worker process (see :func:`init_worker`)."""
+
+_groups = None
+"""The orthology groups of a worker process (see :func:`init_worker`)."""
+
+
+def init_worker(orthos, groups):
+    """
+    Initialize a worker process of the parallel join: the set *orthos*
+    and the mapping *groups* of the genes to their orthology group are
+    given once to each worker, not with each task.
+    """
+    global _orthos, _groups
+    _orthos = orthos
+    _groups = groups
+
+
+def partition_pairs(name, prefix, npart):
+    """
+    Read the pairs file (or shard) *name*, select its records with
+    :func:`select_lines`, and split them in *npart* partitions by their
+    pair of orthology groups. The partition *p* is written in the file
+    `{prefix}_{p}`, as a pickled dict of the keys of the pairs of groups
+    (see :func:`group_key`) to the records.
+    Return the number of records selected.
+
+    This runs in a worker initialized by :func:`init_worker`.
+    """
+    parts = [{} for _ in range(npart)]
+    f, lines = open_pairs(_orthos, name)
+    n = 0
+    for record in lines:
+        gr = sorted((_groups[record[0]], _groups[record[1]]))
+        parts[hash((gr[0], gr[1])) % npart][f'{gr[0]}_{gr[1]}'] = tuple(record)
+        n += 1
+    if f is not None:
+        f.close()
+    for p, part in enumerate(parts):
+        with open(f'{prefix}_{p}', 'wb') as out:
+            pickle.dump(part, out, pickle.HIGHEST_PROTOCOL)
+    return n
+
+
+def join_partition(lefts, rights, adj_status, th, exclude):
+    """
+    Join the records of a partition, read from the files *lefts* and
+    *rights* written by :func:`partition_pairs`, and return the rows to
+    write, as :func:`get_records` with the other arguments.
+    """
+    records = defaultdict(dict)
+    for side, names in (('left', lefts), ('right', rights)):
+        for name in names:
+            with open(name, 'rb') as f:
+                for key, record in pickle.load(f).items():
+                    records[key][side] = record
+    return get_records(records, adj_status, th, exclude)
+
+
 def adjaceny_status(left, right):
     """
     Convert two booleans representing whether the genes are adjacent
@@ -147,6 +270,125 @@ def get_records(records, adj_status, th, exclude=False):
     return res
 
 
+def rows_statistics(rows):
+    """
+    Compute the sufficient statistics of the `union` mode distance over
+    the *rows* of a values file, as returned by :func:`get_records` (see
+    :func:`distlib.pair_statistics`). The rows with a NaN value are left
+    out, as by :func:`iolib.read_values`. Return a tuple (sum, count).
+    """
+    values = []
+    for row in rows:
+        left, right = float(row[4]), float(row[5])
+        if not isnan(left) and not isnan(right):
+            values.append({'left': left, 'right': right})
+    return pair_statistics('left', 'right', values)
+
+
+def stream_join(orthos, groups, args):
+    """
+    Join the left and right pairs files of *args* in this process, reading
+    them side by side: the records of a pair of orthology groups are held
+    until both are read. *orthos* and *groups* are the orthologs, as read
+    by :func:`iolib.read_orthos`.
+    This is a generator of lists of rows, as returned by
+    :func:`get_records`.
+    """
+    f1, lines1 = open_pairs(orthos, args.left)
+    logging.info('Opened left species pairs file.')
+    f2, lines2 = open_pairs(orthos, args.right)
+    logging.info('Opened right species pairs file.')
+
+    records = defaultdict(dict)
+    buf = []
+    i = 0
+    nleft, nright = 0, 0
+    while True:
+        try:
+            record1 = next(lines1)
+            records[group_key(groups, record1)]['left'] = tuple(record1)
+            nleft += 1
+        except StopIteration:
+            record1 = None
+
+        try:
+            record2 = next(lines2)
+            records[group_key(groups, record2)]['right'] = tuple(record2)
+            nright += 1
+        except StopIteration:
+            record2 = None
+
+        i += 1
+        if i >= 10000:
+            i = 0
+            with stage('get_records'):
+                buf.extend(get_records(records, args.adjacencies,
+                                       args.threshold, args.exclude))
+
+        if len(buf) >= 50000:
+            yield buf
+            buf = []
+
+        if record1 is None and record2 is None:
+            break
+
+    logging.info('Done iterating through pairs files.')
+    with stage('get_records'):
+        buf.extend(get_records(records, args.adjacencies, args.threshold,
+                               args.exclude))
+    if buf:
+        yield buf
+    count('rows_kept_left', nleft)
+    count('rows_kept_right', nright)
+
+    for fp in (f1, f2):
+        if fp is not None:
+            fp.close()
+
+
+def parallel_join(orthos, groups, args):
+    """
+    Join the left and right pairs files of *args* (manifests or files) in
+    *args.jobs* processes, as a partitioned hash join (see the top of this
+    file). There are as many partitions as shards in the largest manifest.
+    *orthos* and *groups* are the orthologs, as read by
+    :func:`iolib.read_orthos`.
+    This is a generator of lists of rows, one per partition, in the order
+    of the partitions.
+    """
+    names = {}
+    for side, name in (('left', args.left), ('right', args.right)):
+        names[side] = manifest_shards(name) if is_manifest(name) else [name]
+    npart = max(args.jobs, *(len(n) for n in names.values()))
+
+    outdir = dirname(abspath(args.outfile))
+    with tempfile.TemporaryDirectory(dir=outdir) as tmpdir,\
+         ProcessPoolExecutor(args.jobs, initializer=init_worker,
+                             initargs=(orthos, groups)) as executor:
+        with stage('partition'):
+            futures = {side: [executor.submit(partition_pairs, name,
+                                              f'{tmpdir}/{side}{i}', npart)
+                              for i, name in enumerate(shards)]
+                       for side, shards in names.items()}
+            for side, fs in futures.items():
+                count(f'rows_kept_{side}', sum(f.result() for f in fs))
+        logging.info('Done partitioning the pairs files.')
+
+        # Only a few partitions are joined in advance, so their rows are
+        # not all held in memory
+        pending = deque()
+        for p in range(npart):
+            parts = {side: [f'{tmpdir}/{side}{i}_{p}'
+                            for i in range(len(shards))]
+                     for side, shards in names.items()}
+            pending.append(executor.submit(join_partition, parts['left'],
+                                           parts['right'], args.adjacencies,
+                                           args.threshold, args.exclude))
+            if len(pending) > args.jobs:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
 
 def cli_parser():
     desc = ('Reads two pairs files (the left one and the right one) and join '
@@ -155,9 +397,11 @@ def cli_parser():
     parser.add_argument('orthos', help=('the orthologs file, can be a pair '
                                         'of species or not (see doc)'))
     parser.add_argument('left',
-                        help='the left pairs file, optionally Gzipped')
+                        help=('the left pairs file, optionally Gzipped, or '
+                              'the manifest of sharded pairs'))
     parser.add_argument('right',
-                        help='the right pairs file, optionally Gzipped')
+                        help=('the right pairs file, optionally Gzipped, or '
+                              'the manifest of sharded pairs'))
     parser.add_argument('outfile',
                         help='the output file, optionally Gzipped')
     parser.add_argument('-t', '--threshold', type=float,
@@ -168,85 +412,73 @@ def cli_parser():
     parser.add_argument('-a', '--adjacencies', default='all',
                         choices=['all', 'none', 'and', 'or', 'xor'],
                         help='the adjacencies status to keep')
+    parser.add_argument('-s', '--stats', action='store_true',
+                        help=('write the sufficient statistics sidecar of '
+                              'the output, used by dist_all_pairs --stats'))
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help=('the number of processes joining the pairs, '
+                              'if one of them is a manifest'))
+    parser.add_argument('-z', '--compress-level', type=int, default=6,
+                        choices=range(0, 10), metavar='[0-9]',
+                        help='the compression level of a gzipped output')
+    parser.add_argument('--compress-threads', type=int, default=1,
+                        help='the number of threads compressing the output')
     parser.add_argument('-v', '--verbose', action='store_true',
                         help='be verbose')
+    metrics.add_arguments(parser)
     return parser
 
 
 def main():
     parser = cli_parser()
     args = parser.parse_args()
+    if args.stats:
+        m = re.match(r'(?:\S+/)*(\w+)_(\w+)_values.tsv.gz', args.outfile,
+                     re.IGNORECASE)
+        if m is None:
+            parser.error('--stats needs an output named '
+                         '{left}_{right}_values.tsv.gz')
+        species = m.group(1), m.group(2)
 
     if args.verbose:
         level = logging.INFO
     else:
         level = logging.WARN
     logging.basicConfig(format='%(asctime)s: %(message)s', level=level)
+    metrics.start(args)
 
     logging.info("C'est parti !")
 
-    orthos, groups = read_orthos(args.orthos)
+    with stage('read_orthologs'):
+        orthos, groups = read_orthos(args.orthos)
     logging.info('Loaded orthologs.')
 
-    if splitext(args.left)[1] == '.gz':
-        f1 = gzip.open(args.left, 'rt')
-    else:
-        f1 = open(args.left, 'r')
-    lines1 = select_lines(orthos, f1)
-    logging.info('Opened left species pairs file.')
-
-    if splitext(args.right)[1] == '.gz':
-        f2 = gzip.open(args.right, 'rt')
-    else:
-        f2 = open(args.right, 'r')
-    lines2 = select_lines(orthos, f2)
-    logging.info('Opened right species pairs file.')
+    f = TableWriter(args.outfile, args.compress_level, args.compress_threads)
 
-    if splitext(args.outfile)[1] == '.gz':
-        f = gzip.open(args.outfile, 'wt')
+    if args.jobs > 1 and (is_manifest(args.left) or is_manifest(args.right)):
+        batches = parallel_join(orthos, groups, args)
     else:
-        f = open(args.outfile, 'w')
-    writer = csv.writer(f, delimiter='\t', lineterminator='\n')
-
-    records = defaultdict(dict)
-    buf = []
-    i = 0
-    while True:
-        try:
-            record1 = next(lines1)
-            gr = sorted((groups[record1[0]], groups[record1[1]]))
-            records[f'{gr[0]}_{gr[1]}']['left'] = tuple(record1)
-        except StopIteration:
-            record1 = None
-
-        try:
-            record2 = next(lines2)
-            gr = sorted((groups[record2[0]], groups[record2[1]]))
-            records[f'{gr[0]}_{gr[1]}']['right'] = tuple(record2)
-        except StopIteration:
-            record2 = None
-
-        i += 1
-        if i >= 10000:
-            i = 0
-            buf.extend(get_records(records, args.adjacencies,
-                                   args.threshold, args.exclude))
-
-        if len(buf) >= 50000:
-            writer.writerows(buf)
-            buf = []
-
-        if record1 is None and record2 is None:
-            break
-
-    logging.info('Done iterating through pairs files.')
-    buf.extend(get_records(records, args.adjacencies, args.threshold))
-    if buf:
-        writer.writerows(buf)
+        batches = stream_join(orthos, groups, args)
+
+    nwritten = 0
+    total, size = 0.0, 0
+    with stage('join'):
+        for buf in batches:
+            if args.stats:
+                t, n = rows_statistics(buf)
+                total, size = total + t, size + n
+            with stage('write'):
+                f.writerows(buf)
+            nwritten += len(buf)
+    count('rows_written', nwritten)
 
-    f1.close()
-    f2.close()
     f.close()
+    if args.stats:
+        join = {'Threshold': args.threshold, 'Adjacencies': args.adjacencies,
+                'Exclude': args.exclude}
+        write_stats(args.outfile, args.orthos, species, total, size, join)
+        logging.info(f'Written the sufficient statistics of {args.outfile}')
+    metrics.finish(args)
     logging.info(f'Written to {args.outfile}')
     logging.info("C'est fini !")
 
@@ -7,12 +7,13 @@ make_pairs.py
 Make the pairs of genes for a species.
 
 For each pair, fetch the Hi-C values for two bins where the TSS
-are located. Also check the adjacency of the genes. If wanted,
+are located. Also check the adjacency of the genes: two genes are
+adjacent if they are next to each other on the same chromosome. If wanted,
 the Hi-C matrices can be scrambled in-memory before use. This
 feature uses two functions written by Krister SWENSON for the
-**locality** program.
+**locality** program. Given a seed, the scrambling is reproducible.
 
-The result is a TSV file, optionally Gzipped (if the file name has
+The result is a TSV file, optionally block-Gzipped (if the file name has
 the extension .gz). The file has no header and the following columns:
 
 * gene 1 name (string)
@@ -20,9 +21,46 @@ the extension .gz). The file has no header and the following columns:
 * Hi-C value (64 bits float)
 * Adjacency status (either True or False, case-insensitive)
 
+The pairs are written by pairs of chromosomes, so each Hi-C matrix is
+loaded only once. If the output is Gzipped, it is indexed by pairs of
+chromosomes (see :doc:`/formats/index`).
+
+With the ``--extra`` option, the pairs are also made with other Hi-C
+directories, *e.g.* the same data at other resolutions, and written in
+other outputs. The pairs of genes and their adjacencies are computed once
+for all the outputs: only the contacts are fetched from each dataset.
+
+With the ``--sample-fraction`` or ``--sample-size`` option, only a sample
+of the pairs of orthology groups is written, to compute approximate
+distances quickly (see :mod:`sampling`). The sample only depends on the
+orthologs file (given with ``--orthologs``) and on the seed, so all species
+sample the same pairs; the pairs of genes without orthologs are skipped.
+With ``--sample-size``, the sampled fraction is the size divided by the
+number of pairs of orthology groups, so it is the same for all species.
+With ``--strata-genes``, the sample is stratified by the genomic distance
+between the genes in a reference species, and whether they are on the same
+chromosome there: each stratum has its own fraction (``--stratum-fraction``),
+and ``--sample-size`` is split evenly between the strata.
+
+With the ``--max-distance`` option, only the pairs of genes on the same
+chromosome, whose TSS are at most that distance apart, are written. The
+pairs are enumerated by a sweep over the sorted genes, and only a band
+around the diagonal of the Hi-C matrices is loaded: both the number of
+pairs and the memory needed are linear in the length of the chromosomes.
+This option cannot be used with ``--scramble``, since the scrambling needs
+the whole matrices.
+
+With the ``--shards`` option, the output is a directory, with one file
+(a shard) per pair of chromosomes and a manifest recording the completed
+shards (see :doc:`/formats/manifest`). If the run is interrupted, running
+it again skips the completed shards, provided the inputs and the options
+changing the pairs are the same; otherwise, all the shards are written
+again. The manifest can be given to :doc:`join_pairs` instead of a pairs
+file.
+
 
 :created: May 2018
-:last modified: July 2018
+:last modified: October 2026
 
 .. codeauthor::
    Sylvain PULICANI <pulicani@lirmm.fr>
@@ -30,16 +68,324 @@ the extension .gz). The file has no header and the following columns:
 
 import argparse
 import logging
-import gzip
-import csv
 import sys
+import os
+
+from itertools import combinations_with_replacement
 
-from math import isnan
-from os.path import splitext
-from itertools import combinations
+import numpy as np
 
 import hic
-from genes import read_bed, compute_adjacent
+import metrics
+from metrics import stage, count
+from genes import read_bed_table
+from iolib import (TableWriter, read_manifest, write_manifest, checksum,
+                   read_orthos)
+import sampling
+from sampling import sample_mask
+
+
+BLOCK_SIZE = 100000
+"""The maximum number of pairs of genes processed at once."""
+
+
+def block_pairs(n1, n2, intra):
+    """
+    Enumerate the pairs of genes of a pair of chromosomes, with *n1* genes
+    on the first chromosome and *n2* on the second. If *intra* is True,
+    the chromosomes are the same, and each pair is enumerated once.
+    This is a generator of couples of arrays (indices of the genes on the
+    first chromosome, indices of the genes on the second chromosome), each
+    holding at most :data:`BLOCK_SIZE` pairs (or one row of pairs), in the
+    same order as `itertools.combinations` or `itertools.product`.
+    """
+    step = max(1, BLOCK_SIZE // max(n2, 1))
+    for first in range(0, n1, step):
+        rows = np.arange(first, min(first + step, n1))
+        if intra:
+            # Row i is paired with the genes i+1, ..., n1-1
+            counts = n1 - 1 - rows
+            ii = np.repeat(rows, counts)
+            starts = np.repeat(np.cumsum(counts) - counts, counts)
+            yield ii, ii + 1 + np.arange(len(ii)) - starts
+        else:
+            yield np.repeat(rows, n2), np.tile(np.arange(n2), len(rows))
+
+
+def band_pairs(starts, max_distance):
+    """
+    Enumerate the pairs of genes of a chromosome whose TSS are at most
+    *max_distance* apart, given the sorted array of TSS *starts*. The band
+    of each gene is found by a binary search, so the pairs out of the band
+    are never enumerated.
+    This is a generator of couples of arrays, as :func:`block_pairs`
+    (with *intra* True), each holding about :data:`BLOCK_SIZE` pairs.
+    """
+    n = len(starts)
+    # Row i is paired with the genes i+1, ..., ends[i]-1
+    ends = np.searchsorted(starts, starts + max_distance, side='right')
+    counts = ends - 1 - np.arange(n)
+    cuts = np.searchsorted(np.cumsum(counts),
+                           np.arange(BLOCK_SIZE, counts.sum(), BLOCK_SIZE))
+    bounds = [0] + sorted(set(cuts.tolist() + [n]))
+    for first, last in zip(bounds[:-1], bounds[1:]):
+        rows = np.arange(first, last)
+        c = counts[first:last]
+        ii = np.repeat(rows, c)
+        offsets = np.repeat(np.cumsum(c) - c, c)
+        yield ii, ii + 1 + np.arange(len(ii)) - offsets
+
+
+def pair_options(no_nan=False, intra=False, scramble=False, seed=None,
+                 max_distance=None, sample_fraction=None, sample_seed=0,
+                 strata=None):
+    """
+    Return the options of the pairs made by :func:`chromosome_blocks`,
+    :func:`block_values` and the functions using them, when they are not
+    parsed from the command line (*e.g.* by :doc:`phylohic`). The options
+    are the ones of the script, with the same defaults.
+    Return an `argparse.Namespace`.
+    """
+    return argparse.Namespace(no_nan=no_nan, intra=intra, scramble=scramble,
+                              seed=seed, max_distance=max_distance,
+                              sample_fraction=sample_fraction,
+                              sample_seed=sample_seed, strata=strata)
+
+
+def chromosome_blocks(genes, exp, args):
+    """
+    Return the list of the pairs of chromosomes (as couples of indices in
+    *genes*, a :class:`genes.GeneTable`) for which pairs of genes are
+    made, given the Hi-C experiment *exp* and the options *args*.
+    """
+    blocks = []
+    skipped = 0
+    codes = range(len(genes.chroms))
+    for a, b in combinations_with_replacement(codes, 2):
+        c1, c2 = genes.chroms[a], genes.chroms[b]
+        if c1 not in exp.chromosomes or c2 not in exp.chromosomes:
+            continue
+        if c1 != c2 and args.intra:
+            continue
+        if c1 != c2 and args.max_distance is not None:
+            skipped += 1
+            continue
+        blocks.append((a, b))
+    if skipped:
+        logging.warning('--max-distance skips the inter-chromosomal pairs '
+                        f'of genes ({skipped} pairs of chromosomes); add '
+                        '--intra to skip them knowingly')
+    return blocks
+
+
+def map_band(exp, args):
+    """
+    Return the band (in bins) of the matrices of *exp* to load, given the
+    ``--max-distance`` option in *args*; None for the whole matrices.
+    """
+    if args.max_distance is None:
+        return None
+    # TSS at most max_distance apart can be one more bin apart
+    return args.max_distance // exp.binsize + 1
+
+
+def block_values(exps, genes, a, b, args, groups=None):
+    """
+    Enumerate the pairs of genes on the pairs of chromosomes of indices *a*
+    and *b* (in *genes*, a :class:`genes.GeneTable`), and fetch their
+    contacts in each of the Hi-C experiments *exps* (:class:`hic.HiC`,
+    *e.g.* the same data at several resolutions). The pairs are enumerated
+    once, whatever the number of experiments. *args* holds the options,
+    as parsed from the command line or made by :func:`pair_options`.
+    If *groups* (the array of the orthology groups of the genes, -1 for
+    the genes without orthologs) is given, only the sampled pairs are
+    made (see :mod:`sampling`); with *args.strata*, *args.sample_fraction*
+    is the dict of the fractions of the strata.
+    This is a generator of tuples (indices of the first genes, indices of
+    the second genes, list of arrays of contacts, one per experiment). The
+    contacts are None for an experiment without matrix for this pair of
+    chromosomes.
+    """
+    c1, c2 = genes.chroms[a], genes.chroms[b]
+    status = []
+    for exp in exps:
+        loaded = c1 == c2 or exp.inter
+        if loaded:
+            try:
+                exp.load_map(c1, c2, args.scramble, args.seed,
+                             map_band(exp, args))
+                logging.debug(f'Loaded {c1} x {c2}')
+            except hic.NoSuchHeatmap as e:
+                logging.warning(e)
+                loaded = None
+        status.append(loaded)
+    if all(s is None for s in status):
+        return
+
+    lo1, hi1 = genes.chrom_range(a)
+    lo2, hi2 = genes.chrom_range(b)
+    if args.max_distance is None:
+        pairs = block_pairs(hi1 - lo1, hi2 - lo2, a == b)
+    else:
+        pairs = band_pairs(genes.start[lo1:hi1], args.max_distance)
+    for ii, jj in pairs:
+        ii += lo1
+        jj += lo2
+        if groups is not None:
+            g1, g2 = groups[ii], groups[jj]
+            keep = (g1 >= 0) & (g2 >= 0)
+            keep[keep] = sample_mask(g1[keep], g2[keep], args.sample_fraction,
+                                     args.sample_seed, args.strata)
+            ii, jj = ii[keep], jj[keep]
+        count('pairs_made', len(ii))
+
+        values = []
+        with stage('get_contacts'):
+            for exp, loaded in zip(exps, status):
+                if loaded is None:
+                    values.append(None)
+                elif loaded:
+                    values.append(exp.get_contacts(
+                        np.full(len(ii), c1), genes.start[ii],
+                        np.full(len(jj), c2), genes.start[jj],
+                        band=map_band(exp, args)))
+                else:
+                    values.append(np.full(len(ii), float('nan')))
+        yield ii, jj, values
+
+
+def format_rows(genes, ii, jj, values, adjacent, no_nan=False):
+    """
+    Format the pairs of genes of indices *ii* and *jj* (in *genes*), with
+    their contacts *values* and their *adjacent* status, as rows of a
+    pairs file. If *no_nan* is True, the pairs whose contact is
+    Not-a-Number are skipped.
+    Return a list of rows.
+    """
+    if no_nan:
+        keep = ~np.isnan(values)
+        ii, jj, values, adjacent = (ii[keep], jj[keep], values[keep],
+                                    adjacent[keep])
+    names = genes.names
+    return [[names[i], names[j], str(value), str(adj)]
+            for i, j, value, adj in zip(ii.tolist(), jj.tolist(),
+                                        values.tolist(), adjacent.tolist())]
+
+
+def block_rows(exp, genes, a, b, args, groups=None):
+    """
+    Make the pairs of genes on the pairs of chromosomes of indices *a*
+    and *b*, with their contacts in *exp*. See :func:`block_values` for
+    the other arguments.
+    This is a generator of lists of rows, as written in the pairs file.
+    """
+    for ii, jj, (values,) in block_values([exp], genes, a, b, args, groups):
+        yield format_rows(genes, ii, jj, values, genes.adjacent(ii, jj),
+                          args.no_nan)
+
+
+def write_block(exps, genes, a, b, args, outfiles, groups=None):
+    """
+    Write the pairs of genes on the pairs of chromosomes of indices *a*
+    and *b*, with their contacts in each of the experiments *exps*, in the
+    corresponding *outfiles* (:class:`iolib.TableWriter`). See
+    :func:`block_values` for the other arguments.
+    Return the number of pairs written in the first file.
+    """
+    c1, c2 = genes.chroms[a], genes.chroms[b]
+    nrows = 0
+    for ii, jj, values in block_values(exps, genes, a, b, args, groups):
+        # The adjacencies are computed once for all the experiments
+        adjacent = genes.adjacent(ii, jj)
+        for k, (v, outfile) in enumerate(zip(values, outfiles)):
+            if v is None:
+                continue
+            with stage('format_rows'):
+                buf = format_rows(genes, ii, jj, v, adjacent, args.no_nan)
+            with stage('write'):
+                outfile.writerows(buf, f'{c1}|{c2}')
+            count('rows_written', len(buf))
+            if k == 0:
+                nrows += len(buf)
+        logging.debug('Write')
+    return nrows
+
+
+def shard_options(args):
+    """
+    Return the options of the run *args* changing the pairs written, as
+    recorded in the manifest of a sharded output: a dict.
+    """
+    sampled = args.sample_fraction is not None
+    stratified = sampled and args.strata is not None
+    return {'NoNaN': args.no_nan, 'Intra': args.intra,
+            'Scramble': args.scramble,
+            'Seed': args.seed if args.scramble else None,
+            'MaxDistance': args.max_distance,
+            'Orthologs': os.path.abspath(args.orthologs) if sampled else None,
+            'SampleFraction': args.sample_fraction,
+            'SampleSeed': args.sample_seed if sampled else None,
+            'StrataGenes': (os.path.abspath(args.strata_genes)
+                            if stratified else None),
+            'StrataBins': list(args.strata_bins) if stratified else None}
+
+
+def write_shards(exp, genes, blocks, args, groups=None):
+    """
+    Write the pairs of genes of each of the *blocks* (pairs of indices of
+    chromosomes in *genes*) in its own file (a shard) in the directory
+    *args.output*, and record the completed shards in a manifest. The
+    shards already recorded in the manifest, and whose checksum matches,
+    are skipped; thus, an interrupted run can be resumed. If the manifest
+    was written with other inputs or options (see :func:`shard_options`),
+    or if the matrices are scrambled without a seed, all the shards are
+    written again.
+    *groups* is used to sample the pairs (see :func:`write_block`).
+    """
+    os.makedirs(args.output, exist_ok=True)
+    previous = read_manifest(args.output)
+    manifest = {'Genes': os.path.abspath(args.genes),
+                'HiC': os.path.abspath(args.hic),
+                'Options': shard_options(args), 'Shards': []}
+    done = {}
+    if args.scramble and args.seed is None:
+        if previous['Shards']:
+            logging.warning('The matrices are scrambled without a seed: '
+                            'the completed shards are written again.')
+    elif any(previous.get(k) != manifest[k]
+             for k in ('Genes', 'HiC', 'Options')):
+        if previous['Shards']:
+            logging.warning('The inputs or the options changed since the '
+                            'shards were written: they are written again.')
+    else:
+        for shard in previous['Shards']:
+            name = f'{args.output}/{shard["File"]}'
+            if os.path.isfile(name) and checksum(name) == shard['SHA256']:
+                done[shard['Key']] = shard
+    manifest['Shards'] = list(done.values())
+
+    for a, b in blocks:
+        c1, c2 = genes.chroms[a], genes.chroms[b]
+        key = f'{c1}|{c2}'
+        if key in done:
+            logging.info(f'Skipping {key}: already done.')
+            count('shards_skipped')
+            continue
+
+        filename = f'{c1}_{c2}.tsv.gz'
+        outfile = TableWriter(f'{args.output}/{filename}', args.compress_level,
+                              args.compress_threads)
+        nrows = write_block([exp], genes, a, b, args, [outfile], groups)
+        outfile.close()
+
+        manifest['Shards'].append({
+            'Key': key,
+            'File': filename,
+            'Rows': nrows,
+            'SHA256': checksum(f'{args.output}/{filename}')
+        })
+        write_manifest(args.output, manifest)
+        logging.info(f'Written {filename}')
 
 
 def cli_parser():
@@ -48,7 +394,9 @@ def cli_parser():
     parser.add_argument('genes', help='the genes, in BED')
     parser.add_argument('hic',
                         help='the directory with the Hi-C sparses matrices')
-    parser.add_argument('output', help='explicit enough; can be gzipped')
+    parser.add_argument('output',
+                        help=('explicit enough; can be gzipped; a directory '
+                              'with --shards'))
     parser.add_argument('-N', '--no-nan', action='store_true',
                         help='skip the pair if the Hi-C value is Not-a-Number')
     parser.add_argument('-i', '--intra', action='store_true',
@@ -57,16 +405,61 @@ def cli_parser():
                               'values, Not-a-Number is used'))
     parser.add_argument('-s', '--scramble', action='store_true',
                         help='Scramble in-memory the Hi-C matrices before use')
+    parser.add_argument('--seed', type=int,
+                        help=('the seed used to scramble the matrices, for '
+                              'reproducible scrambling'))
+    parser.add_argument('-d', '--max-distance', type=int,
+                        help=('only look at genes on the same chromosomes '
+                              'whose TSS are at most this distance apart '
+                              '(in bp); only the band of the Hi-C matrices '
+                              'around the diagonal is loaded'))
+    parser.add_argument('-o', '--orthologs',
+                        help=('the orthologs file, needed to sample the '
+                              'pairs (see doc)'))
+    sample = parser.add_mutually_exclusive_group()
+    sample.add_argument('--sample-fraction', type=float,
+                        help=('only write this fraction of the pairs of '
+                              'orthology groups'))
+    sample.add_argument('--sample-size', type=int,
+                        help=('only write about this number of pairs of '
+                              'orthology groups'))
+    parser.add_argument('--sample-seed', type=int, default=0,
+                        help=('the seed used to sample the pairs; use the '
+                              'same for all species (default: 0)'))
+    sampling.add_arguments(parser)
+    parser.add_argument('-e', '--extra', nargs=2, action='append', default=[],
+                        metavar=('HIC', 'OUTPUT'),
+                        help=('also make the pairs with this Hi-C directory '
+                              '(e.g. the same data at another resolution), '
+                              'and write them in this output; can be given '
+                              'several times'))
+    parser.add_argument('-S', '--shards', action='store_true',
+                        help=('write one gzipped file per pair of chromosomes '
+                              'in the output directory, with a manifest; '
+                              'an interrupted run can be resumed'))
+    parser.add_argument('-z', '--compress-level', type=int, default=6,
+                        choices=range(0, 10), metavar='[0-9]',
+                        help='the compression level of a gzipped output')
+    parser.add_argument('--compress-threads', type=int, default=1,
+                        help='the number of threads compressing the output')
     parser.add_argument('-v', '--verbose', action='store_true',
                         help='be verbose')
     parser.add_argument('--debug', action='store_true',
                         help='print debug information')
+    metrics.add_arguments(parser)
     return parser
 
 
 def main():
     parser = cli_parser()
     args = parser.parse_args()
+    if args.max_distance is not None and args.scramble:
+        parser.error('--max-distance cannot be used with --scramble')
+    if args.extra and args.shards:
+        parser.error('--extra cannot be used with --shards')
+    sampled = sampling.check_arguments(parser, args)
+    if sampled and args.orthologs is None:
+        parser.error('--sample-fraction and --sample-size need --orthologs')
 
     if args.verbose and not args.debug:
         level = logging.INFO
@@ -75,65 +468,56 @@ def main():
     else:
         level = logging.WARN
     logging.basicConfig(format='%(asctime)s: %(message)s', level=level)
+    metrics.start(args)
 
     logging.info("C'est parti !")
 
-    genes = read_bed(args.genes)
-    adjacencies = compute_adjacent(genes)
+    with stage('read_genes'):
+        genes = read_bed_table(args.genes)
+    count('genes', len(genes))
     logging.info('Loaded genes.')
 
     exp = hic.HiC(args.hic)
+    extras = [hic.HiC(h) for h, _ in args.extra]
     logging.info('Loaded Hi-C')
 
-    if splitext(args.output)[1] == '.gz':
-        outfile = gzip.open(args.output, 'wt')
-    else:
-        outfile = open(args.output, 'w')
-
-    writer = csv.writer(outfile, delimiter='\t', lineterminator='\n')
-    logging.info('Beginning to write pairs...')
-
-    buf = []
-    for g1, g2 in combinations(genes, 2):
-        c1 = g1['chrom']
-        c2 = g2['chrom']
-
-        if c1 not in exp.chromosomes or c2 not in exp.chromosomes:
-            continue
-        if c1 != c2 and args.intra:
-            continue
-        if c1 != c2 and not exp.inter:
-            value = float('nan')
+    groups = None
+    args.strata = None
+    if sampled:
+        with stage('read_orthologs'):
+            _, orthogroups = read_orthos(args.orthologs)
+        groups = np.array([orthogroups.get(n, -1) for n in genes.names],
+                          dtype=np.int64)
+        args.strata, fractions = sampling.from_arguments(parser, args,
+                                                         orthogroups)
+        if args.strata is not None:
+            args.sample_fraction = fractions
+            logging.info('Sampling the strata at '
+                         + ', '.join(f'{f:.2%} ({name})'
+                                     for name, f in fractions.items()))
         else:
-            if (c1, c2) != exp.current['chroms'] and\
-               (c2, c1) != exp.current['chroms']:
-                try:
-                    exp.load_map(c1, c2, args.scramble)
-                    logging.debug(f'Loaded {c1} x {c2}')
-                    logging.debug(f'  len(buf) = {len(buf)}')
-                except hic.NoSuchHeatmap as e:
-                    logging.warn(e)
-                    continue
-
-            value = exp.get_contact(g1, g2)
-
-        if args.no_nan and isnan(value):
-            continue
+            if args.sample_size is not None:
+                # The same fraction for all species: it depends only on the
+                # number of orthology groups
+                ngroups = len(set(orthogroups.values()))
+                args.sample_fraction = args.sample_size / (ngroups *
+                                                           (ngroups + 1) / 2)
+            logging.info(f'Sampling {args.sample_fraction:.2%} of the pairs')
 
-        a1 = adjacencies[g1['name']]
-        adj = a1['left'] == g2['name'] or a1['left'] == g2['name']
+    blocks = chromosome_blocks(genes, exp, args)
 
-        # TODO: faire la même avec a2, normalement on devrait avoir le même résultat
-
-        buf.append([g1['name'], g2['name'], str(value), str(adj)])
-        if len(buf) == 100000:
-            writer.writerows(buf)
-            buf = []
-            logging.debug('Write')
+    logging.info('Beginning to write pairs...')
+    if args.shards:
+        write_shards(exp, genes, blocks, args, groups)
+    else:
+        outfiles = [TableWriter(o, args.compress_level, args.compress_threads)
+                    for o in [args.output] + [o for _, o in args.extra]]
+        for a, b in blocks:
+            write_block([exp] + extras, genes, a, b, args, outfiles, groups)
+        for outfile in outfiles:
+            outfile.close()
 
-    if buf:
-        writer.writerows(buf)
-    outfile.close()
+    metrics.finish(args)
     logging.info("C'est fini !")
 
 
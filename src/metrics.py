@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+metrics
+=======
+
+This module contains the instrumentation shared by the scripts: named
+stage timers, counters and the peak resident memory of the process, all
+written at the end of a run in a single JSON metrics file (see
+:doc:`/formats/metrics`). The whole run can also be profiled with
+`cProfile`.
+
+The measures are collected in a process-wide :class:`Metrics` object, so
+the modules can count what they do (*e.g.* :mod:`hic` counts the maps
+loaded) without passing it around::
+
+  from metrics import stage, count
+
+  with stage('read'):
+      rows = read_rows()
+  count('rows_read', len(rows))
+
+A script adds the options with :func:`add_arguments`, and calls
+:func:`start` after parsing its arguments and :func:`finish` at the end
+of its run. Without the ``--metrics`` option, nothing is written.
+
+
+:created: October 2026
+:last modified: October 2026
+
+.. codeauthor::
+   Sylvain PULICANI <pulicani@lirmm.fr>
+"""
+
+import cProfile
+import datetime
+import resource
+import json
+import time
+import sys
+import os
+
+from contextlib import contextmanager
+
+
+def _proc_status(field):
+    """
+    Read the *field* (in kB) of `/proc/self/status`, and return it in
+    bytes; None if it is not available (*e.g.* not on Linux).
+    """
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith(f'{field}:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def peak_rss():
+    """
+    Return the peak resident memory of the process, in bytes.
+
+    On Linux, this is the high-water mark of the process memory
+    (`VmHWM`), which is not inherited from the parent of a spawned
+    process, and can be reset by :func:`reset_peak_rss`. Elsewhere, this
+    is the `ru_maxrss` of the process.
+    """
+    peak = _proc_status('VmHWM')
+    if peak is not None:
+        return peak
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != 'darwin':  # Linux reports kilobytes
+        peak *= 1024
+    return peak
+
+
+def current_rss():
+    """
+    Return the current resident memory of the process, in bytes, or its
+    peak (see :func:`peak_rss`) if it is not available.
+    """
+    rss = _proc_status('VmRSS')
+    if rss is not None:
+        return rss
+    return peak_rss()
+
+
+def reset_peak_rss():
+    """
+    Reset the peak resident memory of the process to its current one, if
+    possible (on Linux). Return True if it was reset.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+class Metrics:
+    """
+    Metrics holds the measures of a run: the time spent in each named
+    stage (a stage can be entered several times, its times are summed)
+    and the counters.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.date = datetime.datetime.now().isoformat(timespec='seconds')
+        self.stages = {}
+        """The time spent in each stage, in seconds."""
+
+        self.calls = {}
+        """The number of times each stage was entered."""
+
+        self.counters = {}
+
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Time the *name* stage: a context manager.
+        """
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = (self.stages.get(name, 0.0)
+                                 + time.perf_counter() - t)
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+
+    def count(self, name, n=1):
+        """
+        Add *n* to the counter *name*.
+        """
+        self.counters[name] = self.counters.get(name, 0) + n
+
+
+    def merge(self, measures):
+        """
+        Add the *measures* of another process (as returned by
+        :meth:`to_dict`, *e.g.* a worker's) to these ones.
+        """
+        for k, v in measures['stages'].items():
+            self.stages[k] = self.stages.get(k, 0.0) + v['seconds']
+            self.calls[k] = self.calls.get(k, 0) + v['calls']
+        for k, v in measures['counters'].items():
+            self.count(k, v)
+
+
+    def to_dict(self):
+        """
+        Return the measures as a dict, as written in the metrics file.
+        """
+        return {'script': os.path.basename(sys.argv[0]),
+                'argv': sys.argv[1:],
+                'date': self.date,
+                'pid': os.getpid(),
+                'seconds': round(time.perf_counter() - self.start, 6),
+                'peak_rss_mb': round(peak_rss() / 1024**2, 1),
+                'stages': {k: {'seconds': round(v, 6),
+                               'calls': self.calls[k]}
+                           for k, v in self.stages.items()},
+                'counters': dict(self.counters)}
+
+
+    def write(self, name):
+        """
+        Write the measures in the JSON file *name*.
+        """
+        with open(name, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+            f.write('\n')
+
+
+METRICS = Metrics()
+"""The measures of the current process."""
+
+_profiler = None
+
+
+def stage(name):
+    """
+    Time the *name* stage of the current process: a context manager (see
+    :meth:`Metrics.stage`).
+    """
+    return METRICS.stage(name)
+
+
+def count(name, n=1):
+    """
+    Add *n* to the counter *name* of the current process.
+    """
+    METRICS.count(name, n)
+
+
+def reset():
+    """
+    Drop the measures of the current process, *e.g.* in a worker process
+    which inherited them from its parent.
+    """
+    global METRICS
+    METRICS = Metrics()
+
+
+def add_arguments(parser):
+    """
+    Add the ``--metrics`` and ``--profile`` options to the argparse
+    *parser*.
+    """
+    parser.add_argument('--metrics', metavar='FILE',
+                        help='write the timings and counters in this JSON file')
+    parser.add_argument('--profile', metavar='FILE',
+                        help=('profile the run with cProfile, and dump the '
+                              'statistics in this file'))
+
+
+def start(args):
+    """
+    Start measuring the run of a script, given its parsed *args* (see
+    :func:`add_arguments`). The measures made before, *e.g.* when the
+    modules were imported, are dropped.
+    """
+    global _profiler
+    reset()
+    if args.profile is not None:
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+
+
+def finish(args):
+    """
+    Stop measuring the run of a script, and write the metrics and the
+    profile statistics if asked for in *args*.
+    """
+    global _profiler
+    if _profiler is not None:
+        _profiler.disable()
+        _profiler.dump_stats(args.profile)
+        _profiler = None
+    if args.metrics is not None:
+        METRICS.write(args.metrics)
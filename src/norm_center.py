@@ -10,18 +10,29 @@ on each dataset.
 
 The first step consists of the following process:
 
-1. All matrices are read into memory.
-2. The mean and standard deviation are computed.
-3. For each box of the matrices, the mean is subtracted from the box,
+1. The mean and standard deviation are computed, reading the matrices
+   one at a time.
+2. For each box of the matrices, the mean is subtracted from the box,
    then the box is divided by the standard deviation.
-4. The normalized matrices are written.
+3. The normalized matrices are written.
+
+The datasets are normalized in parallel. The memory needed for each one is
+estimated from the dimensions of its largest matrix, and a dataset is
+started only if it fits in the memory budget (see ``--max-memory``). The
+peak memory of each dataset is logged, so the estimation can be checked.
 
 The second step is simple: we just add to each box in each matrix from
-each dataset the minimum value over all dataset.
+each dataset the absolute value of the minimum over all dataset. This value
+is stored as the `Offset` field of the metadata of each normalized dataset,
+and is added when the matrices are loaded, so the matrices are not
+rewritten. The minimum of each normalized dataset is also stored in its
+metadata (the `Minimum` field), thus a new dataset can be added to an
+already normalized collection (see the ``--collection`` option): only the
+offset of the datasets of the collection is updated.
 
 
 :created: August 2018
-:last modified: August 2018
+:last modified: October 2026
 
 .. codeauthor::
    Sylvain PULICANI <pulicani@lirmm.fr>
@@ -29,33 +40,55 @@ each dataset the minimum value over all dataset.
 
 
 import os
-import csv
+import json
 import sys
-import gzip
 import logging
 import argparse
+import multiprocessing
 import concurrent.futures
 from shutil import copyfile
 from os.path import abspath, basename
-from itertools import combinations_with_replacement, product
+from itertools import combinations_with_replacement
 
 import numpy as np
 
-from hic import HiC, NoSuchHeatmap
+import metrics
+from hic import HiC, NoSuchHeatmap, update_metadata
+from hic import READ_CHUNK_SIZE, WRITE_CHUNK_SIZE
+from metrics import stage, count
+from statslib import Moments
+
+
+def dataset_moments(hicdata):
+    """
+    Compute the mean and standard deviation of the whole *hicdata* in a
+    streaming pass: the matrices are loaded one at a time.
+    Return a :class:`statslib.Moments`.
+    """
+    moments = Moments()
+    for c1, c2 in hicdata.iter_maps():
+        moments.update(hicdata.current['data'])
+    return moments
 
 
-def normalize(hicdata, outdir):
+def normalize(hicdata, outdir, compresslevel=9, threads=1):
     """
-    Normalize the *hicdata* and write them in *outdir*.
+    Normalize the *hicdata* and write them in *outdir*. The gzipped
+    matrices are compressed at *compresslevel*, using *threads* threads.
     Return the minimum value of the normalized data.
+
+    This is done in two passes over the matrices: the first computes the
+    mean and standard deviation, the second writes the normalized matrices.
+    Thus, only one matrix is in memory at a time.
     """
-    hicdata.load_all_maps()
-    mean = np.mean(hicdata.current['data'])
-    stddev = np.std(hicdata.current['data'])
+    with stage('moments'):
+        moments = dataset_moments(hicdata)
+    mean = moments.mean
+    stddev = moments.stddev
     minimum = float('+inf')
 
     dd = basename(abspath(outdir))
-    logging.debug(f'{dd}: Done loading all maps.')
+    logging.debug(f'{dd}: Done computing the mean and std. dev.')
     try:
         os.mkdir(outdir)
         logging.debug(f'{outdir} created.')
@@ -69,26 +102,20 @@ def normalize(hicdata, outdir):
         except NoSuchHeatmap:
             continue
 
-        m = hicdata.current['data'] - mean
-        m /= stddev
-        minimum = min(minimum, np.min(m))
+        with stage('normalize'):
+            m = hicdata.current['data'] - mean
+            m /= stddev
+            minimum = min(minimum, np.min(m))
 
-        rows = []
-        for i, j in product(*map(range, hicdata.current['dims'])):
-            if m[i, j] == 0.0:
-                continue
-            rows.append([i*hicdata.binsize, j*hicdata.binsize, m[i, j]])
-
-        c1, c2 = hicdata.current['chroms']
-        filename = hicdata._mapfiles[f'{c1}|{c2}']
-        logging.debug(f'{dd}: rows prepared for {filename}.')
-        with gzip.open(f'{outdir}/{filename}', 'wt') as f:
-            writer = csv.writer(f, delimiter='\t')
-            writer.writerows(rows)
-
-            logging.debug(f'{dd}: written {filename}.')
+        with stage('write_map'):
+            filename = hicdata.write_map(outdir, m, compresslevel, threads)
+        count('maps_written')
+        logging.debug(f'{dd}: written {filename}.')
 
+    # The offset of the original dataset, if any, has been applied when
+    # loading the matrices
     copyfile(f'{hicdata.datadir}/metadata.json', f'{outdir}/metadata.json')
+    update_metadata(outdir, {'Offset': 0.0, 'Minimum': float(minimum)})
 
     logging.info(f'Done normalizing {dd}.')
     logging.info(f'  Minimum is {minimum}')
@@ -96,61 +123,188 @@ def normalize(hicdata, outdir):
     return minimum
 
 
-def add_hic(hicdata, value):
+def set_offset(dirname, value):
     """
-    Substrat *value* from each box of each matrix of the *hicdata*.
+    Set the offset of the normalized dataset *dirname* to *value*. The
+    offset is added to each box of each matrix when loading them (see
+    :class:`hic.HiC`), thus the matrices themselves are not rewritten.
+    """
+    update_metadata(dirname, {'Offset': value})
+    dd = basename(abspath(dirname))
+    logging.info(f'Done setting the offset of dataset {dd} to {value}')
+
 
-    .. Warning:: This is done **in-place**.
+def read_minimum(dirname):
     """
-    dd = basename(abspath(hicdata.datadir))
-    logging.debug(f'{dd}: beginning loop')
-    logging.debug(f'      {hicdata.datadir}')
-    logging.debug(f'      {hicdata.chromosomes}')
-    for c1, c2 in combinations_with_replacement(hicdata.chromosomes, r=2):
-        try:
-            hicdata.load_map(c1, c2)
-            logging.debug(f'{dd}: map for {c1} and {c2} loaded.')
-        except NoSuchHeatmap:
-            continue
+    Read the minimum value of the normalized dataset *dirname*, as recorded
+    in its metadata by :func:`normalize`.
+    """
+    with open(f'{dirname}/metadata.json', 'r') as f:
+        metadata = json.load(f)
+    try:
+        return metadata['Minimum']
+    except KeyError:
+        raise Exception(f'{dirname} has no "Minimum" metadata; '
+                        'was it normalized with this script?')
 
-        hicdata.current['data'] += value
 
-        rows = []
-        for i, j in product(*map(range, hicdata.current['dims'])):
-            if hicdata.current['data'][i, j] == 0.0:
-                continue
-            rows.append([i*hicdata.binsize, j*hicdata.binsize,
-                         hicdata.current['data'][i, j]])
+BYTES_PER_BIN = 48
+"""
+The estimated memory used by :func:`normalize` for each bin of the largest
+matrix of a dataset: the dense matrix (8 bytes), its normalized copy (8
+bytes) and the positions and values of its non-zero boxes while it is
+written (24 bytes), plus a 20% margin. Dense 1500 x 1500 and 3000 x 3000
+TSV maps used 40 bytes per bin once the chunk buffers are accounted for.
+"""
+
+BYTES_PER_ROW = 320
+"""
+The estimated memory used for each row of the chunks of a TSV map being
+parsed or formatted (see :data:`hic.READ_CHUNK_SIZE` and
+:data:`hic.WRITE_CHUNK_SIZE`), apart from the digits of its positions:
+the Python objects of the row, its value and the line holding it.
+"""
 
-        logging.debug(f'len(rows) = {len(rows)}')
-        c1, c2 = hicdata.current['chroms']
-        filename = hicdata._mapfiles[f'{c1}|{c2}']
-        logging.debug(f'{dd}: rows for {filename} prepared.')
-        with gzip.open(f'{hicdata.datadir}/{filename}', 'wt') as f:
-            writer = csv.writer(f, delimiter='\t')
-            writer.writerows(rows)
+BYTES_PER_DIGIT = 8
+"""
+The estimated memory used for each digit of the positions of the rows of
+a chunk (see :data:`BYTES_PER_ROW`). With 5 kb bins, a dense 1500 x 1500
+TSV map used 128 MB, estimated at 151 MB.
+"""
+
+
+def estimate_memory(hicdata, bytes_per_bin=BYTES_PER_BIN):
+    """
+    Estimate the peak memory (in bytes) needed to normalize *hicdata*.
+    As the matrices are loaded one at a time, this depends only on the
+    largest one, whose dimensions (in bins) are read from the metadata:
+    *bytes_per_bin* for each of its bins, plus the chunks of rows of its
+    file being parsed or formatted, whose width depends on the number of
+    digits of the positions, *i.e.* on the dimensions times the binsize.
+    """
+    dims = hicdata._dims.values()
+    largest = max(nrow * ncol for nrow, ncol in dims)
+    digits = len(str(max(max(d) for d in dims) * hicdata.binsize))
+    rows = min(largest, max(READ_CHUNK_SIZE, WRITE_CHUNK_SIZE))
+    return (largest * bytes_per_bin
+            + rows * (BYTES_PER_ROW + 2 * digits * BYTES_PER_DIGIT))
+
+
+def parse_size(size):
+    """
+    Convert the memory *size*, given as a string such as `512M` or `16G`
+    (the suffix is optional and case-insensitive), in bytes.
+    """
+    units = {'k': 1024, 'm': 1024**2, 'g': 1024**3, 't': 1024**4}
+    size = size.strip().lower().rstrip('b')
+    if size and size[-1] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(size)
+
+
+def _run_job(func, *args):
+    """
+    Run *func* with *args*, and return its result along with the peak
+    resident memory (in bytes) of the process, the part of it used by the
+    job (the peak minus the memory used before running *func*, *e.g.* by
+    the imported modules) and its metrics (see :mod:`metrics`). The peak
+    is reset before running *func*, as a spawned process starts with the
+    peak memory of its parent.
+    """
+    metrics.reset()
+    metrics.reset_peak_rss()
+    base = metrics.current_rss()
+    res = func(*args)
+    peak = metrics.peak_rss()
+    return res, peak, peak - base, metrics.METRICS.to_dict()
 
-            logging.debug(f'{dd}: written {filename}.')
 
-    logging.info(f'Done adding {value} on dataset {dd}')
+def schedule(jobs, threads, max_memory=None):
+    """
+    Run the *jobs* in parallel, using at most *threads* processes, while
+    the sum of the estimated memory of the running jobs stays under
+    *max_memory* (in bytes, no limit if None). The jobs are started from
+    the largest to the smallest; a job larger than *max_memory* is only
+    started when nothing else is running.
+
+    *jobs* is a list of tuple (name, estimated memory, function, arguments).
+    Each job runs in its own process, so its peak memory can be logged and
+    compared to the estimate. The processes are spawned, not forked, so
+    they do not hold a copy of the parent memory.
+
+    This is a generator that yields the name and the result of each job as
+    they complete.
+    """
+    pending = sorted(jobs, key=lambda j: j[1], reverse=True)
+    running = {}
+    used = 0
+
+    while pending or running:
+        for job in list(pending):
+            name, estimate, func, args = job
+            if len(running) >= threads:
+                break
+            if running and max_memory is not None and used + estimate > max_memory:
+                continue
+            if max_memory is not None and estimate > max_memory:
+                logging.warning(f'{name}: estimated memory ({estimate} bytes) '
+                                f'exceeds the budget ({max_memory} bytes)')
+            executor = concurrent.futures.ProcessPoolExecutor(
+                1, mp_context=multiprocessing.get_context('spawn'))
+            future = executor.submit(_run_job, func, *args)
+            running[future] = (name, estimate, executor)
+            used += estimate
+            pending.remove(job)
+            logging.debug(f'{name}: started; estimated memory is {estimate} bytes')
+
+        done, _ = concurrent.futures.wait(
+            running, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            name, estimate, executor = running.pop(future)
+            used -= estimate
+            executor.shutdown()
+            res, peak, used_job, measures = future.result()
+            metrics.METRICS.merge(measures)
+            logging.info(f'{name}: peak memory is {peak} bytes, {used_job} '
+                         f'bytes used by the job (estimated {estimate} bytes)')
+            yield name, res
 
 
 def cli_parser():
     desc = ('This script normalizes multiple Hi-C datasets so they can be '
             'compared together. This is done by first subtracting the mean '
             'from each box, then by dividing each one by the std. dev. and '
-            'finally by adding the last value over all dataset. For more '
+            'finally by adding the lowest value over all dataset. For more '
             'details, see the head of that file. The normalized datasets are '
             'named after the original ones suffixed with _centernorm')
     parser = argparse.ArgumentParser(description=desc)
     parser.add_argument('datasets', nargs='+', help='the original datasets')
+    parser.add_argument('-c', '--collection', nargs='+', default=[],
+                        help=('already normalized datasets to normalize '
+                              'together with the new ones; only their '
+                              'offset is updated'))
     parser.add_argument('-t', '--threads', type=int, default=1,
-                        help=('the number of threads to use; '
-                              'high values use more memory'))
+                        help='the number of threads to use')
+    parser.add_argument('-M', '--max-memory', type=parse_size,
+                        help=('the memory available for the normalization, '
+                              'such as 16G; the datasets are normalized in '
+                              'parallel only while their estimated memory '
+                              'fits in it'))
+    parser.add_argument('--bytes-per-bin', type=int, default=BYTES_PER_BIN,
+                        help=('the estimated memory used per bin of the '
+                              'largest matrix of a dataset (default: '
+                              '%(default)s)'))
+    parser.add_argument('-z', '--compress-level', type=int, default=9,
+                        choices=range(1, 10), metavar='[1-9]',
+                        help='the gzip compression level of the matrices')
+    parser.add_argument('--compress-threads', type=int, default=1,
+                        help=('the number of threads compressing the '
+                              'matrices of each dataset'))
     parser.add_argument('-v', '--verbose', action='store_true',
                         help='be verbose')
     parser.add_argument('--debug', action='store_true',
                         help='print debug information')
+    metrics.add_arguments(parser)
 
     return parser
 
@@ -165,6 +319,7 @@ def main():
         logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
     else:
         logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(message)s')
+    metrics.start(args)
 
     datasets = {}
     norm_datasets = {}
@@ -181,32 +336,33 @@ def main():
 
     logging.info('Normalizing matrices...')
 
-    minimum = float('+inf')
-    with concurrent.futures.ProcessPoolExecutor(args.threads) as e:
-        futures = []
-        for d, h in datasets.items():
-            futures.append(e.submit(normalize, h, norm_datasets[d]))
-
-        for future in concurrent.futures.as_completed(futures):
-            try:
-                data = future.result()
-            except Exception as e:
-                logging.error(f'Error: {e}')
-                exit(1)
+    jobs = [(d, estimate_memory(h, args.bytes_per_bin), normalize,
+             (h, norm_datasets[d], args.compress_level,
+              args.compress_threads))
+            for d, h in datasets.items()]
 
+    minimum = float('+inf')
+    try:
+        for d, data in schedule(jobs, args.threads, args.max_memory):
             minimum = min(minimum, data)
+    except Exception as e:
+        logging.error(f'Error: {e}')
+        exit(1)
 
-    logging.info('Subtracting the minimum value...')
+    for d in args.collection:
+        try:
+            minimum = min(minimum, read_minimum(d))
+        except Exception as e:
+            logging.error(f'Error: {d}: {e}')
+            exit(1)
 
-    with concurrent.futures.ProcessPoolExecutor(args.threads) as e:
-        futures = []
-        for d in norm_datasets.values():
-            h = HiC(d)
-            futures.append(e.submit(add_hic, h, abs(minimum)))
+    logging.info('Setting the offset...')
 
-        logging.debug('Wait')
-        concurrent.futures.wait(futures)
+    with stage('set_offset'):
+        for d in list(norm_datasets.values()) + args.collection:
+            set_offset(d, abs(minimum))
 
+    metrics.finish(args)
     logging.info("C'est fini !")
 
 
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+
+"""
+phylohic.py
+===========
+
+Run the whole phyloHiC analysis in a single process tree: for each
+resolution, make the pairs of genes of each dataset
+(:doc:`make_pairs`), join them for each pair of datasets
+(:doc:`join_pairs`), for each threshold and adjacency status, and
+compute the distance matrix (:doc:`dist_all_pairs`), and optionally
+bootstrap replicates (:doc:`bootstrap`).
+
+The configuration is the YAML file used by the `Snakefile` (see
+:doc:`/formats/config`); the `bin` and `condacmd` fields are ignored. The
+distance matrices are written at the same place as by the `Snakefile`.
+Reading the YAML file needs `PyYAML`_ to be installed.
+
+Unlike the `Snakefile`, the orthologs are read once, by the main process,
+and given to the worker processes when they start. Each dataset is
+handled by a single job, which reads its genes once and enumerates its
+pairs of genes once for all the resolutions: only the contacts are
+fetched from the Hi-C data of each resolution, whose maps are loaded
+once. The datasets are handled in parallel, in ``--jobs`` processes.
+The pairs are kept in memory from a stage to the next one: the pairs and
+values files are only written if asked for (``--intermediates``).
+
+This module can also be used as a library: :func:`run` takes the
+configuration as a dict.
+
+The thresholds are the means among the datasets of the percentiles of
+their non-zero Hi-C values, as computed by `pairsStats`.
+
+
+:created: October 2026
+:last modified: October 2026
+
+.. codeauthor::
+   Sylvain PULICANI <pulicani@lirmm.fr>
+
+.. _PyYAML: https://pyyaml.org/
+"""
+
+import argparse
+import logging
+import random
+import sys
+import os
+
+from math import ceil
+from itertools import combinations
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from toolz import merge_with
+from toolz.curried import merge
+
+import hic
+import make_pairs
+from genes import read_bed_table
+from join_pairs import get_records
+from distlib import scaled_L2norm, filter_values, distance_matrix
+from dstack import write_phylip
+from iolib import read_orthos, parse_values, phylip, TableWriter
+
+
+THRESHOLDS = ['00', '10', '25', '50', '75', '90']
+"""The thresholds, as percentiles of the Hi-C values (00 is no threshold)."""
+
+ADJACENCIES = ['all', 'none', 'and', 'xor']
+"""The adjacencies status kept."""
+
+PERCENTILES = ['10', '25', '50', '75', '90']
+"""The percentiles of the Hi-C values used as thresholds."""
+
+
+def load_config(name):
+    """
+    Read the YAML configuration file *name* and return it as a dict.
+    """
+    try:
+        import yaml
+    except ImportError:
+        raise ImportError('reading the configuration needs PyYAML to be '
+                          'installed') from None
+    with open(name, 'r') as f:
+        return yaml.safe_load(f)
+
+
+def empirical_quantile(values, q):
+    """
+    Compute the quantile *q* (in [0, 1]) of the sorted array *values*, as
+    the smallest value such that a fraction *q* of the values are lesser
+    than or equal to it.
+    """
+    if len(values) == 0:
+        return float('nan')
+    return float(values[max(ceil(q * len(values)) - 1, 0)])
+
+
+def group_key(groups, g1, g2):
+    """
+    Return the key of the pair of genes *g1* and *g2*: their orthology
+    groups (from *groups*), sorted and joined by a `_`.
+    """
+    gr = sorted((groups[g1], groups[g2]))
+    return f'{gr[0]}_{gr[1]}'
+
+
+def dataset_pairs(genes, hicdirs, orthos, groups, outfiles=None):
+    """
+    Make the pairs of genes of a dataset, from its *genes* (a
+    :class:`genes.GeneTable`) and the list of its Hi-C directories
+    *hicdirs* (*e.g.* one per resolution), as done by :doc:`make_pairs`
+    with the ``--no-nan`` option. The pairs of genes are enumerated once,
+    and their contacts fetched from each Hi-C directory (as with the
+    ``--extra`` option of :doc:`make_pairs`). If *outfiles* (a list, in
+    the order of *hicdirs*) is given, the pairs are also written in those
+    files.
+
+    Return a list of tuples (dict, dict), one for each Hi-C directory. The
+    first one maps the keys of the pairs of orthologs (see
+    :func:`group_key`) to their record, as read from a pairs file; the
+    second one maps the percentiles of the non-zero Hi-C values to their
+    values.
+    """
+    args = make_pairs.pair_options(no_nan=True)
+    exps = [hic.HiC(h) for h in hicdirs]
+    records = [{} for _ in exps]
+    values = [[] for _ in exps]
+    writers = [None] * len(exps)
+    if outfiles is not None:
+        for k, outfile in enumerate(outfiles):
+            os.makedirs(os.path.dirname(outfile), exist_ok=True)
+            writers[k] = TableWriter(outfile)
+
+    # The blocks are in the same order as for a single Hi-C directory
+    blocks = sorted(set().union(*(make_pairs.chromosome_blocks(genes, exp,
+                                                               args)
+                                  for exp in exps)))
+    for a, b in blocks:
+        key = f'{genes.chroms[a]}|{genes.chroms[b]}'
+        for ii, jj, contacts in make_pairs.block_values(exps, genes, a, b,
+                                                        args):
+            adjacent = genes.adjacent(ii, jj)
+            for k, v in enumerate(contacts):
+                if v is None:
+                    continue
+                rows = make_pairs.format_rows(genes, ii, jj, v, adjacent,
+                                              args.no_nan)
+                if writers[k] is not None:
+                    writers[k].writerows(rows, key)
+                v = v[~np.isnan(v)]
+                values[k].append(v[v != 0.0])
+                for r in rows:
+                    if r[0] in orthos and r[1] in orthos:
+                        records[k][group_key(groups, r[0], r[1])] = tuple(r)
+
+    res = []
+    for k, writer in enumerate(writers):
+        if writer is not None:
+            writer.close()
+        v = np.sort(np.concatenate(values[k])) if values[k] else np.zeros(0)
+        stats = {p: empirical_quantile(v, int(p) / 100) for p in PERCENTILES}
+        res.append((records[k], stats))
+    return res
+
+
+_orthologs = None
+"""The orthologs of a worker process: a tuple (set, dict)."""
+
+
+def _init_worker(orthos, groups):
+    """
+    Keep the orthologs read by the main process in the worker process.
+    """
+    global _orthologs
+    _orthologs = (orthos, groups)
+
+
+def _dataset_pairs_job(bedfile, hicdirs, outfiles):
+    """
+    Make the pairs of genes of a dataset in a worker process (see
+    :func:`dataset_pairs`).
+    """
+    orthos, groups = _orthologs
+    return dataset_pairs(read_bed_table(bedfile), hicdirs, orthos, groups,
+                         outfiles)
+
+
+def threshold_value(threshold, stats):
+    """
+    Return the threshold value for the *threshold* (one of
+    :data:`THRESHOLDS`), given the *stats* of the datasets (a list of
+    dict, as returned by :func:`dataset_pairs`).
+    """
+    if threshold == '00':
+        return 0.0
+    return float(np.mean([s[threshold] for s in stats]))
+
+
+def join(left, right, adjacencies, threshold, exclude=False):
+    """
+    Join the pairs of two datasets, *left* and *right* (dict as returned by
+    :func:`dataset_pairs`), as done by :doc:`join_pairs`.
+    Return the list of rows of the values file.
+    """
+    records = {}
+    for k in left.keys() & right.keys():
+        records[k] = {'left': left[k], 'right': right[k]}
+    return get_records(records, adjacencies, threshold, exclude)
+
+
+def bootstrap(species, values, n, rng):
+    """
+    Compute *n* bootstrap replicates of the distance matrix on the
+    *species* from the list of *values*, using the random generator *rng*
+    (a :class:`random.Random`). Return an array of shape (n, species,
+    species).
+    """
+    res = np.zeros((n, len(species), len(species)))
+    for i in range(n):
+        choices = rng.choices(values, k=len(values))
+        res[i] = distance_matrix(species, scaled_L2norm(species, choices))
+    return res
+
+
+def run_resolution(config, res, pairs, stats, orthos, groups,
+                   intermediates=False, replicates=0, seed=None):
+    """
+    Join the pairs of the datasets at the resolution *res* and write the
+    distance matrix for each threshold and adjacency status. *pairs* and
+    *stats* map the datasets to the result of :func:`dataset_pairs`.
+    Return the list of the written distance matrices.
+    """
+    name = config['experiment']
+    methods = config['method']
+    if isinstance(methods, str):
+        methods = [methods]
+    exclude = config.get('exclude', False)
+    datasets = list(config['datasets'])
+    species = sorted(datasets)
+    resdir = f'{config["rootdir"]}/{res}/{name}'
+    rng = random.Random(seed)
+
+    written = []
+    for th in config.get('thresholds', THRESHOLDS):
+        t = threshold_value(th, list(stats.values()))
+        for adj in config.get('adjacencies', ADJACENCIES):
+            expdir = f'{resdir}/threshold_{th}_adj_{adj}'
+            values = {}
+            for d1, d2 in combinations(datasets, 2):
+                rows = join(pairs[d1], pairs[d2], adj, t, exclude)
+                if intermediates:
+                    os.makedirs(expdir, exist_ok=True)
+                    with TableWriter(f'{expdir}/{d1}_{d2}_values.tsv.gz') as f:
+                        f.writerows(rows)
+                values = merge_with(merge, values,
+                                    parse_values(orthos, groups, d1, d2, rows))
+
+            # The values are merged once, for all the methods
+            for method in methods:
+                kept = list(filter_values(method, species, values.values()))
+                outdir = f'{expdir}/trees_{method}'
+                os.makedirs(outdir, exist_ok=True)
+                with open(f'{outdir}/distances.phylip', 'w') as f:
+                    f.write(phylip(species, scaled_L2norm(species, kept)))
+                    f.write('\n')
+                written.append(f'{outdir}/distances.phylip')
+                logging.info(f'Written {outdir}/distances.phylip')
+
+                if replicates:
+                    bootdir = f'{outdir}/bootstrap_{replicates}'
+                    os.makedirs(bootdir, exist_ok=True)
+                    matrices = bootstrap(species, kept, replicates, rng)
+                    with open(f'{bootdir}/all_replicates.phylip', 'w') as f:
+                        write_phylip(f, species, matrices)
+    return written
+
+
+def run(config, jobs=1, intermediates=False, replicates=0, seed=None):
+    """
+    Run the whole analysis described by the *config* (a dict, see
+    :func:`load_config`), using *jobs* processes to make the pairs. If
+    *intermediates* is True, the pairs and values files are written. If
+    *replicates* is not 0, this number of bootstrap replicates are written
+    for each distance matrix; *seed* makes them reproducible.
+    Return the list of the written distance matrices.
+    """
+    orthos, groups = read_orthos(config['orthologs'])
+    logging.info('Loaded orthologs.')
+
+    resolutions = config['resolutions']
+    datasets = config['datasets']
+    results = {}
+    with ProcessPoolExecutor(jobs, initializer=_init_worker,
+                             initargs=(orthos, groups)) as executor:
+        futures = {}
+        for d, dataset in datasets.items():
+            outfiles = None
+            if intermediates:
+                outfiles = [f'{config["rootdir"]}/{res}/'
+                            f'{config["experiment"]}/pairs/{d}.tsv.gz'
+                            for res in resolutions]
+            futures[d] = executor.submit(
+                _dataset_pairs_job, dataset['genes'],
+                [dataset['hic'][res] for res in resolutions], outfiles)
+        for d in datasets:
+            results[d] = futures[d].result()
+            logging.info(f'Made the pairs of {d}')
+
+    written = []
+    for k, res in enumerate(resolutions):
+        pairs, stats = {}, {}
+        for d in datasets:
+            pairs[d], stats[d] = results[d][k]
+        written.extend(run_resolution(config, res, pairs, stats, orthos,
+                                      groups, intermediates, replicates,
+                                      seed))
+        # The pairs of a resolution are not needed anymore
+        for d in datasets:
+            results[d][k] = None
+    return written
+
+
+def cli_parser():
+    desc = 'Run the whole phyloHiC analysis in a single process tree.'
+    parser = argparse.ArgumentParser(description=desc)
+    parser.add_argument('config', help='the configuration file, in YAML')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help=('the number of processes making the pairs, '
+                              'one dataset at a time'))
+    parser.add_argument('-i', '--intermediates', action='store_true',
+                        help='also write the pairs and values files')
+    parser.add_argument('-b', '--bootstrap', type=int, default=0,
+                        help=('the number of bootstrap replicates for each '
+                              'distance matrix (default: 0)'))
+    parser.add_argument('--seed', type=int,
+                        help='the seed used for the bootstrap replicates')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='be verbose')
+    return parser
+
+
+def main():
+    parser = cli_parser()
+    args = parser.parse_args()
+
+    if args.verbose:
+        level = logging.INFO
+    else:
+        level = logging.WARN
+    logging.basicConfig(format='%(asctime)s: %(message)s', level=level)
+
+    try:
+        config = load_config(args.config)
+    except ImportError:
+        print('error: reading the configuration needs PyYAML to be installed.')
+        sys.exit(1)
+
+    logging.info("C'est parti !")
+    run(config, args.jobs, args.intermediates, args.bootstrap, args.seed)
+    logging.info("C'est fini !")
+
+
+if __name__ == '__main__':
+    main()
+    sys.exit(0)
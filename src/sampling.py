@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+sampling
+========
+
+This module contains functions to sample the pairs of orthology groups
+(*i.e.* the traits), to compute approximate distance matrices quickly.
+
+A pair of groups is selected based on a hash of the pair and of a seed
+(using the `SplitMix64`_ mixing function), not on a random generator.
+Thus, the selection of a pair does not depend on the species, nor on the
+other pairs: every species samples the same traits, without any
+coordination, and each script can sample the pairs independently.
+
+Since the hash of a pair does not depend on its genomic distance, nor on
+whether its genes are on the same chromosome, sampling a fraction of the
+pairs samples that fraction of each stratum (distance bin, intra or inter
+pairs), in expectation.
+
+The sample can also be stratified (see :class:`Strata`): the pairs are
+put in strata by the genomic distance between their genes, and whether
+they are on the same chromosome, in a reference species, and each stratum
+is sampled at its own fraction. A pair is selected if its hash is under
+the fraction of its stratum; as the strata only depend on the reference
+species, this is still done without any coordination between species.
+
+
+:created: October 2026
+:last modified: October 2026
+
+.. codeauthor::
+   Sylvain PULICANI <pulicani@lirmm.fr>
+
+.. _SplitMix64: https://prng.di.unimi.it/splitmix64.c
+"""
+
+import numpy as np
+
+from genes import read_bed_table
+
+
+MASK = 0xffffffffffffffff
+
+STRATA_BINS = (100000, 1000000)
+"""
+The default genomic distances (in bp) bounding the strata of the pairs of
+groups on the same chromosome (see :class:`Strata`).
+"""
+
+
+def splitmix64(x):
+    """
+    Mix the array of unsigned 64 bits integers *x*. Return an array of
+    unsigned 64 bits integers.
+    """
+    x = np.asarray(x, dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        x = x + np.uint64(0x9e3779b97f4a7c15)
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+    return x ^ (x >> np.uint64(31))
+
+
+def pair_hash(groups1, groups2, seed=0):
+    """
+    Hash the pairs of orthology groups given by the arrays (or sequences)
+    of integers *groups1* and *groups2*, with the integer *seed*. The pairs
+    are not ordered: (a, b) and (b, a) have the same hash.
+    Return an array of unsigned 64 bits integers.
+    """
+    groups1 = np.asarray(groups1, dtype=np.uint64)
+    groups2 = np.asarray(groups2, dtype=np.uint64)
+    h = splitmix64(np.uint64(seed & MASK) ^ np.minimum(groups1, groups2))
+    return splitmix64(h ^ np.maximum(groups1, groups2))
+
+
+def pair_uniform(groups1, groups2, seed=0):
+    """
+    Map the pairs of orthology groups (see :func:`pair_hash`) to numbers
+    uniformly distributed in [0, 1). Return an array of floats.
+    """
+    h = pair_hash(groups1, groups2, seed)
+    return (h >> np.uint64(11)).astype(float) * 2.0**-53
+
+
+def sample_mask(groups1, groups2, fraction, seed=0, strata=None):
+    """
+    Select a *fraction* of the pairs of orthology groups (see
+    :func:`pair_hash`). If *strata* (a :class:`Strata`) is given,
+    *fraction* is a dict of the names of the strata to the fraction of
+    their pairs to select (see :meth:`Strata.fractions`). Return an array
+    of booleans, True for the selected pairs.
+    """
+    u = pair_uniform(groups1, groups2, seed)
+    if strata is None:
+        return u < fraction
+    thresholds = np.array([fraction[name] for name in strata.names])
+    return u < thresholds[strata.labels(groups1, groups2)]
+
+
+def split_keys(keys):
+    """
+    Split the *keys* of the pairs of orthology groups (strings of the form
+    `group_group`, as in :func:`iolib.read_values`). Return a couple of
+    arrays of integers.
+    """
+    if not keys:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    gr = np.array([k.split('_') for k in keys], dtype=np.int64)
+    return gr[:, 0], gr[:, 1]
+
+
+def sample_keys(keys, fraction=None, size=None, seed=0, strata=None):
+    """
+    Sample the *keys* of pairs of orthology groups (strings of the form
+    `group_group`). Either a *fraction* of them is selected (as
+    :func:`sample_mask`), or the *size* keys with the smallest hashes.
+    Return the list of the selected keys, in the order of *keys*.
+
+    In both cases, a key is selected or not for the same seed, whatever
+    the species: with a *size*, the selected keys are the same as with a
+    fraction a bit above *size* / len(*keys*).
+
+    If *strata* (a :class:`Strata`) is given, the keys are sampled by
+    strata: *fraction* is then a dict of the names of the strata to their
+    fraction, and *size* is not used (see :meth:`Strata.fractions`).
+    """
+    keys = list(keys)
+    g1, g2 = split_keys(keys)
+    if strata is not None:
+        selected = sample_mask(g1, g2, fraction, seed, strata)
+    elif size is not None:
+        if size >= len(keys):
+            return keys
+        u = pair_uniform(g1, g2, seed)
+        threshold = np.partition(u, size - 1)[size - 1]
+        selected = u <= threshold
+    else:
+        selected = sample_mask(g1, g2, fraction, seed)
+    return [k for k, s in zip(keys, selected.tolist()) if s]
+
+
+class Strata:
+    """
+    Strata holds the position of each orthology group in a reference
+    species (the position of its gene there), to put the pairs of groups
+    in strata: the pairs on the same chromosome, by bins of the genomic
+    distance between their genes, then the pairs on different chromosomes,
+    then the pairs with a group without gene in the reference species.
+
+    The strata are numbered in that order, and named after their bins
+    (*e.g.* `0-100000`, `1000000-`), `inter` and `unplaced`.
+    """
+
+    def __init__(self, genes, groups, bins=STRATA_BINS):
+        """
+        *genes* are the genes of the reference species (a
+        :class:`genes.GeneTable`), *groups* the mapping of the genes names
+        to their orthology group (see :func:`iolib.read_orthos`) and
+        *bins* the distances (in bp) bounding the bins.
+        """
+        self.ngroups = len(set(groups.values()))
+        """The number of orthology groups."""
+
+        size = max(groups.values(), default=-1) + 1
+        self.chrom = np.full(size, -1, dtype=np.int64)
+        """The chromosome of each group in the reference, -1 if none."""
+
+        self.start = np.zeros(size, dtype=np.int64)
+        """The start position of each group in the reference."""
+
+        for i, name in enumerate(genes.names):
+            if name in groups:
+                self.chrom[groups[name]] = genes.chrom[i]
+                self.start[groups[name]] = genes.start[i]
+
+        self.bins = np.array(sorted(bins), dtype=np.int64)
+        """The distances bounding the bins."""
+
+        bounds = [0] + self.bins.tolist()
+        self.names = ([f'{lo}-{hi}' for lo, hi in zip(bounds, bounds[1:])] +
+                      [f'{bounds[-1]}-', 'inter', 'unplaced'])
+        """The names of the strata, by number."""
+
+
+    def labels(self, groups1, groups2):
+        """
+        Return the strata (as numbers) of the pairs of orthology groups
+        given by the arrays of integers *groups1* and *groups2*.
+        """
+        g1 = np.asarray(groups1, dtype=np.int64)
+        g2 = np.asarray(groups2, dtype=np.int64)
+        c1, c2 = self.chrom[g1], self.chrom[g2]
+        res = np.searchsorted(self.bins, np.abs(self.start[g1] -
+                                                self.start[g2]),
+                              side='right')
+        res[c1 != c2] = len(self.names) - 2
+        res[(c1 < 0) | (c2 < 0)] = len(self.names) - 1
+        return res
+
+
+    def sizes(self):
+        """
+        Return the number of pairs of orthology groups in each stratum, an
+        array. They are counted by chromosome with a sweep over the sorted
+        positions, not enumerated.
+        """
+        res = np.zeros(len(self.names), dtype=np.int64)
+        placed = []
+        for c in np.unique(self.chrom[self.chrom >= 0]):
+            pos = np.sort(self.start[self.chrom == c])
+            n = len(pos)
+            # The number of pairs closer than each bound
+            closer = [0]
+            for b in self.bins.tolist():
+                ends = np.searchsorted(pos, pos + b, side='left')
+                closer.append(int(np.sum(ends - np.arange(n) - 1)))
+            closer.append(n * (n - 1) // 2)
+            res[:len(closer) - 1] += np.diff(closer)
+            placed.append(n)
+        nplaced = sum(placed)
+        res[-2] = (nplaced**2 - sum(n**2 for n in placed)) // 2
+        res[-1] = (self.ngroups * (self.ngroups - 1) // 2 -
+                   nplaced * (nplaced - 1) // 2)
+        return res
+
+
+    def fractions(self, fraction=None, size=None, overrides=()):
+        """
+        Return the fraction of the pairs of each stratum to sample: a dict
+        of the names of the strata to fractions. Either the same *fraction*
+        is used for all the strata, or the fractions are such that about
+        *size* pairs are sampled overall, the same number in each of the
+        non-empty strata (so the small strata, *e.g.* the closest pairs,
+        are sampled too). *overrides* is a list of couples (name of a
+        stratum, fraction) setting the fraction of some strata.
+        Raise a ValueError for an unknown stratum.
+        """
+        if size is not None:
+            sizes = self.sizes()
+            per_stratum = size / max(np.count_nonzero(sizes), 1)
+            res = {name: min(1.0, per_stratum / n) if n else 0.0
+                   for name, n in zip(self.names, sizes.tolist())}
+        else:
+            res = {name: fraction for name in self.names}
+        for name, value in overrides:
+            if name not in res:
+                raise ValueError(f'Unknown stratum {name}; the strata are '
+                                 f'{", ".join(self.names)}')
+            res[name] = float(value)
+        return res
+
+
+def parse_bins(bins):
+    """
+    Parse the comma-separated list of distances *bins*. Return a tuple of
+    integers.
+    """
+    return tuple(int(b) for b in bins.split(','))
+
+
+def add_arguments(parser):
+    """
+    Add the options stratifying the sample to the argparse *parser*.
+    """
+    parser.add_argument('--strata-genes', metavar='BED',
+                        help=('stratify the sampled pairs by the genomic '
+                              'distance between their genes in this '
+                              'reference species (its genes, in BED), and '
+                              'whether they are on the same chromosome; use '
+                              'the same for all species'))
+    parser.add_argument('--strata-bins', type=parse_bins, default=STRATA_BINS,
+                        help=('the distances (in bp) bounding the strata of '
+                              'the pairs on the same chromosome, separated '
+                              'by commas (default: 100000,1000000)'))
+    parser.add_argument('--stratum-fraction', nargs=2, action='append',
+                        default=[], metavar=('STRATUM', 'FRACTION'),
+                        help=('sample this fraction of the pairs of this '
+                              'stratum, e.g. 0-100000 0.5 or inter 0.01; '
+                              'can be given several times'))
+
+
+def check_arguments(parser, args):
+    """
+    Check the options of the sample, parsed in *args*: the options added
+    by :func:`add_arguments`, `sample_fraction` and `sample_size`. The
+    errors are reported by the *parser*. Return whether the pairs are
+    sampled.
+    """
+    sampled = args.sample_fraction is not None or args.sample_size is not None
+    if args.stratum_fraction and args.strata_genes is None:
+        parser.error('--stratum-fraction needs --strata-genes')
+    if args.strata_genes is not None and not sampled:
+        parser.error('--strata-genes needs --sample-fraction or --sample-size')
+    return sampled
+
+
+def from_arguments(parser, args, groups):
+    """
+    Make the :class:`Strata` of the options added by
+    :func:`add_arguments`, parsed in *args* (see :func:`check_arguments`),
+    given the mapping *groups* of the genes to their orthology group.
+    Return a tuple (strata, fractions of the strata), or (None,
+    *args.sample_fraction*) without ``--strata-genes``. The errors are
+    reported by the *parser*.
+    """
+    if args.strata_genes is None:
+        return None, args.sample_fraction
+    strata = Strata(read_bed_table(args.strata_genes), groups,
+                    args.strata_bins)
+    try:
+        return strata, strata.fractions(args.sample_fraction,
+                                        args.sample_size,
+                                        args.stratum_fraction)
+    except ValueError as e:
+        parser.error(str(e))
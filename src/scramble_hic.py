@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+"""
+scramble_hic.py
+===============
+
+Make N scrambled replicates of an Hi-C dataset, to build a null
+distribution. Each matrix is read only once, then scrambled and written
+N times, once for each replicate.
+
+The replicates are written in the output directory, as Hi-C datasets
+named `replicate_0`, `replicate_1`, *etc.* By default, the matrices are
+written in the binary map format (see :doc:`/formats/hic`), which is
+much faster to read than gzipped TSV files.
+
+The seed used to scramble each replicate is recorded in its
+`metadata.json` file (the `Seed` field). The scrambling is the same as the
+one done by :doc:`make_pairs` with the ``--scramble`` option: running it
+on the original dataset with the seed of a replicate gives the same
+scrambled matrices. Thus, :doc:`make_pairs` can be run directly on the
+replicates, without the ``--scramble`` option.
+
+
+:created: October 2026
+:last modified: October 2026
+
+.. codeauthor::
+   Sylvain PULICANI <pulicani@lirmm.fr>
+"""
+
+import argparse
+import logging
+import json
+import sys
+import os
+
+from os.path import splitext
+
+import numpy as np
+
+from hic import HiC, write_map
+
+
+def replicate_seeds(seed, n):
+    """
+    Derive the seeds of *n* replicates from the *seed*.
+    Return a list of integers.
+    """
+    return [int(s) for s in np.random.SeedSequence(seed).generate_state(n)]
+
+
+def map_filename(filename, fmt):
+    """
+    Return the name of the matrix file *filename* for the format *fmt*
+    (either `npz` or `tsv`).
+    """
+    while splitext(filename)[1] in ('.gz', '.tsv', '.npz'):
+        filename = splitext(filename)[0]
+    if fmt == 'npz':
+        return f'{filename}.npz'
+    return f'{filename}.tsv.gz'
+
+
+def cli_parser():
+    desc = 'Make N scrambled replicates of an Hi-C dataset.'
+    parser = argparse.ArgumentParser(description=desc)
+    parser.add_argument('hic',
+                        help='the directory with the Hi-C sparses matrices')
+    parser.add_argument('outdir', help='the directory for the replicates')
+    parser.add_argument('n', type=int, help='the number of replicates')
+    parser.add_argument('--seed', type=int,
+                        help=('the seed from which the seeds of the '
+                              'replicates are derived; random if not set'))
+    parser.add_argument('-f', '--format', default='npz',
+                        choices=['npz', 'tsv'],
+                        help='the format of the matrices (default: npz)')
+    parser.add_argument('-z', '--compress-level', type=int, default=9,
+                        choices=range(1, 10), metavar='[1-9]',
+                        help='the gzip compression level of the TSV matrices')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='be verbose')
+    parser.add_argument('--debug', action='store_true',
+                        help='print debug information')
+    return parser
+
+
+def main():
+    parser = cli_parser()
+    args = parser.parse_args()
+
+    if args.verbose and not args.debug:
+        level = logging.INFO
+    elif args.debug:
+        level = logging.DEBUG
+    else:
+        level = logging.WARN
+    logging.basicConfig(format='%(asctime)s: %(message)s', level=level)
+
+    logging.info("C'est parti !")
+
+    exp = HiC(args.hic)
+    with open(f'{args.hic}/metadata.json', 'r') as f:
+        metadata = json.load(f)
+    mapfiles = {k: map_filename(v, args.format)
+                for k, v in metadata['MapFiles'].items()}
+
+    seed = args.seed
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    seeds = replicate_seeds(seed, args.n)
+    logging.info(f'The replicates seeds are derived from {seed}')
+
+    outdirs = [f'{args.outdir}/replicate_{i}' for i in range(args.n)]
+    for i, d in enumerate(outdirs):
+        os.makedirs(d, exist_ok=True)
+        # The offset of the original dataset is applied when loading the
+        # matrices
+        metadata.update({'MapFiles': mapfiles, 'Offset': 0.0,
+                         'Seed': seeds[i]})
+        with open(f'{d}/metadata.json', 'w') as f:
+            json.dump(metadata, f, indent=2)
+            f.write('\n')
+
+    for c1, c2 in exp.iter_maps():
+        k = f'{c1}|{c2}'
+        original = exp.current['data']
+        for d, s in zip(outdirs, seeds):
+            exp.current['data'] = original.copy()
+            exp.scramble(s)
+            write_map(f'{d}/{mapfiles[k]}', exp.current['data'],
+                      exp.binsize, args.compress_level)
+        logging.info(f'Written {args.n} replicates of {c1} x {c2}')
+
+    logging.info("C'est fini !")
+
+
+if __name__ == '__main__':
+    main()
+    sys.exit(0)
@@ -4,21 +4,30 @@
 statshic.py
 ===========
 
-Compute basic statistics about the given Hi-C dataset.
+Compute basic statistics about the given Hi-C datasets.
 
 The statistics are the following:
 
 * Mean
 * Standard deviation
 * Median
-* Percentiles at 10, 25, 75 and 95%
+* Percentiles at 10, 25, 75 and 90%
 
 Also report the dimensions of the matrices and their size (number of
 elements). For the whole datasets, only the size is given.
 
+Several datasets can be given at once, in which case the results are keyed
+by the dataset directories. The matrices can be summarized in parallel
+(see ``--jobs``).
+
+The statistics of the whole dataset are computed from summaries of each
+matrix, so only one matrix is in memory at a time. Thus, the percentiles
+of the whole dataset are approximated (with a relative error of at most
+``--accuracy``), while the ones of each matrix are exact.
+
 
 :created: August 2018
-:last modified: August 2018
+:last modified: October 2026
 
 .. codeauthor::
    Sylvain PULICANI <pulicani@lirmm.fr>
@@ -26,79 +35,196 @@ elements). For the whole datasets, only the size is given.
 
 import json
 import argparse
-from itertools import combinations_with_replacement
+import concurrent.futures
 
 import numpy as np
 
-from hic import HiC, NoSuchHeatmap
+import metrics
+from hic import HiC
+from metrics import stage, count
+from statslib import Moments, QuantileSketch
+
+
+PERCENTILES = [10, 25, 50, 75, 90]
+"""The percentiles reported, in that order: p10, p25, median, p75 and p90."""
+
+
+def percentiles_dict(values):
+    """
+    Convert the *values* of the :data:`PERCENTILES` in a dict keyed by
+    their names.
+    """
+    return dict(zip(['p10', 'p25', 'median', 'p75', 'p90'], values))
+
+
+def map_summary(data, accuracy=None):
+    """
+    Compute the statistics of the matrix *data*. Return a dict with the
+    statistics, and the :class:`statslib.Moments` of the matrix. If
+    *accuracy* is not None, a :class:`statslib.QuantileSketch` of that
+    accuracy is also returned (None otherwise), so the whole dataset
+    statistics can be computed.
+    """
+    moments = Moments()
+    moments.update(data)
+
+    d = {}
+    d['dims'] = data.shape
+    d['size'] = data.size
+    d['mean'] = moments.mean
+    d['stddev'] = moments.stddev
+    d.update(percentiles_dict(np.percentile(data, PERCENTILES)))
+
+    sketch = None
+    if accuracy is not None:
+        sketch = QuantileSketch(accuracy)
+        sketch.update(data)
+
+    return d, moments, sketch
+
+
+def summarize_map(dirname, chroms, accuracy=None):
+    """
+    Load the matrix for the pair of chromosomes *chroms* (of the form
+    `X|Y`) from the Hi-C directory *dirname*, and return its summary
+    computed by :func:`map_summary`. This is run by the worker processes:
+    only the summary is sent back, never the matrix.
+    """
+    hic = HiC(dirname)
+    c1, c2 = chroms.split('|')
+    hic.load_map(c1, c2)
+    with stage('map_summary'):
+        return map_summary(hic.current['data'], accuracy)
+
+
+def _summarize_map_job(dirname, chroms, accuracy=None):
+    """
+    Run :func:`summarize_map` in a worker process, and return its result
+    along with the metrics of the worker (see :mod:`metrics`), to be
+    merged by the parent. The metrics are reset first, as a forked worker
+    inherits the ones of its parent.
+    """
+    metrics.reset()
+    res = summarize_map(dirname, chroms, accuracy)
+    return res, metrics.METRICS.to_dict()
+
+
+def dataset_summary(dirname, executor=None, accuracy=None):
+    """
+    Compute the statistics of each matrix of the Hi-C directory *dirname*.
+    If *executor* (a `concurrent.futures.Executor`) is given, the
+    matrices are summarized by its workers, whose metrics are merged in
+    the ones of this process.
+    Return a dict of the statistics keyed by the pairs of chromosomes.
+    If *accuracy* is not None, the statistics of the whole dataset are
+    also computed, keyed by `all`.
+
+    The matrices are processed (and merged) in the order of their keys,
+    thus the result does not depend on *executor*.
+    """
+    hic = HiC(dirname)
+    keys = sorted(hic._mapfiles)
+    args = [dirname] * len(keys), keys, [accuracy] * len(keys)
+    if executor is None:
+        summaries = map(summarize_map, *args)
+    else:
+        summaries = executor.map(_summarize_map_job, *args)
+
+    s = dict()
+    moments = Moments()
+    sketch = QuantileSketch(accuracy or 0.001)
+    with stage('summarize_maps'):
+        for k, summary in zip(keys, summaries):
+            if executor is not None:
+                summary, measures = summary
+                metrics.METRICS.merge(measures)
+            d, m, sk = summary
+            s[k] = d
+            count('maps_summarized')
+            if accuracy is not None:
+                moments.merge(m)
+                sketch.merge(sk)
+
+    if accuracy is not None:
+        with stage('whole_summary'):
+            s['all'] = whole_summary(moments, sketch)
+
+    return s
+
+
+def whole_summary(moments, sketch):
+    """
+    Compute the statistics of the whole dataset from the merged *moments*
+    and *sketch* of all its matrices. The percentiles are approximated.
+    """
+    d = {
+        'size': moments.count,
+        'mean': moments.mean,
+        'stddev': moments.stddev,
+    }
+    d.update(percentiles_dict(sketch.percentiles(PERCENTILES)))
+    return d
 
 
 def cli_parser():
     desc=('Compute basic statistics about the given Hi-C dataset. '
           'The results are printed to standard output or written as JSON.')
     parser = argparse.ArgumentParser(description=desc)
-    parser.add_argument('hic',
-                        help='the Hi-C directory with the metadata.json file')
+    parser.add_argument('hic', nargs='+',
+                        help=('the Hi-C directories with the metadata.json '
+                              'file'))
     parser.add_argument('-w', '--whole-dataset', action='store_true',
                         help=('compute also the stats on the whole dataset;'
-                              ' may use a lot of memory'))
+                              ' the percentiles are approximated'))
+    parser.add_argument('-a', '--accuracy', type=float, default=0.001,
+                        help=('the relative accuracy of the whole dataset '
+                              'percentiles (default: %(default)s)'))
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='the number of matrices summarized in parallel')
     parser.add_argument('-o', '--output', help='the output file, in JSON')
+    metrics.add_arguments(parser)
     return parser
 
 def main():
     parser = cli_parser()
     args = parser.parse_args()
 
-    hic = HiC(args.hic)
+    if not 0 < args.accuracy < 1:
+        parser.error('--accuracy must be in (0, 1)')
+    metrics.start(args)
 
-    s = dict()
-    if args.whole_dataset:
-        whole_dataset = []
-    for c1, c2 in combinations_with_replacement(hic.chromosomes, 2):
-        try:
-            hic.load_map(c1, c2)
-        except NoSuchHeatmap:
-            continue
-        d = {}
-        d['dims'] = hic.current['dims']
-        d['size'] = d['dims'][0] * d['dims'][1]
-        d['mean'] = np.mean(hic.current['data'])
-        d['stddev'] = np.std(hic.current['data'])
-        # d['stderr'] = d['stddev'] / np.sqrt(len(d))
-        d['p10'] = np.percentile(hic.current['data'], 10)
-        d['p25'] = np.percentile(hic.current['data'], 25)
-        d['median'] = np.median(hic.current['data'])
-        d['p75'] = np.percentile(hic.current['data'], 75)
-        d['p90'] = np.percentile(hic.current['data'], 90)
-
-        s[f'{c1}|{c2}'] = d
-        if args.whole_dataset:
-            whole_dataset.extend(hic.current['data'].flatten())
-
-    if args.whole_dataset:
-        # w = np.array(whole_dataset)
-        w = whole_dataset
-        s['all'] = {
-            'size': len(w),
-            'mean': np.mean(w),
-            'stddev': np.std(w),
-            # 'stderr'] = 'stddev'] / np.sqrt(len(d))
-            'p10': np.percentile(w, 10),
-            'p25': np.percentile(w, 25),
-            'median': np.median(w),
-            'p75': np.percentile(w, 75),
-            'p90': np.percentile(w, 90),
-        }
+    accuracy = args.accuracy if args.whole_dataset else None
+
+    executor = None
+    if args.jobs > 1:
+        executor = concurrent.futures.ProcessPoolExecutor(args.jobs)
+
+    res = dict()
+    for dirname in args.hic:
+        res[dirname] = dataset_summary(dirname, executor, accuracy)
+
+    if executor is not None:
+        executor.shutdown()
+
+    if len(args.hic) == 1:
+        s = res[args.hic[0]]
+    else:
+        s = res
 
     if args.output is None:
-        for chroms, d in s.items():
-            print(chroms)
-            for stat, v in d.items():
-                print(f'  {stat} = {v}')
+        for dirname, stats in res.items():
+            if len(res) > 1:
+                print(f'# {dirname}')
+            for chroms, d in stats.items():
+                print(chroms)
+                for stat, v in d.items():
+                    print(f'  {stat} = {v}')
     else:
         with open(args.output, 'w') as f:
             json.dump(s, f)
 
+    metrics.finish(args)
+
 
 if __name__ == '__main__':
     main()
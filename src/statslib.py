@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+statslib
+========
+
+This module contains helpers to compute statistics over data that don't
+fit in memory all at once, such as a whole Hi-C dataset. The data are fed
+one chunk (*e.g.* one heatmap) at a time, and the partial results can be
+merged together.
+
+:created: October 2026
+:last modified: October 2026
+
+.. codeauthor::
+   Sylvain PULICANI <pulicani@lirmm.fr>
+"""
+
+from math import sqrt
+
+import numpy as np
+
+
+class Moments:
+    """
+    Moments holds the count, mean, sum of squared deviations, minimum and
+    maximum of the values seen so far. The values are given by chunks to
+    :meth:`update`, and two Moments can be merged with :meth:`merge`.
+
+    The mean and variance are updated using the parallel algorithm of
+    Chan *et al.* (the chunked version of Welford's algorithm), which stays
+    accurate even for large datasets.
+    """
+
+    def __init__(self):
+        self.count = 0
+        """The number of values seen so far."""
+
+        self.mean = 0.0
+        """The mean of the values seen so far."""
+
+        self.m2 = 0.0
+        """The sum of the squared deviations from the mean."""
+
+        self.minimum = float('+inf')
+        """The minimum of the values seen so far."""
+
+        self.maximum = float('-inf')
+        """The maximum of the values seen so far."""
+
+
+    def update(self, data):
+        """
+        Add the values of the array *data* (of any shape).
+        """
+        data = np.asarray(data, dtype=float)
+        if data.size == 0:
+            return
+        other = Moments()
+        other.count = data.size
+        other.mean = float(np.mean(data))
+        other.m2 = float(np.var(data)) * data.size
+        other.minimum = float(np.min(data))
+        other.maximum = float(np.max(data))
+        self.merge(other)
+
+
+    def merge(self, other):
+        """
+        Merge the Moments *other* into this one.
+        """
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.count = other.count
+            self.mean = other.mean
+            self.m2 = other.m2
+            self.minimum = other.minimum
+            self.maximum = other.maximum
+            return
+
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta**2 * self.count * other.count / count
+        self.count = count
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+
+
+    @property
+    def variance(self):
+        """The (population) variance of the values seen so far."""
+        if self.count == 0:
+            return float('nan')
+        return self.m2 / self.count
+
+
+    @property
+    def stddev(self):
+        """The (population) standard deviation of the values seen so far."""
+        return sqrt(self.variance)
+
+
+class QuantileSketch:
+    """
+    QuantileSketch approximates the quantiles of the values seen so far,
+    using a bounded amount of memory. The values are given by chunks to
+    :meth:`update`, and two QuantileSketch can be merged with :meth:`merge`.
+
+    The values are counted in logarithmically-sized buckets (as in the
+    DDSketch algorithm), so that any quantile is estimated with a relative
+    error of at most *accuracy*. The zeros are counted exactly, and the
+    Not-a-Number values are ignored.
+    """
+
+    def __init__(self, accuracy=0.001):
+        if not 0 < accuracy < 1:
+            raise ValueError(f'the accuracy must be in (0, 1), not {accuracy}')
+        self.accuracy = accuracy
+        """The relative accuracy of the estimated quantiles."""
+
+        self.gamma = (1.0 + accuracy) / (1.0 - accuracy)
+        self._log_gamma = np.log(self.gamma)
+
+        self.zeros = 0
+        self.positives = {}
+        self.negatives = {}
+
+
+    @property
+    def count(self):
+        """The number of values seen so far."""
+        return (self.zeros + sum(self.positives.values()) +
+                sum(self.negatives.values()))
+
+
+    def _add(self, buckets, values):
+        """
+        Count the strictly positive *values* into *buckets*.
+        """
+        if values.size == 0:
+            return
+        indices = np.ceil(np.log(values) / self._log_gamma).astype(np.int64)
+        for i, n in zip(*np.unique(indices, return_counts=True)):
+            buckets[int(i)] = buckets.get(int(i), 0) + int(n)
+
+
+    def update(self, data):
+        """
+        Add the values of the array *data* (of any shape).
+        """
+        data = np.asarray(data, dtype=float).ravel()
+        data = data[~np.isnan(data)]
+        self.zeros += int(np.count_nonzero(data == 0.0))
+        self._add(self.positives, data[data > 0.0])
+        self._add(self.negatives, -data[data < 0.0])
+
+
+    def merge(self, other):
+        """
+        Merge the QuantileSketch *other* into this one. Both must have the
+        same accuracy.
+        """
+        if other.gamma != self.gamma:
+            raise ValueError('cannot merge sketches of different accuracies')
+        self.zeros += other.zeros
+        for i, n in other.positives.items():
+            self.positives[i] = self.positives.get(i, 0) + n
+        for i, n in other.negatives.items():
+            self.negatives[i] = self.negatives.get(i, 0) + n
+
+
+    def percentiles(self, q):
+        """
+        Estimate the percentiles *q* (a sequence of numbers between 0 and
+        100, as for `numpy.percentile`). Return a list of floats.
+        """
+        neg = sorted(self.negatives, reverse=True)
+        pos = sorted(self.positives)
+        # A bucket i holds the values in (gamma^(i-1), gamma^i]
+        scale = 2.0 / (self.gamma + 1.0)
+        values = np.concatenate([
+            [-scale * self.gamma**i for i in neg],
+            [0.0],
+            [scale * self.gamma**i for i in pos]])
+        counts = np.array([self.negatives[i] for i in neg] +
+                          [self.zeros] +
+                          [self.positives[i] for i in pos])
+        total = counts.sum()
+        if total == 0:
+            return [float('nan')] * len(q)
+
+        cumul = np.cumsum(counts)
+        ranks = np.asarray(q, dtype=float) / 100.0 * (total - 1)
+        return values[np.searchsorted(cumul, ranks, side='right')].tolist()
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+
+"""
+synth.py
+========
+
+Generate a synthetic phyloHiC dataset, to test and benchmark the scripts
+at a configurable scale without real genomes (see :doc:`bench`).
+
+For each species, the following files are written in the output
+directory:
+
+* `{species}.bed`: the genes, in the BED format;
+* `{species}_hic/`: the Hi-C directory (see :doc:`/formats/hic`), whose
+  intra-chromosomal maps follow a distance-decay model: the contact
+  between two bins *d* bins apart is drawn from a Poisson law of mean
+  *scale* x (*d* + 1) ^ -*alpha*, up to ``--max-diagonal`` bins away from
+  the diagonal. With ``--inter``, sparse inter-chromosomal maps are
+  written too.
+
+The orthologs table, `orthologs.tsv` (see :doc:`/formats/orthos`), holds
+a fraction of the genes (``--orthologs``). The *k*-th gene of a species is
+the ortholog of the *k*-th gene of the others, except for a fraction of
+them (``--shuffle``) whose orthologs are permuted, so the species share a
+noisy synteny. A configuration file, `config.yaml` (see
+:doc:`/formats/config`), describes the dataset, with a single resolution.
+
+All the species have the same chromosomes, with the same number of bins
+and genes. The dataset only depends on the options and on the ``--seed``.
+
+
+:created: October 2026
+:last modified: October 2026
+
+.. codeauthor::
+   Sylvain PULICANI <pulicani@lirmm.fr>
+"""
+
+import argparse
+import json
+import sys
+import os
+
+from os.path import abspath
+
+import numpy as np
+
+from hic import write_boxes
+
+
+GENE_LENGTH = 2000
+"""The mean length of the synthetic genes."""
+
+
+def decay_map(n, rng, scale=50.0, alpha=1.0, max_diagonal=None):
+    """
+    Draw the non-zero boxes of a symmetric intra-chromosomal map of *n*
+    bins, following the distance-decay model, using the random generator
+    *rng*. The boxes at more than *max_diagonal* bins from the diagonal
+    are empty (no limit if None).
+    Return a tuple of arrays (row bins, column bins, values).
+    """
+    if max_diagonal is None:
+        max_diagonal = n - 1
+    rows, cols, values = [], [], []
+    for d in range(min(max_diagonal, n - 1) + 1):
+        counts = rng.poisson(scale * (d + 1) ** -alpha, n - d)
+        i = np.nonzero(counts)[0]
+        v = counts[i].astype(float)
+        rows.append(i)
+        cols.append(i + d)
+        values.append(v)
+        if d > 0:
+            rows.append(i + d)
+            cols.append(i)
+            values.append(v)
+    return np.concatenate(rows), np.concatenate(cols), np.concatenate(values)
+
+
+def inter_map(n1, n2, rng, density=0.01):
+    """
+    Draw the non-zero boxes of an inter-chromosomal map of *n1* x *n2*
+    bins, a fraction *density* of them holding a contact of 1, using the
+    random generator *rng*.
+    Return a tuple of arrays (row bins, column bins, values).
+    """
+    k = rng.binomial(n1 * n2, density)
+    boxes = np.unique(rng.integers(0, n1 * n2, k))
+    return boxes // n2, boxes % n2, np.ones(len(boxes))
+
+
+def synth_genes(prefix, chroms, length, ngenes, rng):
+    """
+    Draw *ngenes* genes on each of the *chroms*, of *length* bp, using the
+    random generator *rng*. The genes are named `{prefix}{k}`, *k* being
+    their rank along the genome.
+    Return a list of BED rows.
+    """
+    rows = []
+    for chrom in chroms:
+        starts = np.sort(rng.integers(0, length - 2 * GENE_LENGTH, ngenes))
+        sizes = rng.integers(GENE_LENGTH // 2, 3 * GENE_LENGTH // 2, ngenes)
+        strands = rng.choice(['+', '-'], ngenes)
+        for start, size, strand in zip(starts.tolist(), sizes.tolist(),
+                                       strands.tolist()):
+            rows.append([chrom, str(start), str(start + size),
+                         f'{prefix}{len(rows)}', '0', strand])
+    return rows
+
+
+def write_hic(dirname, name, chroms, nbins, binsize, rng, scale=50.0,
+              alpha=1.0, max_diagonal=None, inter=False, binary=False):
+    """
+    Write a synthetic Hi-C dataset called *name* in *dirname*, with one
+    map of *nbins* bins of *binsize* bp for each of the *chroms* (and one
+    for each pair of them if *inter* is True), using the random generator
+    *rng*. See :func:`decay_map` for the model. If *binary* is True, the
+    maps are written in the binary format.
+    Return the number of non-zero boxes written.
+    """
+    os.makedirs(dirname, exist_ok=True)
+    ext = 'npz' if binary else 'tsv.gz'
+    dims, mapfiles = {}, {}
+    nboxes = 0
+    for a, c1 in enumerate(chroms):
+        for c2 in chroms[a:]:
+            if c1 == c2:
+                ri, ci, values = decay_map(nbins, rng, scale, alpha,
+                                           max_diagonal)
+            elif inter:
+                ri, ci, values = inter_map(nbins, nbins, rng)
+            else:
+                continue
+            key = f'{c1}|{c2}'
+            dims[key] = [nbins, nbins]
+            mapfiles[key] = f'{c1}_{c2}.{ext}'
+            write_boxes(f'{dirname}/{mapfiles[key]}', ri * binsize,
+                        ci * binsize, values, compresslevel=1)
+            nboxes += len(values)
+
+    metadata = {'Binsize': binsize, 'Assembly': 'synthetic', 'Species': name,
+                'Comment': 'synthetic dataset, made by synth.py', 'Date': '',
+                'Dataset': name, 'Dims': dims, 'MapFiles': mapfiles}
+    with open(f'{dirname}/metadata.json', 'w') as f:
+        json.dump(metadata, f, indent=2)
+        f.write('\n')
+    return nboxes
+
+
+def generate(outdir, species=4, chromosomes=4, bins=2000, binsize=5000,
+             genes=500, orthologs=0.8, shuffle=0.1, scale=50.0, alpha=1.0,
+             max_diagonal=200, inter=False, binary=False, seed=0):
+    """
+    Generate a synthetic dataset in *outdir*, with *species* species having
+    *chromosomes* chromosomes of *bins* bins of *binsize* bp, holding
+    *genes* genes each. See the documentation of the script for the other
+    parameters.
+    Return the configuration of the dataset, as written in its
+    `config.yaml` file.
+    """
+    os.makedirs(outdir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    names = [f'sp{i+1}' for i in range(species)]
+    chroms = [f'chr{i+1}' for i in range(chromosomes)]
+    res = f'{binsize // 1000}kb' if binsize % 1000 == 0 else f'{binsize}bp'
+
+    datasets = {}
+    for i, name in enumerate(names):
+        bed = abspath(f'{outdir}/{name}.bed')
+        with open(bed, 'w') as f:
+            for row in synth_genes(f'{name}g', chroms, bins * binsize, genes,
+                                   rng):
+                f.write('\t'.join(row))
+                f.write('\n')
+        hicdir = abspath(f'{outdir}/{name}_hic')
+        write_hic(hicdir, name, chroms, bins, binsize, rng, scale, alpha,
+                  max_diagonal, inter, binary)
+        datasets[name] = {'genes': bed, 'hic': {res: hicdir}}
+
+    # The k-th genes of the species are orthologs, but for a few shuffled
+    # ones
+    total = chromosomes * genes
+    kept = np.sort(rng.choice(total, int(orthologs * total), replace=False))
+    table = [kept]
+    for _ in names[1:]:
+        genes_sp = kept.copy()
+        moved = rng.choice(len(kept), int(shuffle * len(kept)), replace=False)
+        genes_sp[moved] = genes_sp[rng.permutation(moved)]
+        table.append(genes_sp)
+    orthofile = abspath(f'{outdir}/orthologs.tsv')
+    with open(orthofile, 'w') as f:
+        f.write('\t'.join(names))
+        f.write('\n')
+        for row in zip(*(t.tolist() for t in table)):
+            f.write('\t'.join(f'{name}g{k}' for name, k in zip(names, row)))
+            f.write('\n')
+
+    config = {'bin': abspath(os.path.dirname(__file__)), 'condacmd': '',
+              'rootdir': abspath(f'{outdir}/results'),
+              'experiment': 'synthetic', 'orthologs': orthofile,
+              'method': 'union', 'exclude': False, 'resolutions': [res],
+              'datasets': datasets}
+    # JSON is valid YAML
+    with open(f'{outdir}/config.yaml', 'w') as f:
+        json.dump(config, f, indent=2)
+        f.write('\n')
+    return config
+
+
+def cli_parser():
+    desc = 'Generate a synthetic phyloHiC dataset.'
+    parser = argparse.ArgumentParser(description=desc)
+    parser.add_argument('outdir', help='the directory of the dataset')
+    parser.add_argument('-n', '--species', type=int, default=4,
+                        help='the number of species (default: 4)')
+    parser.add_argument('-c', '--chromosomes', type=int, default=4,
+                        help='the number of chromosomes (default: 4)')
+    parser.add_argument('-L', '--bins', type=int, default=2000,
+                        help='the number of bins by chromosome (default: 2000)')
+    parser.add_argument('-b', '--binsize', type=int, default=5000,
+                        help='the size of the bins, in bp (default: 5000)')
+    parser.add_argument('-g', '--genes', type=int, default=500,
+                        help='the number of genes by chromosome (default: 500)')
+    parser.add_argument('-o', '--orthologs', type=float, default=0.8,
+                        help=('the fraction of the genes having orthologs '
+                              '(default: 0.8)'))
+    parser.add_argument('-s', '--shuffle', type=float, default=0.1,
+                        help=('the fraction of the orthologs out of synteny '
+                              '(default: 0.1)'))
+    parser.add_argument('--scale', type=float, default=50.0,
+                        help=('the mean contact on the diagonal '
+                              '(default: 50)'))
+    parser.add_argument('--alpha', type=float, default=1.0,
+                        help='the exponent of the distance decay (default: 1)')
+    parser.add_argument('-d', '--max-diagonal', type=int, default=200,
+                        help=('the maximum distance to the diagonal of the '
+                              'non-zero boxes, in bins (default: 200)'))
+    parser.add_argument('-i', '--inter', action='store_true',
+                        help='also write inter-chromosomal maps')
+    parser.add_argument('-B', '--binary', action='store_true',
+                        help='write the maps in the binary format')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='the seed of the dataset (default: 0)')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='be verbose')
+    return parser
+
+
+def main():
+    parser = cli_parser()
+    args = parser.parse_args()
+
+    if not 0 <= args.orthologs <= 1 or not 0 <= args.shuffle <= 1:
+        parser.error('--orthologs and --shuffle must be in [0, 1]')
+
+    generate(args.outdir, args.species, args.chromosomes, args.bins,
+             args.binsize, args.genes, args.orthologs, args.shuffle,
+             args.scale, args.alpha, args.max_diagonal, args.inter,
+             args.binary, args.seed)
+    if args.verbose:
+        print(f'Written {args.outdir}/config.yaml')
+
+
+if __name__ == '__main__':
+    main()
+    sys.exit(0)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+"""
+tree_support.py
+===============
+
+Reroot the trees on an outgroup species, and compute the support of the
+branches of the species tree from these trees (see :mod:`bipartitions`).
+This replaces the calls to `nw_reroot` and `nw_support` made by
+`scripts/posttreatment.sh`.
+
+For each Newick file (holding one or more trees, *e.g.* made with
+:doc:`build_trees`), the rerooted trees are written in a file with the
+same name suffixed with `_rerooted`. If a species tree is given, it is
+written with the support values of its branches (in percent) in a file
+suffixed with `_rerooted_support`.
+
+
+:created: October 2026
+:last modified: October 2026
+
+.. codeauthor::
+   Sylvain PULICANI <pulicani@lirmm.fr>
+"""
+
+import argparse
+import sys
+import os
+
+from os.path import splitext
+
+from bipartitions import (species_index, leaf_names, reroot, count_splits,
+                          annotate_support)
+
+
+def read_trees(name):
+    """
+    Read the Newick file *name*, holding one tree per line.
+    Return a list of strings.
+    """
+    with open(name, 'r') as f:
+        return [l.strip() for l in f if l.strip()]
+
+
+def cli_parser():
+    desc = ('Reroot the trees on an outgroup and compute the support of the '
+            'species tree.')
+    parser = argparse.ArgumentParser(description=desc)
+    parser.add_argument('outgroup', help='the species to root the trees on')
+    parser.add_argument('trees', nargs='+',
+                        help='the Newick files, holding one or more trees')
+    parser.add_argument('-s', '--species-tree',
+                        help=('the species tree, in Newick; if not set, the '
+                              'support is not computed'))
+    parser.add_argument('-f', '--force', action='store_true',
+                        help='overwrite the already existing files')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='be verbose')
+    return parser
+
+
+def main():
+    parser = cli_parser()
+    args = parser.parse_args()
+
+    species_tree = None
+    if args.species_tree is not None:
+        species_tree = read_trees(args.species_tree)[0]
+        if args.outgroup not in leaf_names(species_tree):
+            parser.error(f'the outgroup {args.outgroup} is not in the '
+                         f'species tree {args.species_tree}')
+
+    for filename in args.trees:
+        rerooted_name = f'{splitext(filename)[0]}_rerooted.nwk'
+        support_name = f'{splitext(filename)[0]}_rerooted_support.nwk'
+        if os.path.isfile(rerooted_name) and not args.force:
+            print(f'Skipping {filename} because {rerooted_name} already '
+                  'exists.')
+            continue
+
+        trees = read_trees(filename)
+        index = species_index(leaf_names(trees[0]))
+        if args.outgroup not in index:
+            parser.error(f'the outgroup {args.outgroup} is not a species of '
+                         f'{filename}; the species are '
+                         f'{", ".join(sorted(index))}')
+        with open(rerooted_name, 'w') as f:
+            for tree in trees:
+                f.write(reroot(tree, index, args.outgroup))
+                f.write('\n')
+        if args.verbose:
+            print(f'Written {rerooted_name}')
+
+        if species_tree is None:
+            continue
+        counts, ntrees = count_splits(trees, index, args.outgroup)
+        with open(support_name, 'w') as f:
+            f.write(annotate_support(species_tree, counts, ntrees, index,
+                                     args.outgroup))
+            f.write('\n')
+        if args.verbose:
+            print(f'Written {support_name}')
+
+
+if __name__ == '__main__':
+    main()
+    sys.exit(0)
@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+trees
+=====
+
+This module contains functions to build phylogenetic trees from distance
+matrices (NumPy arrays, see :func:`distlib.distance_matrix`), without
+calling an external program.
+
+The trees are built by `neighbor joining`_ (NJ), then optionally refined
+by nearest neighbor interchanges (NNI) under the balanced minimum
+evolution (BME) criterion, as done by `FastME`_. The BME length of a tree
+is the Pauplin length: the sum over the pairs of leaves *i*, *j* of
+:math:`2^{1 - \\tau_{ij}} d_{ij}`, where :math:`\\tau_{ij}` is the number
+of edges between *i* and *j*. After the NNI, the branch lengths are the
+BME ones.
+
+The trees are unrooted; they can be written in the Newick format.
+
+
+:created: October 2026
+:last modified: October 2026
+
+.. codeauthor::
+   Sylvain PULICANI <pulicani@lirmm.fr>
+
+.. _neighbor joining: https://doi.org/10.1093/oxfordjournals.molbev.a040454
+.. _FastME: http://www.atgc-montpellier.fr/fastme/
+"""
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+class Tree:
+    """
+    Tree represents an unrooted tree with branch lengths. The leaves are
+    the nodes 0, ..., n-1, named after the list *names*, and the internal
+    nodes are numbered from n. *edges* is a dict mapping each node to a
+    dict of its neighbors to the length of the branch between them.
+    """
+
+    def __init__(self, names, edges):
+        self.names = list(names)
+        """The names of the leaves."""
+
+        self.edges = edges
+        """The dict of the neighbors (and branch lengths) of each node."""
+
+
+    def is_leaf(self, node):
+        """
+        Tell whether *node* is a leaf.
+        """
+        return node < len(self.names)
+
+
+    def internal_edges(self):
+        """
+        Return the list of the edges (as couples of nodes) between two
+        internal nodes.
+        """
+        return [(u, v) for u in self.edges for v in self.edges[u]
+                if u < v and not self.is_leaf(u) and not self.is_leaf(v)]
+
+
+    def distances(self):
+        """
+        Compute the topological distance (number of edges) between each
+        pair of leaves. Return a n x n array of integers.
+        """
+        n = len(self.names)
+        res = np.zeros((n, n), dtype=int)
+        for i in range(n):
+            seen = {i: 0}
+            queue = deque([i])
+            while queue:
+                u = queue.popleft()
+                for v in self.edges[u]:
+                    if v not in seen:
+                        seen[v] = seen[u] + 1
+                        queue.append(v)
+            res[i] = [seen[j] for j in range(n)]
+        return res
+
+
+    def bme_length(self, dist):
+        """
+        Compute the balanced minimum evolution (Pauplin) length of the tree
+        for the distance matrix *dist* (in the order of the leaves).
+        """
+        tau = self.distances()
+        iu = np.triu_indices(len(self.names), 1)
+        return float(np.sum(2.0**(1 - tau[iu]) * np.asarray(dist)[iu]))
+
+
+    def newick(self, root=None):
+        """
+        Write the tree in the Newick format. As the tree is unrooted, it
+        is written from the internal node *root*; by default, the neighbor
+        of the first leaf. Return a string.
+        """
+        if len(self.names) == 1:
+            return f'{self.names[0]};'
+        if len(self.names) == 2:
+            length = self.edges[0][1] / 2
+            return f'({self.names[0]}:{length:.8f},{self.names[1]}:{length:.8f});'
+
+        if root is None:
+            root = next(iter(self.edges[0]))
+        return f'({self._newick_children(root, None)});'
+
+
+    def _newick_children(self, node, parent):
+        """
+        Write the subtrees of the neighbors of *node* other than *parent*.
+        """
+        res = []
+        for child, length in sorted(self.edges[node].items()):
+            if child == parent:
+                continue
+            if self.is_leaf(child):
+                sub = self.names[child]
+            else:
+                sub = f'({self._newick_children(child, node)})'
+            res.append(f'{sub}:{length:.8f}')
+        return ','.join(res)
+
+
+def neighbor_joining(dist, names):
+    """
+    Build a tree by neighbor joining from the distance matrix *dist* (a
+    square array, in the order of *names*). Return a :class:`Tree`.
+    """
+    d = np.array(dist, dtype=float)
+    n = len(names)
+    edges = {i: {} for i in range(n)}
+
+    def link(u, v, length):
+        edges[u][v] = length
+        edges[v][u] = length
+
+    if n == 2:
+        link(0, 1, d[0, 1])
+    if n <= 2:
+        return Tree(names, edges)
+
+    active = list(range(n))
+    new = n
+    while len(active) > 3:
+        m = len(active)
+        r = d.sum(axis=1)
+        q = (m - 2) * d - r[:, None] - r[None, :]
+        np.fill_diagonal(q, np.inf)
+        i, j = np.unravel_index(np.argmin(q), q.shape)
+        li = d[i, j] / 2 + (r[i] - r[j]) / (2 * (m - 2))
+        lj = d[i, j] - li
+
+        edges[new] = {}
+        link(active[i], new, li)
+        link(active[j], new, lj)
+
+        # The new node replaces i, and j is removed
+        du = (d[i] + d[j] - d[i, j]) / 2
+        d[i, :] = du
+        d[:, i] = du
+        d[i, i] = 0.0
+        d = np.delete(np.delete(d, j, axis=0), j, axis=1)
+        active[i] = new
+        del active[j]
+        new += 1
+
+    # The three remaining subtrees are joined to a last node
+    edges[new] = {}
+    for a, b, c in ((0, 1, 2), (1, 0, 2), (2, 0, 1)):
+        link(active[a], new, (d[a, b] + d[a, c] - d[b, c]) / 2)
+    return Tree(names, edges)
+
+
+def _balanced_averages(tree, dist):
+    """
+    Return a function computing the balanced average distance between two
+    disjoint subtrees of *tree*, for the distance matrix *dist*. A subtree
+    is given by a directed edge (u, v): it is the subtree rooted at v,
+    away from u. The results are cached, so the function must not be used
+    once the tree has changed.
+    """
+    memo = {}
+
+    def delta(x, y):
+        if (x, y) in memo:
+            return memo[x, y]
+        u, v = x
+        w, z = y
+        if not tree.is_leaf(v):
+            res = sum(delta((v, c), y) for c in tree.edges[v] if c != u) / 2
+        elif not tree.is_leaf(z):
+            res = sum(delta(x, (z, c)) for c in tree.edges[z] if c != w) / 2
+        else:
+            res = dist[v, z]
+        memo[x, y] = res
+        return res
+
+    return delta
+
+
+def _bme_lengths(tree, dist):
+    """
+    Set the branch lengths of *tree* to the balanced minimum evolution
+    ones, for the distance matrix *dist*.
+    """
+    delta = _balanced_averages(tree, dist)
+    lengths = {}
+    for u in tree.edges:
+        for v in tree.edges[u]:
+            if u > v:
+                continue
+            if tree.is_leaf(u) or tree.is_leaf(v):
+                leaf, p = (u, v) if tree.is_leaf(u) else (v, u)
+                b, c = [(p, x) for x in tree.edges[p] if x != leaf]
+                i = (p, leaf)
+                lengths[u, v] = (delta(i, b) + delta(i, c) - delta(b, c)) / 2
+            else:
+                a, b = [(u, x) for x in tree.edges[u] if x != v]
+                c, e = [(v, x) for x in tree.edges[v] if x != u]
+                lengths[u, v] = ((delta(a, c) + delta(b, e) + delta(a, e) +
+                                  delta(b, c)) / 4 -
+                                 (delta(a, b) + delta(c, e)) / 2)
+    for (u, v), length in lengths.items():
+        tree.edges[u][v] = length
+        tree.edges[v][u] = length
+
+
+def bme_nni(tree, dist, tolerance=1e-12):
+    """
+    Refine *tree* in-place by nearest neighbor interchanges, under the
+    balanced minimum evolution criterion, for the distance matrix *dist*.
+    The best interchange is done until none reduces the length of the
+    tree. Then, the branch lengths are set to the BME ones.
+    Return the number of interchanges done.
+    """
+    dist = np.asarray(dist, dtype=float)
+    if len(tree.names) < 3:
+        return 0
+    if len(tree.names) < 4:
+        _bme_lengths(tree, dist)
+        return 0
+
+    nswaps = 0
+    while True:
+        delta = _balanced_averages(tree, dist)
+        best = None
+        for u, v in tree.internal_edges():
+            a, b = [(u, x) for x in sorted(tree.edges[u]) if x != v]
+            c, d = [(v, x) for x in sorted(tree.edges[v]) if x != u]
+            current = delta(a, b) + delta(c, d)
+            # Swapping b and c gives ac|bd, swapping b and d gives ad|bc
+            for y, p1, p2 in ((c, (a, c), (b, d)), (d, (a, d), (b, c))):
+                gain = (delta(*p1) + delta(*p2) - current) / 4
+                if gain < -tolerance and (best is None or gain < best[0]):
+                    best = (gain, u, v, b[1], y[1])
+        if best is None:
+            break
+
+        _, u, v, x, y = best
+        lx = tree.edges[u].pop(x)
+        del tree.edges[x][u]
+        ly = tree.edges[v].pop(y)
+        del tree.edges[y][v]
+        tree.edges[u][y] = tree.edges[y][u] = ly
+        tree.edges[v][x] = tree.edges[x][v] = lx
+        nswaps += 1
+
+    _bme_lengths(tree, dist)
+    return nswaps
+
+
+def build_tree(dist, names, nni=True):
+    """
+    Build a tree from the distance matrix *dist* (a square array, in the
+    order of *names*): by neighbor joining, then refined by BME nearest
+    neighbor interchanges if *nni* is True. Return a :class:`Tree`.
+    """
+    tree = neighbor_joining(dist, names)
+    if nni:
+        bme_nni(tree, dist)
+    return tree
+
+
+def _build_newick(dist, names, nni):
+    return build_tree(dist, names, nni).newick()
+
+
+def build_trees(matrices, names, nni=True, jobs=1):
+    """
+    Build one tree for each distance matrix of the sequence *matrices*
+    (see :func:`build_tree`), using *jobs* processes.
+    Return the list of the trees, in the Newick format.
+    """
+    if jobs == 1:
+        return [_build_newick(m, names, nni) for m in matrices]
+    with ProcessPoolExecutor(jobs) as executor:
+        n = len(matrices)
+        return list(executor.map(_build_newick, matrices, [names] * n,
+                                 [nni] * n,
+                                 chunksize=max(1, n // (4 * jobs))))
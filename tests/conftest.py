@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+"""
+The fixtures shared by the tests: a small synthetic dataset (see
+:doc:`/scripts/synth`), and its pairs and values files made with the
+scripts themselves.
+"""
+
+import subprocess
+import sys
+import os
+import re
+
+from itertools import combinations
+from os.path import dirname, abspath
+
+import pytest
+
+from toolz import merge_with
+from toolz.curried import merge
+
+SRC = abspath(f'{dirname(__file__)}/../src')
+sys.path.insert(0, SRC)
+
+import synth
+from iolib import read_orthos, read_values
+
+
+def run_script(script, *args):
+    """
+    Run the *script* of the `src` directory with the *args*, and fail if
+    it does not succeed.
+    """
+    subprocess.run([sys.executable, f'{SRC}/{script}'] + [str(a) for a in args],
+                   check=True)
+
+
+@pytest.fixture(scope='session')
+def dataset(tmp_path_factory):
+    """
+    A synthetic dataset of 4 species, with 2 chromosomes of 600 bins and
+    150 genes each, and its configuration (as returned by
+    :func:`synth.generate`).
+    """
+    outdir = tmp_path_factory.mktemp('synth')
+    return synth.generate(str(outdir), species=4, chromosomes=2, bins=600,
+                          genes=150, max_diagonal=100, inter=True, seed=1)
+
+
+@pytest.fixture(scope='session')
+def pairs(dataset, tmp_path_factory):
+    """
+    The pairs files of the species of the *dataset*: a dict of the species
+    to their pairs file.
+    """
+    outdir = tmp_path_factory.mktemp('pairs')
+    res = dataset['resolutions'][0]
+    files = {}
+    for d, data in dataset['datasets'].items():
+        files[d] = f'{outdir}/{d}.tsv.gz'
+        run_script('make_pairs.py', '-N', data['genes'], data['hic'][res],
+                   files[d])
+    return files
+
+
+@pytest.fixture(scope='session')
+def values(dataset, pairs, tmp_path_factory):
+    """
+    The values files of all the pairs of species of the *dataset*, joined
+    with all the adjacencies and no threshold: a list of file names.
+    """
+    outdir = tmp_path_factory.mktemp('values')
+    files = []
+    for d1, d2 in combinations(dataset['datasets'], 2):
+        files.append(f'{outdir}/{d1}_{d2}_values.tsv.gz')
+        run_script('join_pairs.py', dataset['orthologs'], pairs[d1],
+                   pairs[d2], files[-1])
+    return files
+
+
+@pytest.fixture(scope='session')
+def merged(dataset, values):
+    """
+    The values of all the files, merged by pairs of orthology groups, as
+    done by dist_all_pairs: a tuple (sorted species, dict).
+    """
+    orthos, groups = read_orthos(dataset['orthologs'])
+    res = {}
+    for name in values:
+        sp_left, sp_right = re.search(r'(\w+)_(\w+)_values', name).groups()
+        res = merge_with(merge, res, read_values(orthos, groups, sp_left,
+                                                 sp_right, name))
+    return sorted(dataset['datasets']), res
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+import gzip
+import csv
+import re
+import shutil
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pytest
+
+from bgzf import (BgzfWriter, EOF_BLOCK, BLOCK_SIZE, read_index, read_rows,
+                  iter_chunks, iter_slice, split_index)
+from iolib import (TableWriter, CHUNK_ROWS, read_orthos, read_values,
+                   init_values_worker, read_phylip)
+from conftest import run_script
+
+
+def read_all(name):
+    with gzip.open(name, 'rt') as f:
+        return list(csv.reader(f, delimiter='\t'))
+
+
+@pytest.mark.parametrize('threads', [1, 4])
+def test_writer_is_gzip(tmp_path, threads):
+    rng = np.random.default_rng(0)
+    lines = [f'{i}\t{v}\n'.encode() for i, v in enumerate(rng.random(50000))]
+    data = b''.join(lines)
+    assert len(data) > 10 * BLOCK_SIZE
+
+    name = str(tmp_path / f'{threads}.gz')
+    marks = []
+    with BgzfWriter(name, threads=threads) as writer:
+        for i, line in enumerate(lines):
+            if i % 10000 == 0:
+                marks.append((i, writer.mark()))
+            writer.write(line)
+    with open(name, 'rb') as f:
+        raw = f.read()
+    assert raw.endswith(EOF_BLOCK)
+    assert gzip.decompress(raw) == data
+
+    # Compressing in threads writes the same blocks
+    serial = str(tmp_path / 'serial.gz')
+    with BgzfWriter(serial) as f:
+        f.write(data)
+    with open(serial, 'rb') as f:
+        assert f.read() == raw
+
+    for i, mark in marks:
+        rows = list(read_rows(name, writer.virtual_offset(mark), 3))
+        assert rows == [l.decode().rstrip('\n').split('\t')
+                        for l in lines[i:i+3]]
+
+
+def test_values_index_has_several_chunks(values):
+    for name in values:
+        rows = read_all(name)
+        chunks = read_index(name)
+        assert len(rows) > CHUNK_ROWS
+        assert len(chunks) == -(-len(rows) // CHUNK_ROWS)
+        assert all(c[0] == '*' and c[2] <= CHUNK_ROWS for c in chunks)
+        assert sum(c[2] for c in chunks) == len(rows)
+
+
+def test_split_index_reads_all_rows(values):
+    name = values[0]
+    rows = read_all(name)
+    parts = split_index(read_index(name), 3)
+    assert len(parts) == 3
+    assert [r for p in parts for r in iter_chunks(name, p)] == rows
+
+
+def test_read_values_by_chunks(dataset, values, tmp_path):
+    orthos, groups = read_orthos(dataset['orthologs'])
+    name = values[0]
+    sp_left, sp_right = re.search(r'(\w+)_(\w+)_values', name).groups()
+    # Without its index, the file is read at once
+    unindexed = shutil.copy(name, tmp_path)
+    expected = read_values(orthos, groups, sp_left, sp_right, unindexed)
+
+    res = read_values(orthos, groups, sp_left, sp_right, name)
+    assert list(res.items()) == list(expected.items())
+    with ProcessPoolExecutor(3, initializer=init_values_worker,
+                             initargs=(orthos, groups)) as executor:
+        res = read_values(orthos, groups, sp_left, sp_right, name, executor, 3)
+    assert list(res.items()) == list(expected.items())
+
+
+def test_dist_scripts_read_in_parallel(dataset, values, tmp_path):
+    for jobs in (1, 3):
+        run_script('dist_all_pairs.py', '-j', jobs, '-m', 'all',
+                   dataset['orthologs'], tmp_path / f'{jobs}.phylip', *values)
+    for mode in ('intersection', 'atLeastTwo', 'union'):
+        (sp1, m1), = read_phylip(tmp_path / f'1_{mode}.phylip')
+        (sp3, m3), = read_phylip(tmp_path / f'3_{mode}.phylip')
+        o1, o3 = np.argsort(sp1), np.argsort(sp3)
+        assert sorted(sp1) == sorted(sp3)
+        assert np.array_equal(m1[np.ix_(o1, o1)], m3[np.ix_(o3, o3)])
+
+
+def test_pairs_index_slices(pairs):
+    name = next(iter(pairs.values()))
+    rows = read_all(name)
+    chunks = read_index(name)
+    for key in {c[0] for c in chunks}:
+        sliced = [r for c in chunks if c[0] == key
+                  for r in rows[c[1]:c[1]+c[2]]]
+        assert list(iter_slice(name, key)) == sliced
+    # The chunks are consecutive, and cover the whole file
+    first = 0
+    for key, start, nrows, _ in chunks:
+        assert start == first
+        first += nrows
+    assert first == len(rows)
+    assert list(iter_chunks(name, chunks)) == rows
+
+
+def test_table_writer_chunks(tmp_path):
+    name = str(tmp_path / 'table.tsv.gz')
+    rows = [[str(i), f'{i / 7:.4f}'] for i in range(25)]
+    with TableWriter(name, chunk_rows=4) as f:
+        f.writerows(rows[:3], 'a')
+        f.writerows(rows[3:10], 'a')
+        f.writerows(rows[10:12], 'b')
+        f.writerows(rows[12:], 'a')
+    chunks = read_index(name)
+    assert [(c[0], c[1], c[2]) for c in chunks] ==\
+        [('a', 0, 4), ('a', 4, 4), ('a', 8, 2), ('b', 10, 2), ('a', 12, 4),
+         ('a', 16, 4), ('a', 20, 4), ('a', 24, 1)]
+    assert read_all(name) == rows
+    assert list(iter_slice(name, 'b')) == rows[10:12]
+    assert list(iter_chunks(name, chunks[4:6])) == rows[12:20]
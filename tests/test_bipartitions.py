@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+import subprocess
+import sys
+
+from collections import Counter
+
+import numpy as np
+
+from bipartitions import (species_index, leaf_names, splits, count_splits,
+                          reroot, annotate_support, TOKENS)
+from trees import neighbor_joining
+from conftest import SRC
+
+
+NAMES = [f'sp{i}' for i in range(8)]
+
+
+def random_trees(n, seed=0):
+    rng = np.random.default_rng(seed)
+    res = []
+    for _ in range(n):
+        d = rng.random((len(NAMES), len(NAMES)))
+        d = d + d.T
+        np.fill_diagonal(d, 0.0)
+        res.append(neighbor_joining(d, NAMES))
+    return res
+
+
+def reference_splits(tree, outgroup):
+    """
+    The non-trivial bipartitions of the Tree, as the sets of names on the
+    side of each internal edge not holding the outgroup.
+    """
+    res = set()
+    for u, v in tree.internal_edges():
+        side = set()
+        stack = [(v, u)]
+        while stack:
+            x, parent = stack.pop()
+            if tree.is_leaf(x):
+                side.add(tree.names[x])
+            stack.extend((y, x) for y in tree.edges[x] if y != parent)
+        if outgroup in side:
+            side = set(tree.names) - side
+        if 1 < len(side) < len(tree.names) - 1:
+            res.add(frozenset(side))
+    return res
+
+
+def as_names(split, index):
+    return frozenset(n for n, i in index.items() if split >> i & 1)
+
+
+def test_count_splits():
+    trees = random_trees(20)
+    index = species_index(NAMES)
+    counts, ntrees = count_splits((t.newick() for t in trees), index, 'sp3')
+    expected = Counter()
+    for t in trees:
+        expected.update(reference_splits(t, 'sp3'))
+    assert ntrees == 20
+    assert {as_names(s, index): n for s, n in counts.items()} == expected
+
+
+def test_reroot_keeps_splits():
+    index = species_index(NAMES)
+    for t in random_trees(5, 1):
+        newick = t.newick()
+        rooted = reroot(newick, index, 'sp5')
+        assert sorted(leaf_names(rooted)) == NAMES
+        assert rooted.startswith('(sp5:')
+        before, after = splits(newick, index, 'sp5'), splits(rooted, index,
+                                                             'sp5')
+        assert before.keys() == after.keys()
+        assert all(np.isclose(before[s], after[s]) for s in before)
+
+
+def test_annotate_support():
+    trees = random_trees(30, 2)
+    index = species_index(NAMES)
+    counts, ntrees = count_splits((t.newick() for t in trees), index)
+    species_tree = trees[0].newick()
+    annotated = annotate_support(species_tree, counts, ntrees, index)
+
+    # The labels after the closing parentheses, in order
+    labels = []
+    tokens = TOKENS.findall(annotated)
+    for prev, tok in zip(tokens, tokens[1:]):
+        if prev == ')' and tok not in '(),;' and tok[0] != ':':
+            labels.append(int(tok))
+    first = NAMES[0]
+    expected = sorted(round(100 * sum(s in reference_splits(t, first)
+                                      for t in trees) / ntrees)
+                      for s in reference_splits(trees[0], first))
+    assert sorted(labels) == expected
+
+
+def test_unknown_outgroup(tmp_path):
+    trees = tmp_path / 'trees.nwk'
+    trees.write_text(''.join(f'{t.newick()}\n' for t in random_trees(3)))
+    res = subprocess.run([sys.executable, f'{SRC}/tree_support.py', 'sp99',
+                          str(trees)], capture_output=True, text=True)
+    assert res.returncode == 2
+    assert 'the outgroup sp99 is not a species' in res.stderr
+    assert 'Traceback' not in res.stderr
+    assert not (tmp_path / 'trees_rerooted.nwk').exists()
+
+    # The species tree is checked too
+    species_tree = tmp_path / 'species.nwk'
+    species_tree.write_text(random_trees(1)[0].newick().replace('sp7', 'x'))
+    res = subprocess.run([sys.executable, f'{SRC}/tree_support.py', '-s',
+                          str(species_tree), 'sp7', str(trees)],
+                         capture_output=True, text=True)
+    assert res.returncode == 2
+    assert 'is not in the species tree' in res.stderr
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+from distlib import (MODES, scaled_L2norm, filter_values, distance_matrix,
+                     trait_matrix, mode_mask, scaled_L2norm_matrix,
+                     partial_statistics, statistics_matrix)
+from iolib import read_phylip
+from conftest import run_script
+
+
+@pytest.mark.parametrize('mode', MODES)
+def test_matrix_matches_scaled_L2norm(merged, mode):
+    species, values = merged
+    traits = trait_matrix(species, list(values.values()))
+    mask = mode_mask(mode, traits)
+    expected = scaled_L2norm(species,
+                             filter_values(mode, species, values.values()))
+    assert np.count_nonzero(mask) ==\
+        len(list(filter_values(mode, species, values.values())))
+    assert np.allclose(
+        distance_matrix(species, scaled_L2norm_matrix(species, traits, mask)),
+        distance_matrix(species, expected), rtol=1e-12, atol=0)
+
+
+def test_partial_statistics_match_scaled_L2norm(merged):
+    species, values = merged
+    traits = trait_matrix(species, list(values.values()))
+    labels = np.arange(len(traits)) % 5
+    sums, counts = partial_statistics(traits, labels, 5)
+    expected = distance_matrix(species, scaled_L2norm(species, values.values()))
+    assert np.allclose(statistics_matrix(sums.sum(0), counts.sum(0)),
+                       expected, rtol=1e-12, atol=0)
+
+
+def test_trait_matrix_rejects_nan():
+    with pytest.raises(ValueError, match="There shouldn't be any NaN"):
+        trait_matrix(['sp1', 'sp2'], [{'sp1': 1.0}, {'sp2': float('nan')}])
+
+
+def test_dist_all_pairs_modes(dataset, values, tmp_path):
+    run_script('dist_all_pairs.py', '-m', 'all', dataset['orthologs'],
+               tmp_path / '{mode}.phylip', *values)
+    for mode in MODES:
+        run_script('dist_all_pairs.py', '-m', mode, dataset['orthologs'],
+                   tmp_path / f'single_{mode}.phylip', *values)
+        # The species are in the order of a set
+        (sp1, m1), = read_phylip(tmp_path / f'{mode}.phylip')
+        (sp2, m2), = read_phylip(tmp_path / f'single_{mode}.phylip')
+        o1, o2 = np.argsort(sp1), np.argsort(sp2)
+        assert sorted(sp1) == sorted(sp2)
+        assert np.array_equal(m1[np.ix_(o1, o1)], m2[np.ix_(o2, o2)])
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import numpy as np
+
+from dstack import read_stack, write_stack, StackWriter, format_phylip
+from iolib import phylip
+from conftest import run_script
+
+
+def test_stack_roundtrip(tmp_path):
+    rng = np.random.default_rng(0)
+    species = ['sp1', 'sp2', 'sp3', 'sp4']
+    matrices = rng.random((5, 4, 4))
+    name = str(tmp_path / 'm.dstack')
+    write_stack(name, species, matrices)
+    for mmap in (True, False):
+        sp, data = read_stack(name, mmap)
+        assert sp == species
+        assert np.array_equal(data, matrices)
+
+    with StackWriter(name, species) as writer:
+        for m in matrices:
+            writer.append(m)
+    assert np.array_equal(read_stack(name)[1], matrices)
+
+
+def test_format_phylip_matches_phylip():
+    rng = np.random.default_rng(1)
+    species = ['sp1', 'sp2', 'sp3']
+    matrices = rng.random((3, 3, 3))
+    matrices = matrices + matrices.transpose(0, 2, 1)
+    for text, m in zip(format_phylip(species, matrices), matrices):
+        distances = {s1: {s2: m[i, j] for j, s2 in enumerate(species)}
+                     for i, s1 in enumerate(species)}
+        assert text == phylip(species, distances)
+
+
+def test_bootstrap_one_file_stack(dataset, values, tmp_path):
+    outdir = tmp_path / 'boot'
+    run_script('bootstrap.py', '-o', '-s', dataset['orthologs'], outdir, 3,
+               *values)
+    assert os.listdir(outdir) == ['all_replicates.dstack']
+    species, data = read_stack(str(outdir / 'all_replicates.dstack'))
+    assert species == sorted(dataset['datasets'])
+    assert data.shape == (3, 4, 4)
+    assert np.allclose(data, data.transpose(0, 2, 1))
+    assert np.all(data[:, np.arange(4), np.arange(4)] == 0)
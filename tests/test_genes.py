@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+import random
+
+import numpy as np
+
+from genes import read_bed_table, read_bed, compute_adjacent
+
+
+def reference_read_bed(name):
+    """The BED reader before the GeneTable."""
+    res = []
+    with open(name, 'r') as f:
+        lines = [l for l in f.read().split('\n') if l]
+    for line in lines:
+        try:
+            chrom, start, end, gname, _, strand = line.split('\t')
+        except ValueError:
+            continue
+        res.append({'name': gname, 'chrom': chrom, 'start': int(start),
+                    'end': int(end), 'strand': strand})
+    res.sort(key=lambda g: g['start'])
+    res.sort(key=lambda g: g['chrom'])
+    return res
+
+
+def test_gene_table_matches_read_bed(dataset, tmp_path):
+    with open(dataset['datasets']['sp3']['genes']) as f:
+        lines = f.read().splitlines()
+    random.Random(0).shuffle(lines)
+    name = str(tmp_path / 'genes.bed')
+    with open(name, 'w') as f:
+        f.write('\n'.join(lines[:10] + ['track name=genes'] + lines[10:]))
+        f.write('\n')
+
+    expected = reference_read_bed(name)
+    assert read_bed(name) == expected
+
+    table = read_bed_table(name)
+    assert len(table) == len(expected)
+    assert [table.index[g['name']] for g in expected] ==\
+        list(range(len(expected)))
+
+    adjacent = compute_adjacent(expected)
+    rows = np.arange(len(table) - 1)
+    for i, adj in zip(rows, table.adjacent(rows, rows + 1)):
+        assert adj == (adjacent[table.names[i]]['right'] ==
+                       table.names[i + 1])
+
+    for code, chrom in enumerate(table.chroms):
+        lo, hi = table.chrom_range(code)
+        assert [g['name'] for g in expected if g['chrom'] == chrom] ==\
+            table.names[lo:hi]
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+import gzip
+import json
+import os
+
+from itertools import product
+
+import numpy as np
+import pytest
+
+from hic import HiC, NoSuchHeatmap, AsymmetricHeatmap, write_map
+
+
+def reference_rows(m, binsize):
+    """The rows of a map, as written by norm_center before write_map."""
+    rows = []
+    for i, j in product(*map(range, m.shape)):
+        if m[i, j] == 0.0:
+            continue
+        rows.append([i*binsize, j*binsize, m[i, j]])
+    return rows
+
+
+def read_rows(name):
+    opener = gzip.open if name.endswith('.gz') else open
+    with opener(name, 'rt') as f:
+        return [[int(r), int(c), float(v)]
+                for r, c, v in (l.split('\t') for l in f)]
+
+
+@pytest.mark.parametrize('ext', ['tsv.gz', 'tsv', 'npz'])
+def test_write_map(tmp_path, ext):
+    rng = np.random.default_rng(0)
+    m = rng.normal(size=(40, 30)) * (rng.random((40, 30)) < 0.3)
+    name = str(tmp_path / f'chr1_chr2.{ext}')
+    write_map(name, m, 1000)
+    if ext != 'npz':
+        assert read_rows(name) == reference_rows(m, 1000)
+
+    metadata = {'Binsize': 1000, 'Dims': {'chr1|chr2': [40, 30]},
+                'MapFiles': {'chr1|chr2': os.path.basename(name)}}
+    with open(tmp_path / 'metadata.json', 'w') as f:
+        json.dump(metadata, f)
+    hicdata = HiC(str(tmp_path))
+    hicdata.load_map('chr1', 'chr2')
+    assert np.array_equal(hicdata.current['data'], m)
+
+
+def scrambled(hicdir, c1, c2, seed):
+    hicdata = HiC(hicdir)
+    hicdata.load_map(c1, c2, scramble=True, seed=seed)
+    return hicdata.current['data']
+
+
+@pytest.mark.parametrize('chroms', [('chr1', 'chr1'), ('chr1', 'chr2')])
+def test_scramble(dataset, chroms):
+    hicdir = dataset['datasets']['sp1']['hic'][dataset['resolutions'][0]]
+    hicdata = HiC(hicdir)
+    hicdata.load_map(*chroms)
+    original = hicdata.current['data']
+
+    m = scrambled(hicdir, *chroms, 3)
+    assert not np.array_equal(m, original)
+    assert np.array_equal(np.isnan(m), np.isnan(original))
+    if chroms[0] == chroms[1]:
+        # The upper triangle is shuffled, then mirrored
+        upper = np.triu_indices_from(m)
+        assert np.array_equal(m, m.T)
+        assert np.array_equal(np.sort(m[upper]), np.sort(original[upper]))
+    else:
+        assert np.array_equal(np.sort(m, axis=None),
+                              np.sort(original, axis=None))
+
+    # The same seed scrambles the same way, another one does not
+    assert np.array_equal(scrambled(hicdir, *chroms, 3), m)
+    assert not np.array_equal(scrambled(hicdir, *chroms, 4), m)
+
+
+def test_scramble_asymmetric(tmp_path):
+    m = np.arange(16, dtype=float).reshape(4, 4)
+    write_map(str(tmp_path / 'chr1_chr1.tsv'), m, 1000)
+    metadata = {'Binsize': 1000, 'Dims': {'chr1|chr1': [4, 4]},
+                'MapFiles': {'chr1|chr1': 'chr1_chr1.tsv'}}
+    with open(tmp_path / 'metadata.json', 'w') as f:
+        json.dump(metadata, f)
+    with pytest.raises(AsymmetricHeatmap):
+        HiC(str(tmp_path)).load_map('chr1', 'chr1', scramble=True, seed=0)
+
+
+def reference_contacts(hicdata, chroms1, starts1, chroms2, starts2, band):
+    """The contacts fetched one at a time with HiC.get_contact."""
+    res = []
+    loaded = None
+    for c1, s1, c2, s2 in zip(chroms1, starts1, chroms2, starts2):
+        if {c1, c2} != loaded:
+            try:
+                hicdata.load_map(c1, c2, band=band)
+                loaded = {c1, c2}
+            except NoSuchHeatmap:
+                loaded = None
+                res.append(float('nan'))
+                continue
+        res.append(hicdata.get_contact({'chrom': c1, 'start': s1},
+                                       {'chrom': c2, 'start': s2}))
+    return res
+
+
+@pytest.mark.parametrize('band', [None, 50])
+def test_get_contacts(dataset, band):
+    hicdir = dataset['datasets']['sp2']['hic'][dataset['resolutions'][0]]
+    hicdata = HiC(hicdir)
+    rng = np.random.default_rng(2)
+    n = 2000
+    # Some positions are out of bounds, and chr3 has no heatmap
+    chroms1 = rng.choice(['chr1', 'chr2', 'chr3'], n, p=[0.45, 0.45, 0.1])
+    chroms2 = rng.choice(['chr1', 'chr2', 'chr3'], n, p=[0.45, 0.45, 0.1])
+    starts1 = rng.integers(0, 650 * hicdata.binsize, n)
+    starts2 = rng.integers(0, 650 * hicdata.binsize, n)
+    # Grouped by pair of chromosomes, so each heatmap is loaded once by
+    # the reference
+    first = chroms1 < chroms2
+    order = np.lexsort((np.where(first, chroms2, chroms1),
+                        np.where(first, chroms1, chroms2)))
+    chroms1, starts1 = chroms1[order], starts1[order]
+    chroms2, starts2 = chroms2[order], starts2[order]
+
+    res = hicdata.get_contacts(chroms1, starts1, chroms2, starts2, band=band)
+    expected = reference_contacts(HiC(hicdir), chroms1, starts1, chroms2,
+                                  starts2, band)
+    assert np.array_equal(res, expected, equal_nan=True)
+    assert not np.all(np.isnan(res))
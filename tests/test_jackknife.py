@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+from distlib import scaled_L2norm, filter_values, distance_matrix
+from dstack import read_stack
+from genes import read_bed_table
+from iolib import read_orthos_species, read_phylip
+from jackknife import block_labels, chromosome_labels
+from conftest import run_script
+
+
+def reference_distances(species, values, mode):
+    """The distance matrix, recomputed from the values."""
+    return distance_matrix(species, scaled_L2norm(
+        species, filter_values(mode, species, values)))
+
+
+def read_replicates(outdir):
+    with open(outdir / 'replicates.tsv') as f:
+        next(f)
+        return [l.rstrip('\n').split('\t')[1] for l in f]
+
+
+@pytest.mark.parametrize('mode', ['intersection', 'union'])
+def test_blocks_match_recomputation(dataset, values, merged, tmp_path, mode):
+    species, merged_values = merged
+    outdir = tmp_path / 'jack'
+    run_script('jackknife.py', '-b', 5, '-d', 2, '--seed', 3, '-m', mode,
+               '-s', dataset['orthologs'], outdir, *values)
+    sp, matrices = read_stack(str(outdir / 'all_replicates.dstack'))
+    assert sp == species
+
+    (sp_full, full), = read_phylip(outdir / 'full_data.phylip')
+    assert sp_full == species
+    # The PHYLIP files hold 8 decimals
+    assert np.allclose(full, reference_distances(
+        species, merged_values.values(), mode), rtol=0, atol=5e-9)
+
+    keys = list(merged_values)
+    labels = block_labels(keys, 5, 3).tolist()
+    left_out = read_replicates(outdir)
+    assert len(left_out) == len(matrices) == 10
+    for blocks, m in zip(left_out, matrices):
+        blocks = {int(b) for b in blocks.split(',')}
+        kept = [merged_values[k] for k, l in zip(keys, labels)
+                if l not in blocks]
+        assert np.allclose(m, reference_distances(species, kept, mode),
+                           rtol=1e-9, atol=1e-12)
+
+
+def test_chromosomes_match_recomputation(dataset, values, merged, tmp_path):
+    species, merged_values = merged
+    genes_file = dataset['datasets']['sp2']['genes']
+    outdir = tmp_path / 'jack'
+    run_script('jackknife.py', '-r', 'sp2', '-g', genes_file, '-s',
+               dataset['orthologs'], outdir, *values)
+    _, matrices = read_stack(str(outdir / 'all_replicates.dstack'))
+
+    genes = read_bed_table(genes_file)
+    reference = read_orthos_species(dataset['orthologs'], 'sp2')
+    keys = list(merged_values)
+    labels = chromosome_labels(keys, reference, genes).tolist()
+    nc = len(genes.chroms)
+    left_out = read_replicates(outdir)
+    assert left_out == genes.chroms
+    for chrom, m in zip(left_out, matrices):
+        c = genes.chroms.index(chrom)
+        kept = [merged_values[k] for k, l in zip(keys, labels)
+                if l == nc * nc or c not in divmod(l, nc)]
+        assert np.allclose(m, reference_distances(species, kept,
+                                                  'intersection'),
+                           rtol=1e-9, atol=1e-12)
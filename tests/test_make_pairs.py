@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+import gzip
+
+import numpy as np
+import pytest
+
+from genes import read_bed_table
+from make_pairs import band_pairs
+from conftest import run_script
+
+
+def read_pairs(name):
+    with gzip.open(name, 'rt') as f:
+        return [l.rstrip('\n').split('\t') for l in f]
+
+
+def test_band_pairs():
+    rng = np.random.default_rng(0)
+    starts = np.sort(rng.integers(0, 10**6, 3000))
+    pairs = [(i, j) for ii, jj in band_pairs(starts, 5000)
+             for i, j in zip(ii.tolist(), jj.tolist())]
+    expected = [(i, j) for i in range(len(starts))
+                for j in range(i + 1, len(starts))
+                if starts[j] - starts[i] <= 5000]
+    assert pairs == expected
+
+
+@pytest.mark.parametrize('distance', [20000, 130000])
+def test_max_distance_filters_pairs(dataset, pairs, tmp_path, distance):
+    data = dataset['datasets']['sp1']
+    genes = read_bed_table(data['genes'])
+    tss = dict(zip(genes.names, genes.start.tolist()))
+    chrom = {n: genes.chroms[c] for n, c in zip(genes.names,
+                                                 genes.chrom.tolist())}
+    expected = [r for r in read_pairs(pairs['sp1'])
+                if chrom[r[0]] == chrom[r[1]] and
+                abs(tss[r[0]] - tss[r[1]]) <= distance]
+
+    outfile = tmp_path / 'pairs.tsv.gz'
+    run_script('make_pairs.py', '-N', '--intra', '-d', distance,
+               data['genes'], data['hic'][dataset['resolutions'][0]],
+               outfile)
+    assert read_pairs(outfile) == expected
+
+
+@pytest.mark.parametrize('options', [[], ['-N'], ['-N', '--intra', '-d',
+                                                  50000]])
+def test_extra_matches_separate_runs(dataset, tmp_path, options):
+    # The Hi-C data of the other species stand for other resolutions
+    genes = dataset['datasets']['sp1']['genes']
+    res = dataset['resolutions'][0]
+    hicdirs = [dataset['datasets'][d]['hic'][res] for d in ('sp1', 'sp2', 'sp3')]
+    outfiles = [tmp_path / f'{i}.tsv.gz' for i in range(3)]
+    extra = []
+    for h, o in zip(hicdirs[1:], outfiles[1:]):
+        extra += ['-e', h, o]
+    run_script('make_pairs.py', *options, *extra, genes, hicdirs[0],
+               outfiles[0])
+
+    for h, o in zip(hicdirs, outfiles):
+        single = tmp_path / 'single.tsv.gz'
+        run_script('make_pairs.py', *options, genes, h, single)
+        assert read_pairs(o) == read_pairs(single)
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+
+import gzip
+import json
+import pstats
+
+from metrics import Metrics
+from conftest import run_script
+
+
+def test_merge():
+    m1, m2 = Metrics(), Metrics()
+    for m in (m1, m2):
+        with m.stage('read'):
+            m.count('rows', 10)
+    with m2.stage('write'):
+        pass
+    m1.merge(m2.to_dict())
+    d = m1.to_dict()
+    assert d['counters'] == {'rows': 20}
+    assert d['stages']['read']['calls'] == 2
+    assert d['stages']['write']['calls'] == 1
+
+
+def test_metrics_file(dataset, tmp_path):
+    data = dataset['datasets']['sp1']
+    outfile = tmp_path / 'pairs.tsv.gz'
+    run_script('make_pairs.py', '--metrics', tmp_path / 'metrics.json',
+               '--profile', tmp_path / 'profile', data['genes'],
+               data['hic'][dataset['resolutions'][0]], outfile)
+    with open(tmp_path / 'metrics.json') as f:
+        measures = json.load(f)
+    with gzip.open(outfile, 'rt') as f:
+        nrows = sum(1 for _ in f)
+
+    assert measures['script'] == 'make_pairs.py'
+    assert measures['argv'][-1] == str(outfile)
+    assert measures['counters']['pairs_made'] == nrows
+    assert measures['peak_rss_mb'] > 0
+    assert 'get_contacts' in measures['stages']
+    assert all(s['seconds'] <= measures['seconds']
+               for s in measures['stages'].values())
+    assert pstats.Stats(str(tmp_path / 'profile')).total_calls > 0
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+import json
+import shutil
+import logging
+
+import numpy as np
+
+from hic import HiC
+from norm_center import parse_size, schedule, estimate_memory, normalize
+from conftest import run_script
+
+
+def copy_hic(dataset, species, tmp_path):
+    res = dataset['resolutions'][0]
+    dirs = []
+    for sp in species:
+        dirs.append(str(tmp_path / sp))
+        shutil.copytree(dataset['datasets'][sp]['hic'][res], dirs[-1])
+    return dirs
+
+
+def test_normalize_with_offset(dataset, tmp_path):
+    dirs = copy_hic(dataset, ['sp1', 'sp2'], tmp_path)
+    run_script('norm_center.py', '-z', 1, '-t', 2, *dirs)
+
+    expected = {}
+    for d in dirs:
+        hicdata = HiC(d)
+        hicdata.load_all_maps()
+        mean = np.mean(hicdata.current['data'])
+        std = np.std(hicdata.current['data'])
+        expected[d] = {}
+        original = HiC(d)
+        for c1, c2 in original.iter_maps():
+            expected[d][c1, c2] = (original.current['data'] - mean) / std
+    minimum = min(m.min() for e in expected.values() for m in e.values())
+
+    for d in dirs:
+        normalized = HiC(f'{d}_centernorm')
+        assert np.isclose(normalized.offset, abs(minimum), rtol=1e-12)
+        for c1, c2 in normalized.iter_maps():
+            assert np.allclose(normalized.current['data'],
+                               expected[d][c1, c2] + abs(minimum),
+                               rtol=1e-12, atol=1e-12)
+
+
+def test_add_to_collection(dataset, tmp_path):
+    first, second = copy_hic(dataset, ['sp1', 'sp2'], tmp_path)
+    run_script('norm_center.py', '-z', 1, first)
+    run_script('norm_center.py', '-z', 1, second, '-c', f'{first}_centernorm')
+    offsets = [HiC(f'{d}_centernorm').offset for d in (first, second)]
+
+    together = copy_hic(dataset, ['sp1', 'sp2'], tmp_path / 'together')
+    run_script('norm_center.py', '-z', 1, *together)
+    assert np.allclose(offsets, [HiC(f'{d}_centernorm').offset
+                                 for d in together], rtol=1e-12)
+
+
+def test_parse_size():
+    assert parse_size('1024') == 1024
+    assert parse_size('512M') == 512 * 1024**2
+    assert parse_size('16g') == 16 * 1024**3
+    assert parse_size(' 1.5KB ') == 1536
+
+
+def test_schedule_runs_every_job():
+    jobs = [(f'job{i}', 10 * i, pow, (2, i)) for i in range(6)]
+    # The largest job exceeds the budget: it still runs, but alone
+    results = dict(schedule(jobs, 3, max_memory=45))
+    assert results == {f'job{i}': 2**i for i in range(6)}
+
+
+def test_estimate_memory(dataset):
+    hicdata = HiC(dataset['datasets']['sp1']['hic'][dataset['resolutions'][0]])
+    largest = 0
+    for c1, c2 in hicdata.iter_maps():
+        largest = max(largest, hicdata.current['data'].size)
+    assert estimate_memory(hicdata, 1) - estimate_memory(hicdata, 0) == largest
+
+
+def test_estimate_memory_depends_on_binsize(dataset, tmp_path):
+    hicdir, = copy_hic(dataset, ['sp1'], tmp_path)
+    small = estimate_memory(HiC(hicdir))
+    with open(f'{hicdir}/metadata.json', 'r') as f:
+        metadata = json.load(f)
+    metadata['Binsize'] *= 1000
+    with open(f'{hicdir}/metadata.json', 'w') as f:
+        json.dump(metadata, f)
+    assert estimate_memory(HiC(hicdir)) > small
+
+
+def test_estimate_covers_measured_memory(dataset, tmp_path, caplog):
+    hicdir, = copy_hic(dataset, ['sp1'], tmp_path)
+    hicdata = HiC(hicdir)
+    estimate = estimate_memory(hicdata)
+    jobs = [('sp1', estimate, normalize, (hicdata, f'{hicdir}_out', 1))]
+    with caplog.at_level(logging.INFO):
+        list(schedule(jobs, 1))
+    message, = [r.getMessage() for r in caplog.records
+                if 'used by the job' in r.getMessage()]
+    used = int(message.split(', ')[1].split()[0])
+    assert 0 < used <= estimate
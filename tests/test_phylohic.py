@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+import copy
+import gzip
+
+from itertools import combinations
+
+import numpy as np
+
+from genes import read_bed_table
+from iolib import read_orthos, read_phylip
+from phylohic import dataset_pairs, run
+from conftest import run_script
+
+
+def test_dataset_pairs_match_make_pairs(dataset, pairs, tmp_path):
+    data = dataset['datasets']['sp1']
+    orthos, groups = read_orthos(dataset['orthologs'])
+    outfile = str(tmp_path / 'pairs' / 'sp1.tsv.gz')
+    (records, stats), = dataset_pairs(read_bed_table(data['genes']),
+                                      [data['hic'][dataset['resolutions'][0]]],
+                                      orthos, groups, [outfile])
+    with gzip.open(outfile, 'rt') as f1, gzip.open(pairs['sp1'], 'rt') as f2:
+        rows = [l.rstrip('\n').split('\t') for l in f1]
+        assert [l.rstrip('\n').split('\t') for l in f2] == rows
+    expected = {r[0] for r in rows if r[0] in orthos and r[1] in orthos}
+    assert {r[0] for r in records.values()} == expected
+    assert stats['10'] <= stats['50'] <= stats['90']
+
+
+def reference_thresholds(pairs, th):
+    """
+    The threshold *th* of the pairs files, as computed by pairsStats: the
+    mean of the percentiles of the non-zero values of each file.
+    """
+    if th == '00':
+        return 0.0
+    res = []
+    for name in pairs:
+        with gzip.open(name, 'rt') as f:
+            v = np.array([float(l.split('\t')[2]) for l in f])
+        res.append(np.quantile(v[v != 0.0], int(th) / 100,
+                               method='inverted_cdf'))
+    return float(np.mean(res))
+
+
+def test_run_matches_scripts(dataset, tmp_path):
+    config = copy.deepcopy(dataset)
+    config['rootdir'] = str(tmp_path / 'results')
+    config['method'] = ['union', 'intersection']
+    config['thresholds'] = ['00', '75']
+    config['adjacencies'] = ['all', 'xor']
+    # The Hi-C data of another species stand for a second resolution
+    res = config['resolutions'][0]
+    names = sorted(config['datasets'])
+    for d, other in zip(names, names[1:] + names[:1]):
+        config['datasets'][d]['hic']['other'] = \
+            dataset['datasets'][other]['hic'][res]
+    config['resolutions'] = [res, 'other']
+    written = run(config, jobs=2)
+    assert len(written) == 2 * 2 * 2 * 2
+
+    refdir = tmp_path / 'reference'
+    for r in config['resolutions']:
+        pairs = {}
+        (refdir / r).mkdir(parents=True)
+        for d, data in config['datasets'].items():
+            pairs[d] = refdir / r / f'{d}.tsv.gz'
+            run_script('make_pairs.py', '-N', data['genes'], data['hic'][r],
+                       pairs[d])
+        for th in config['thresholds']:
+            t = reference_thresholds(pairs.values(), th)
+            for adj in config['adjacencies']:
+                expdir = refdir / r / f'{th}_{adj}'
+                expdir.mkdir()
+                values = []
+                for d1, d2 in combinations(config['datasets'], 2):
+                    values.append(expdir / f'{d1}_{d2}_values.tsv.gz')
+                    run_script('join_pairs.py', '-t', t, '-a', adj,
+                               config['orthologs'], pairs[d1], pairs[d2],
+                               values[-1])
+                for method in config['method']:
+                    expected = expdir / f'{method}.phylip'
+                    run_script('dist_all_pairs.py', '-m', method,
+                               config['orthologs'], expected, *values)
+                    name = (f'{config["rootdir"]}/{r}/synthetic/threshold_'
+                            f'{th}_adj_{adj}/trees_{method}/distances.phylip')
+                    assert name in written
+                    (sp1, m1), = read_phylip(name)
+                    (sp2, m2), = read_phylip(expected)
+                    o1, o2 = np.argsort(sp1), np.argsort(sp2)
+                    assert sorted(sp1) == sorted(sp2) == names
+                    assert np.allclose(m1[np.ix_(o1, o1)], m2[np.ix_(o2, o2)],
+                                       rtol=1e-12, atol=0)
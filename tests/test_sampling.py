@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+import gzip
+import subprocess
+
+from itertools import combinations
+
+import numpy as np
+import pytest
+
+from genes import read_bed_table
+from iolib import read_orthos, read_phylip
+from sampling import (pair_hash, pair_uniform, sample_mask, sample_keys,
+                      Strata)
+from conftest import run_script
+
+
+def read_pairs(name):
+    with gzip.open(name, 'rt') as f:
+        return [l.rstrip('\n').split('\t') for l in f]
+
+
+def test_sample_keys():
+    rng = np.random.default_rng(0)
+    g1, g2 = rng.integers(0, 1000, (2, 20000))
+    assert np.array_equal(pair_hash(g1, g2, 3), pair_hash(g2, g1, 3))
+    assert not np.array_equal(pair_hash(g1, g2, 3), pair_hash(g1, g2, 4))
+    assert abs(np.mean(sample_mask(g1, g2, 0.25)) - 0.25) < 0.01
+
+    keys = sorted({f'{a}_{b}' for a, b in zip(g1.tolist(), g2.tolist())})
+    u = pair_uniform(*np.array([k.split('_') for k in keys], dtype=int).T)
+    selected = sample_keys(keys, size=500)
+    assert len(selected) == 500
+    assert set(selected) == {keys[i] for i in np.argsort(u)[:500]}
+    assert sample_keys(keys, fraction=0.1) ==\
+        [k for k, x in zip(keys, u) if x < 0.1]
+
+
+def test_sampled_pairs(dataset, pairs, tmp_path):
+    orthos, groups = read_orthos(dataset['orthologs'])
+    res = dataset['resolutions'][0]
+    sampled = {}
+    (tmp_path / 'sampled').mkdir()
+    for d in ('sp1', 'sp2'):
+        data = dataset['datasets'][d]
+        sampled[d] = tmp_path / 'sampled' / f'{d}.tsv.gz'
+        run_script('make_pairs.py', '-N', '--sample-fraction', 0.3,
+                   '--sample-seed', 7, '--orthologs', dataset['orthologs'],
+                   data['genes'], data['hic'][res], sampled[d])
+
+        rows = [r for r in read_pairs(pairs[d])
+                if r[0] in groups and r[1] in groups]
+        keep = sample_mask([groups[r[0]] for r in rows],
+                           [groups[r[1]] for r in rows], 0.3, 7)
+        assert read_pairs(sampled[d]) ==\
+            [r for r, k in zip(rows, keep.tolist()) if k]
+
+    # Joining the sampled pairs gives the sampled distances
+    (tmp_path / 'full').mkdir()
+    names = {}
+    for kind, files in (('sampled', sampled), ('full', pairs)):
+        names[kind] = tmp_path / kind / 'sp1_sp2_values.tsv.gz'
+        run_script('join_pairs.py', dataset['orthologs'], files['sp1'],
+                   files['sp2'], names[kind])
+    run_script('dist_all_pairs.py', dataset['orthologs'],
+               tmp_path / 'sampled.phylip', names['sampled'])
+    run_script('dist_all_pairs.py', '--sample-fraction', 0.3, '--sample-seed',
+               7, dataset['orthologs'], tmp_path / 'full.phylip', names['full'])
+    (sp1, m1), = read_phylip(tmp_path / 'sampled.phylip')
+    (sp2, m2), = read_phylip(tmp_path / 'full.phylip')
+    assert sorted(sp1) == sorted(sp2)
+    o1, o2 = np.argsort(sp1), np.argsort(sp2)
+    assert np.array_equal(m1[np.ix_(o1, o1)], m2[np.ix_(o2, o2)])
+
+
+def test_strata(dataset):
+    _, groups = read_orthos(dataset['orthologs'])
+    genes = read_bed_table(dataset['datasets']['sp1']['genes'])
+    strata = Strata(genes, groups, (50000, 500000))
+    assert strata.names == ['0-50000', '50000-500000', '500000-', 'inter',
+                            'unplaced']
+
+    # The sizes are the ones of the enumerated pairs of groups
+    ids = sorted(set(groups.values()))
+    g1, g2 = np.array(list(combinations(ids, 2))).T
+    labels = strata.labels(g1, g2)
+    assert np.array_equal(strata.sizes(),
+                          np.bincount(labels, minlength=len(strata.names)))
+    sp1 = {groups[n] for n in genes.names if n in groups}
+    intra = [genes.chrom[genes.index[a]] == genes.chrom[genes.index[b]]
+             for a, b in combinations(genes.names, 2)
+             if a in groups and b in groups]
+    assert np.count_nonzero(labels == 3) == intra.count(False)
+    assert np.count_nonzero(labels == 4) ==\
+        len(ids) * (len(ids) - 1) // 2 - len(sp1) * (len(sp1) - 1) // 2
+
+    # About the same number of pairs in each stratum
+    fractions = strata.fractions(size=400, overrides=[('inter', 0.5)])
+    assert fractions['inter'] == 0.5
+    mask = sample_mask(g1, g2, fractions, 3, strata)
+    u = pair_uniform(g1, g2, 3)
+    assert np.array_equal(mask, u < np.array([fractions[n] for n in
+                                              strata.names])[labels])
+    for k, name in enumerate(strata.names):
+        if name != 'inter' and strata.sizes()[k] > 400:
+            assert abs(np.count_nonzero(mask & (labels == k)) - 80) < 30
+
+    keys = [f'{a}_{b}' for a, b in zip(g1.tolist(), g2.tolist())]
+    assert sample_keys(keys, fractions, seed=3, strata=strata) ==\
+        [k for k, m in zip(keys, mask.tolist()) if m]
+
+
+def test_stratified_pairs(dataset, pairs, tmp_path):
+    orthos, groups = read_orthos(dataset['orthologs'])
+    reference = dataset['datasets']['sp3']['genes']
+    strata = Strata(read_bed_table(reference), groups)
+    options = ['--sample-fraction', 0.2, '--sample-seed', 5,
+               '--strata-genes', reference, '--stratum-fraction', 'inter',
+               0.05, '--stratum-fraction', '0-100000', 1]
+    fractions = strata.fractions(0.2, overrides=[('inter', 0.05),
+                                                 ('0-100000', 1)])
+    res = dataset['resolutions'][0]
+    sampled = {}
+    (tmp_path / 'sampled').mkdir()
+    for d in ('sp1', 'sp2'):
+        data = dataset['datasets'][d]
+        sampled[d] = tmp_path / 'sampled' / f'{d}.tsv.gz'
+        run_script('make_pairs.py', '-N', *options, '--orthologs',
+                   dataset['orthologs'], data['genes'], data['hic'][res],
+                   sampled[d])
+
+        rows = [r for r in read_pairs(pairs[d])
+                if r[0] in groups and r[1] in groups]
+        keep = sample_mask([groups[r[0]] for r in rows],
+                           [groups[r[1]] for r in rows], fractions, 5, strata)
+        assert read_pairs(sampled[d]) ==\
+            [r for r, k in zip(rows, keep.tolist()) if k]
+
+    # The distance scripts sample the same pairs
+    (tmp_path / 'full').mkdir()
+    names = {}
+    for kind, files in (('sampled', sampled), ('full', pairs)):
+        names[kind] = tmp_path / kind / 'sp1_sp2_values.tsv.gz'
+        run_script('join_pairs.py', dataset['orthologs'], files['sp1'],
+                   files['sp2'], names[kind])
+    run_script('dist_all_pairs.py', dataset['orthologs'],
+               tmp_path / 'sampled.phylip', names['sampled'])
+    run_script('dist_all_pairs.py', *options, dataset['orthologs'],
+               tmp_path / 'full.phylip', names['full'])
+    (sp1, m1), = read_phylip(tmp_path / 'sampled.phylip')
+    (sp2, m2), = read_phylip(tmp_path / 'full.phylip')
+    o1, o2 = np.argsort(sp1), np.argsort(sp2)
+    assert np.array_equal(m1[np.ix_(o1, o1)], m2[np.ix_(o2, o2)])
+
+
+def test_strata_need_sample(dataset, tmp_path):
+    data = dataset['datasets']['sp1']
+    with pytest.raises(subprocess.CalledProcessError):
+        run_script('make_pairs.py', '--strata-genes', data['genes'],
+                   '--orthologs', dataset['orthologs'], data['genes'],
+                   data['hic'][dataset['resolutions'][0]],
+                   tmp_path / 'pairs.tsv.gz')
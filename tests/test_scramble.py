@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+
+import gzip
+import json
+
+import numpy as np
+
+from hic import HiC
+from conftest import run_script
+
+
+def test_replicates_match_make_pairs(dataset, tmp_path):
+    data = dataset['datasets']['sp1']
+    hicdir = data['hic'][dataset['resolutions'][0]]
+    outdir = tmp_path / 'replicates'
+    run_script('scramble_hic.py', '--seed', 5, hicdir, outdir, 2)
+
+    seeds = []
+    for i in range(2):
+        repdir = str(outdir / f'replicate_{i}')
+        with open(f'{repdir}/metadata.json') as f:
+            seeds.append(json.load(f)['Seed'])
+        replicate, original = HiC(repdir), HiC(hicdir)
+        for c1, c2 in replicate.iter_maps():
+            original.load_map(c1, c2, scramble=True, seed=seeds[-1])
+            assert np.array_equal(replicate.current['data'],
+                                  original.current['data'], equal_nan=True)
+    assert seeds[0] != seeds[1]
+
+    run_script('make_pairs.py', '-N', data['genes'], outdir / 'replicate_1',
+               tmp_path / 'replicate.tsv.gz')
+    run_script('make_pairs.py', '-N', '--scramble', '--seed', seeds[1],
+               data['genes'], hicdir, tmp_path / 'scrambled.tsv.gz')
+    with gzip.open(tmp_path / 'replicate.tsv.gz', 'rt') as f1,\
+         gzip.open(tmp_path / 'scrambled.tsv.gz', 'rt') as f2:
+        assert f1.read() == f2.read()
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+import gzip
+import os
+
+from iolib import read_manifest, manifest_shards
+from conftest import run_script
+
+
+def read_lines(names):
+    lines = []
+    for name in names:
+        with gzip.open(name, 'rt') as f:
+            lines.extend(f)
+    return lines
+
+
+def test_shards_match_pairs_file(dataset, pairs, tmp_path):
+    data = dataset['datasets']['sp1']
+    hicdir = data['hic'][dataset['resolutions'][0]]
+    outdir = tmp_path / 'shards'
+    run_script('make_pairs.py', '-N', '-S', data['genes'], hicdir, outdir)
+    assert read_lines(manifest_shards(outdir)) == read_lines([pairs['sp1']])
+
+
+def test_resume_with_other_options(dataset, tmp_path):
+    data = dataset['datasets']['sp1']
+    hicdir = data['hic'][dataset['resolutions'][0]]
+    outdir = tmp_path / 'shards'
+    run_script('make_pairs.py', '-N', '-S', data['genes'], hicdir, outdir)
+    manifest = read_manifest(outdir)
+    assert manifest['Options']['Intra'] is False
+    assert len(manifest['Shards']) == 3
+
+    # The same run again: the shards are kept
+    stamps = {f: os.stat(f).st_mtime_ns for f in manifest_shards(outdir)}
+    run_script('make_pairs.py', '-N', '-S', data['genes'], hicdir, outdir)
+    assert read_manifest(outdir) == manifest
+    assert stamps == {f: os.stat(f).st_mtime_ns
+                      for f in manifest_shards(outdir)}
+
+    # With --intra, the inter-chromosomal shard shall not be kept
+    run_script('make_pairs.py', '-N', '-S', '--intra', data['genes'], hicdir,
+               outdir)
+    manifest = read_manifest(outdir)
+    assert manifest['Options']['Intra'] is True
+    assert [s['Key'] for s in manifest['Shards']] == ['chr1|chr1', 'chr2|chr2']
+
+    pairs = tmp_path / 'pairs.tsv.gz'
+    run_script('make_pairs.py', '-N', '--intra', data['genes'], hicdir, pairs)
+    assert read_lines(manifest_shards(outdir)) == read_lines([pairs])
+
+
+def test_join_shards(dataset, pairs, values, tmp_path):
+    shards = {}
+    for d in ('sp1', 'sp2'):
+        data = dataset['datasets'][d]
+        shards[d] = tmp_path / d
+        run_script('make_pairs.py', '-N', '-S', data['genes'],
+                   data['hic'][dataset['resolutions'][0]], shards[d])
+    # Read side by side, the shards give the rows of the pairs files
+    outfile = tmp_path / 'values.tsv.gz'
+    run_script('join_pairs.py', dataset['orthologs'], shards['sp1'],
+               shards['sp2'], outfile)
+    assert read_lines([outfile]) == read_lines([values[0]])
+
+    # Joined in parallel, the rows are written by partitions
+    outfile = tmp_path / 'parallel.tsv.gz'
+    run_script('join_pairs.py', '-j', 2, dataset['orthologs'], shards['sp1'],
+               shards['sp2'], outfile)
+    assert sorted(read_lines([outfile])) == sorted(read_lines([values[0]]))
+    assert not [n for n in os.listdir(tmp_path) if n.startswith('tmp')]
+
+    # A manifest can be joined with a pairs file
+    outfile = tmp_path / 'mixed.tsv.gz'
+    run_script('join_pairs.py', '-j', 3, dataset['orthologs'], shards['sp1'],
+               pairs['sp2'], outfile)
+    assert sorted(read_lines([outfile])) == sorted(read_lines([values[0]]))
+
+
+def test_join_shards_with_threshold(dataset, pairs, tmp_path):
+    shards = {}
+    for d in ('sp1', 'sp2'):
+        data = dataset['datasets'][d]
+        shards[d] = tmp_path / d
+        run_script('make_pairs.py', '-N', '-S', data['genes'],
+                   data['hic'][dataset['resolutions'][0]], shards[d])
+    options = ['-t', 5, '-x', '-a', 'or']
+    files = {}
+    for name, left, jobs in (('pairs', pairs['sp1'], 1),
+                             ('shards', shards['sp1'], 2)):
+        files[name] = tmp_path / f'{name}.tsv.gz'
+        run_script('join_pairs.py', '-j', jobs, *options,
+                   dataset['orthologs'], left, shards['sp2'], files[name])
+    expected = read_lines([files['pairs']])
+    assert sorted(read_lines([files['shards']])) == sorted(expected)
+    # No row is under the threshold on both sides, even in the last ones
+    rows = [l.rstrip('\n').split('\t') for l in expected]
+    assert rows and all(float(r[4]) > 5 or float(r[5]) > 5 for r in rows)
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+import gzip
+import json
+import subprocess
+import os
+
+from itertools import combinations
+
+import numpy as np
+import pytest
+
+from iolib import read_phylip, stats_name
+from conftest import run_script
+
+
+def read_sorted(name):
+    (species, m), = read_phylip(name)
+    order = np.argsort(species)
+    return sorted(species), m[np.ix_(order, order)]
+
+
+def dist(dataset, outfile, values, *options):
+    run_script('dist_all_pairs.py', '-m', 'union', *options,
+               dataset['orthologs'], outfile, *values)
+    return read_sorted(outfile)
+
+
+def join(dataset, pairs, outdir, *options):
+    """
+    Join the pairs of all the pairs of species with *options* and their
+    sidecars, in *outdir*. Return the list of the values files.
+    """
+    os.makedirs(outdir, exist_ok=True)
+    files = []
+    for d1, d2 in combinations(sorted(dataset['datasets']), 2):
+        files.append(f'{outdir}/{d1}_{d2}_values.tsv.gz')
+        run_script('join_pairs.py', '--stats', *options, dataset['orthologs'],
+                   pairs[d1], pairs[d2], files[-1])
+    return files
+
+
+def read_counters(name):
+    with open(name) as f:
+        return json.load(f)['counters']
+
+
+def test_stats_match_values(dataset, pairs, tmp_path):
+    files = join(dataset, pairs, tmp_path / 'all')
+    assert all(os.path.exists(stats_name(v)) for v in files)
+    with open(stats_name(files[0])) as f:
+        assert json.load(f)['Join'] == {'Threshold': None,
+                                        'Adjacencies': 'all',
+                                        'Exclude': False}
+
+    sp, expected = dist(dataset, tmp_path / 'full.phylip', files)
+    sp_stats, m = dist(dataset, tmp_path / 'stats.phylip', files,
+                       '--stats', '--metrics', tmp_path / 'stats.json')
+    assert sp_stats == sp
+    assert np.allclose(m, expected, rtol=1e-12, atol=0)
+    counters = read_counters(tmp_path / 'stats.json')
+    assert counters['sidecars_read'] == len(files)
+    assert 'values_files' not in counters
+
+
+def test_outdated_stats_fall_back(dataset, pairs, tmp_path):
+    files = join(dataset, pairs, tmp_path / 'all')
+    with gzip.open(files[0], 'rt') as f:
+        lines = f.readlines()
+    with gzip.open(files[0], 'wt') as f:
+        f.writelines(lines[::2])
+
+    _, expected = dist(dataset, tmp_path / 'full.phylip', files)
+    _, m = dist(dataset, tmp_path / 'stats.phylip', files, '--stats',
+                '--metrics', tmp_path / 'stats.json')
+    assert np.array_equal(m, expected)
+    counters = read_counters(tmp_path / 'stats.json')
+    assert counters['sidecars_rejected'] == 1
+    assert counters['values_files'] == len(files)
+
+    # A missing sidecar is the same
+    os.remove(stats_name(files[0]))
+    _, m = dist(dataset, tmp_path / 'stats.phylip', files, '--stats')
+    assert np.array_equal(m, expected)
+
+
+def test_incompatible_join_falls_back(dataset, pairs, tmp_path):
+    # With some of the adjacencies, the values of a pair of genes are kept
+    # in some values files only: the sidecars would give other distances.
+    files = join(dataset, pairs, tmp_path / 'xor', '-a', 'xor')
+    _, expected = dist(dataset, tmp_path / 'full.phylip', files)
+    _, m = dist(dataset, tmp_path / 'stats.phylip', files, '--stats',
+                '--metrics', tmp_path / 'stats.json')
+    assert np.array_equal(m, expected)
+    assert read_counters(tmp_path / 'stats.json')['sidecars_rejected'] == 1
+
+    # So are values files joined with different thresholds
+    files = join(dataset, pairs, tmp_path / 'mixed')
+    sp1, sp2 = sorted(dataset['datasets'])[:2]
+    run_script('join_pairs.py', '--stats', '-t', '0.5', dataset['orthologs'],
+               pairs[sp1], pairs[sp2], files[0])
+    _, expected = dist(dataset, tmp_path / 'full.phylip', files)
+    _, m = dist(dataset, tmp_path / 'stats.phylip', files, '--stats',
+                '--metrics', tmp_path / 'stats.json')
+    assert np.array_equal(m, expected)
+    assert read_counters(tmp_path / 'stats.json')['sidecars_rejected'] == 1
+
+
+def test_stats_need_values_name(dataset, pairs, tmp_path):
+    sp1, sp2 = sorted(dataset['datasets'])[:2]
+    with pytest.raises(subprocess.CalledProcessError):
+        run_script('join_pairs.py', '--stats', dataset['orthologs'],
+                   pairs[sp1], pairs[sp2], tmp_path / 'joined.tsv.gz')
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+import json
+import subprocess
+
+import numpy as np
+import pytest
+
+from hic import HiC
+from statslib import QuantileSketch
+from statshic import PERCENTILES
+from conftest import run_script
+
+
+def test_sketch_percentiles():
+    rng = np.random.default_rng(0)
+    data = np.concatenate([rng.lognormal(3.0, 2.0, 50000),
+                           -rng.lognormal(0.0, 1.0, 5000),
+                           np.zeros(10000)])
+    accuracy = 0.01
+    sketch = QuantileSketch(accuracy)
+    for chunk in np.array_split(rng.permutation(data), 13):
+        sketch.update(chunk)
+    assert sketch.count == data.size
+
+    # The relative error is at most the accuracy, up to the rounding
+    rtol = accuracy * (1 + 1e-9)
+    q = [0, 1, 5, 10, 25, 50, 75, 90, 99, 100]
+    # The sketch estimates the lower of the values around each percentile
+    expected = np.percentile(data, q, method='lower')
+    assert np.allclose(sketch.percentiles(q), expected, rtol=rtol, atol=0)
+
+    left, right = QuantileSketch(accuracy), QuantileSketch(accuracy)
+    left.update(data[:20000])
+    right.update(data[20000:])
+    left.merge(right)
+    assert left.percentiles(q) == sketch.percentiles(q)
+
+    with pytest.raises(ValueError):
+        left.merge(QuantileSketch(0.1))
+
+
+@pytest.mark.parametrize('accuracy', [0, 1, -0.5, 2])
+def test_invalid_accuracy(accuracy):
+    with pytest.raises(ValueError):
+        QuantileSketch(accuracy)
+
+
+def test_invalid_accuracy_option(dataset):
+    hicdir = dataset['datasets']['sp1']['hic'][dataset['resolutions'][0]]
+    with pytest.raises(subprocess.CalledProcessError):
+        run_script('statshic.py', '-w', '-a', 1, hicdir)
+
+
+def test_whole_dataset(dataset, tmp_path):
+    hicdir = dataset['datasets']['sp1']['hic'][dataset['resolutions'][0]]
+    outfile = tmp_path / 'stats.json'
+    run_script('statshic.py', '-w', '-a', 0.001, '-o', outfile, hicdir)
+    with open(outfile) as f:
+        stats = json.load(f)['all']
+
+    hicdata = HiC(hicdir)
+    hicdata.load_all_maps()
+    data = hicdata.current['data']
+    assert stats['size'] == data.size
+    assert np.isclose(stats['mean'], np.mean(data), rtol=1e-12)
+    assert np.isclose(stats['stddev'], np.std(data), rtol=1e-12)
+    names = ['p10', 'p25', 'median', 'p75', 'p90']
+    assert np.allclose([stats[n] for n in names],
+                       np.percentile(data, PERCENTILES, method='lower'),
+                       rtol=0.001 * (1 + 1e-9), atol=0)
+
+
+def test_parallel_matches_serial(dataset, tmp_path):
+    res = dataset['resolutions'][0]
+    dirs = [dataset['datasets'][sp]['hic'][res] for sp in ('sp1', 'sp2')]
+    run_script('statshic.py', '-w', '-j', 3, '-o', tmp_path / 'all.json',
+               *dirs)
+    with open(tmp_path / 'all.json') as f:
+        stats = json.load(f)
+    assert sorted(stats) == sorted(dirs)
+    for i, hicdir in enumerate(dirs):
+        run_script('statshic.py', '-w', '-o', tmp_path / f'{i}.json', hicdir)
+        with open(tmp_path / f'{i}.json') as f:
+            assert stats[hicdir] == json.load(f)
+
+
+def test_parallel_metrics(dataset, tmp_path):
+    hicdir = dataset['datasets']['sp1']['hic'][dataset['resolutions'][0]]
+    nmaps = len(HiC(hicdir)._mapfiles)
+    measures = {}
+    for jobs in (1, 3):
+        outfile = tmp_path / f'{jobs}.json'
+        run_script('statshic.py', '-w', '-j', jobs, '--metrics', outfile,
+                   '-o', tmp_path / 'stats.json', hicdir)
+        with open(outfile) as f:
+            measures[jobs] = json.load(f)
+    # The measures of the workers are merged, and not counted twice
+    for m in measures.values():
+        assert m['stages']['load_map']['calls'] == nmaps
+        assert m['stages']['map_summary']['calls'] == nmaps
+        assert m['counters']['maps_summarized'] == nmaps
+        assert m['counters']['maps_loaded'] == nmaps
+    assert measures[1]['counters'] == measures[3]['counters']
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from hic import HiC
+from statslib import Moments
+from norm_center import dataset_moments
+
+
+def test_moments_by_chunks():
+    rng = np.random.default_rng(0)
+    data = rng.lognormal(3.0, 2.0, 100000)
+    moments = Moments()
+    for chunk in np.array_split(data, 37):
+        moments.update(chunk.reshape(-1, 1))
+    assert moments.count == len(data)
+    assert np.isclose(moments.mean, np.mean(data), rtol=1e-12)
+    assert np.isclose(moments.stddev, np.std(data), rtol=1e-12)
+    assert moments.minimum == data.min() and moments.maximum == data.max()
+
+    left, right = Moments(), Moments()
+    left.update(data[:1000])
+    right.update(data[1000:])
+    left.merge(right)
+    assert np.isclose(left.mean, moments.mean, rtol=1e-12)
+    assert np.isclose(left.variance, moments.variance, rtol=1e-12)
+
+
+def test_dataset_moments_match_all_maps(dataset):
+    hicdir = dataset['datasets']['sp1']['hic'][dataset['resolutions'][0]]
+    moments = dataset_moments(HiC(hicdir))
+    hicdata = HiC(hicdir)
+    hicdata.load_all_maps()
+    assert moments.count == hicdata.current['data'].size
+    assert np.isclose(moments.mean, np.mean(hicdata.current['data']),
+                      rtol=1e-12)
+    assert np.isclose(moments.stddev, np.std(hicdata.current['data']),
+                      rtol=1e-12)
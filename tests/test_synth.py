@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import numpy as np
+
+import synth
+from hic import HiC
+
+
+def read_tree(root):
+    """The contents of the files under *root*, keyed by relative path."""
+    res = {}
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            with open(path, 'rb') as f:
+                res[os.path.relpath(path, root)] = f.read()
+    return res
+
+
+def test_same_seed_same_dataset(tmp_path):
+    options = dict(species=3, chromosomes=2, bins=200, genes=40,
+                   max_diagonal=30, inter=True, seed=4)
+    synth.generate(str(tmp_path / 'a'), **options)
+    synth.generate(str(tmp_path / 'b'), **options)
+    a, b = read_tree(tmp_path / 'a'), read_tree(tmp_path / 'b')
+    # The configurations hold absolute paths
+    del a['config.yaml'], b['config.yaml']
+    assert a == b
+
+    options['seed'] = 5
+    synth.generate(str(tmp_path / 'c'), **options)
+    c = read_tree(tmp_path / 'c')
+    del c['config.yaml']
+    assert c.keys() == a.keys() and c != a
+
+
+def test_decay_maps(dataset):
+    hicdata = HiC(dataset['datasets']['sp4']['hic'][dataset['resolutions'][0]])
+    for c1, c2 in hicdata.iter_maps():
+        m = hicdata.current['data']
+        if c1 != c2:
+            continue
+        assert np.array_equal(m, m.T)
+        # No contact farther than max_diagonal (100) from the diagonal
+        assert not np.any(np.triu(m, 101))
+        near, far = np.mean(np.diag(m)), np.mean(np.diag(m, 50))
+        assert near > far
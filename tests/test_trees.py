@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+from trees import Tree, neighbor_joining, bme_nni, build_trees
+
+
+def path_lengths(tree):
+    """The sum of the branch lengths between each pair of leaves."""
+    n = len(tree.names)
+    res = np.zeros((n, n))
+    for i in range(n):
+        seen = {i: 0.0}
+        stack = [i]
+        while stack:
+            u = stack.pop()
+            for v, length in tree.edges[u].items():
+                if v not in seen:
+                    seen[v] = seen[u] + length
+                    stack.append(v)
+        res[i] = [seen[j] for j in range(n)]
+    return res
+
+
+def random_tree(n, rng):
+    """A random unrooted binary tree on n leaves, with random lengths."""
+    edges = {0: {1: 1.0}, 1: {0: 1.0}}
+    new = n
+    for leaf in range(2, n):
+        # Graft the leaf in the middle of a random edge
+        u = rng.choice(sorted(edges))
+        v = rng.choice(sorted(edges[u]))
+        del edges[u][v], edges[v][u]
+        edges[new], edges[leaf] = {}, {}
+        for x in (u, v, leaf):
+            edges[new][x] = edges[x][new] = 1.0
+        new += 1
+    for u in edges:
+        for v in edges[u]:
+            if u < v:
+                edges[u][v] = edges[v][u] = float(rng.uniform(0.1, 2.0))
+    return Tree([f'sp{i}' for i in range(n)], edges)
+
+
+@pytest.mark.parametrize('n', [4, 7, 12])
+def test_additive_distances(n):
+    rng = np.random.default_rng(n)
+    dist = path_lengths(random_tree(n, rng))
+    tree = neighbor_joining(dist, [f'sp{i}' for i in range(n)])
+    assert np.allclose(path_lengths(tree), dist)
+    # The NJ tree of an additive matrix is already the best one
+    assert bme_nni(tree, dist) == 0
+    assert np.allclose(path_lengths(tree), dist)
+
+
+def test_bme_nni():
+    rng = np.random.default_rng(0)
+    n = 10
+    names = [f'sp{i}' for i in range(n)]
+    dist = path_lengths(random_tree(n, rng))
+    noise = rng.normal(0.0, 0.5, (n, n))
+    dist = np.abs(dist + noise + noise.T)
+    np.fill_diagonal(dist, 0.0)
+
+    tree = neighbor_joining(dist, names)
+    before = tree.bme_length(dist)
+    bme_nni(tree, dist)
+    assert tree.bme_length(dist) <= before + 1e-12
+    # With the BME branch lengths, the tree length is the Pauplin length
+    total = sum(l for u in tree.edges for v, l in tree.edges[u].items()
+                if u < v)
+    assert np.isclose(total, tree.bme_length(dist))
+
+    matrices = [dist, dist * 2, path_lengths(random_tree(n, rng))]
+    assert build_trees(matrices, names, jobs=2) ==\
+        build_trees(matrices, names)